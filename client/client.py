@@ -18,8 +18,52 @@ import ssl
 # this module is for parsing the configuration files in config.ini file in config folder
 import configparser
 
+# for cutting a query stream into chunks, and for the IDs of the multiplexed requests
+from itertools import count, islice
+
+# the result sizes of the chunks of a query stream in flight
+from collections import deque
+
+# the reader thread of a multiplexed connection
+import threading
+
+# the results of the multiplexed requests
+from concurrent.futures import Future
+
 # typing module for static typing related functionality
-from typing import Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# length-prefixed framing shared with the server
+from protocol import (
+    QUERY,
+    BATCH,
+    STREAM,
+    FUZZY,
+    COUNT,
+    POSITIONS,
+    LAST_CHUNK,
+    TRUNCATED,
+    MORE,
+    NAMED_CORPUS,
+    DEFAULT_CHUNK_QUERIES,
+    DEFAULT_WINDOW,
+    HEADER,
+    MAX_UNREAD_RESULT_BYTES,
+    RESPONSE,
+    ERROR,
+    FOUND_RESPONSE,
+    Frame,
+    FrameError,
+    encode_frame,
+    encode_batch,
+    decode_batch_results,
+    decode_fuzzy_matches,
+    encode_positions_request,
+    decode_positions,
+    encode_corpus_name,
+    read_frame,
+    MAX_REQUEST_ID
+)
 
 # server connection address or Internet Protocol address of the server
 SERVER_ADDRESS: str = 'localhost'
@@ -38,6 +82,9 @@ PORT_NUMBER: int = configuration_file['DEFAULT'].getint('PORT_NUMBER')
 # This string is present in the 200k.text
 QUERY_STRING: str = '13;0;23;11;0;16;5;000;'
 
+# path of the unix domain socket of a server on the same host, empty to connect over TCP
+UNIX_SOCKET_PATH: str = configuration_file['DEFAULT'].get('UNIX_SOCKET_PATH', fallback='')
+
 # Self Signed Certificate that will be used to verify with the server certificate
 CLIENT_SELF_SIGNED_CERT = os.path.join(f'{os.getcwd()}/client/cert', 'combined.pem')
 
@@ -78,7 +125,37 @@ def create_ssl_connection_context() -> Optional[ssl.SSLContext]:
     return ssl_context
 
 
-def client_config(server_addr: str, server_port: int, query_string: str, use_ssl: bool = False):
+def open_connection(server_addr: str, server_port: int, use_ssl: bool = False,
+                    unix_path: Optional[str] = None) -> socket.socket:
+    """
+    Open a connection to the server for the framed helpers, over the unix domain socket
+    of the server when unix_path is given, otherwise over TCP with or without SSL.
+
+    Args:
+        server_addr (str): The server's address.
+        server_port (int): The port number to connect to.
+        use_ssl (bool): Whether to use SSL for the TCP connection. Default is False.
+        unix_path (Optional[str]): Path of the unix domain socket of a server on the same host.
+
+    Returns:
+        socket.socket: The connected socket.
+    """
+    if unix_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(unix_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    sock = socket.create_connection((server_addr, server_port))
+    if use_ssl:
+        return create_ssl_connection_context().wrap_socket(sock, server_hostname=server_addr)
+    return sock
+
+
+def client_config(server_addr: str, server_port: int, query_string: str, use_ssl: bool = False,
+                  unix_path: Optional[str] = None):
     """
     This function is responsible for sending a query_string to the server.
     The server will search for the specified query string in its data directory
@@ -90,6 +167,8 @@ def client_config(server_addr: str, server_port: int, query_string: str, use_ssl
         server_port (int): The port number to connect to.
         query_string (str): The query string to send.
         use_ssl (bool): Whether to use SSL for the connection. Default is False.
+        unix_path (Optional[str]): Path of the unix domain socket of a server on the same host,
+        the connection then skips TCP and SSL. Default is None.
 
     Returns:
         None. Prints the response from the server.
@@ -98,6 +177,12 @@ def client_config(server_addr: str, server_port: int, query_string: str, use_ssl
         Exception: If there is an error sending the query.
     """
     try:
+        # local clients connect through the unix domain socket, its file mode replaces SSL
+        if unix_path:
+            with open_connection(server_addr, server_port, unix_path=unix_path) as sock:
+                sock.sendall(query_string.encode('utf-8'))
+                print(sock.recv(1024).decode('utf-8'))
+            return
         # creating a socket connection to connect to the server
         with socket.create_connection((server_addr, server_port)) as sock:
             if use_ssl:
@@ -123,12 +208,341 @@ def client_config(server_addr: str, server_port: int, query_string: str, use_ssl
         print(f"Error:Failed to create SSL context: {e}")
 
 
+def framed_request(sock: socket.socket, kind: int, payload: bytes, flags: int = 0) -> Frame:
+    """
+    Send one request frame on a framed connection and wait for its response.
+
+    Args:
+        sock (socket.socket): The connection to the server, plain or SSL.
+        kind (int): The type of the request frame (QUERY, BATCH, FUZZY, COUNT or POSITIONS).
+        payload (bytes): The payload of the request frame.
+        flags (int): The flags of the request frame.
+
+    Returns:
+        Frame: The response frame.
+
+    Raises:
+        FrameError: If the server answered with an error frame or an unexpected frame.
+    """
+    sock.sendall(encode_frame(kind, payload, flags))
+    response = read_frame(sock)
+    if response.kind == ERROR:
+        raise FrameError(f'server error: {str(response.payload, "utf-8")}')
+    if response.kind != kind | RESPONSE:
+        raise FrameError(f'unexpected response frame type {response.kind:#x}')
+    return response
+
+
+def named(payload: bytes, corpus: Optional[str]) -> Tuple[bytes, int]:
+    """
+    Name the corpus of a QUERY, BATCH or STREAM request.
+
+    Args:
+        payload (bytes): The payload of the request.
+        corpus (Optional[str]): The name of the corpus, None for the main corpus.
+
+    Returns:
+        Tuple[bytes, int]: The payload and the flags of the request.
+    """
+    if corpus is None:
+        return payload, 0
+    return encode_corpus_name(corpus, payload), NAMED_CORPUS
+
+
+def framed_query(sock: socket.socket, query_string: str, corpus: Optional[str] = None) -> bool:
+    """
+    Search for a single query on a framed connection. Unlike the legacy format
+    the query is not limited in size and the connection can be reused.
+
+    Args:
+        sock (socket.socket): The connection to the server, plain or SSL.
+        query_string (str): The query string to search for.
+        corpus (Optional[str]): The named corpus searched, None for the main corpus.
+
+    Returns:
+        bool: True if the string exists, False otherwise.
+    """
+    response = framed_request(sock, QUERY, *named(query_string.encode('utf-8'), corpus))
+    return bytes(response.payload) == FOUND_RESPONSE
+
+
+def framed_batch(sock: socket.socket, queries: List[str],
+                 corpus: Optional[str] = None) -> List[bool]:
+    """
+    Search for many queries with a single BATCH frame on a framed connection.
+
+    Args:
+        sock (socket.socket): The connection to the server, plain or SSL.
+        queries (List[str]): The queries, they must not contain new line characters.
+        corpus (Optional[str]): The named corpus searched, None for the main corpus.
+
+    Returns:
+        List[bool]: True for every query that exists, in the order of the queries.
+    """
+    response = framed_request(sock, BATCH, *named(encode_batch(queries), corpus))
+    return decode_batch_results(response.payload)
+
+
+def framed_fuzzy(sock: socket.socket, query_string: str,
+                 max_distance: int = 0) -> Tuple[List[Tuple[int, str]], bool]:
+    """
+    Find the corpus lines closest to the query on a framed connection.
+
+    Args:
+        sock (socket.socket): The connection to the server, plain or SSL.
+        query_string (str): The query string.
+        max_distance (int): The maximum edit distance, 0 for the default of the server.
+
+    Returns:
+        Tuple[List[Tuple[int, str]], bool]: The (distance, line) pairs closest first, and
+        True if the server ran out of time and the matches may be incomplete.
+    """
+    response = framed_request(sock, FUZZY, query_string.encode('utf-8'), max_distance)
+    return decode_fuzzy_matches(response.payload), bool(response.flags & TRUNCATED)
+
+
+def framed_count(sock: socket.socket, query_string: str) -> int:
+    """
+    Count the corpus lines equal to the query on a framed connection.
+
+    Args:
+        sock (socket.socket): The connection to the server, plain or SSL.
+        query_string (str): The query string.
+
+    Returns:
+        int: The number of occurrences of the query, 0 if it does not exist.
+    """
+    return int(bytes(framed_request(sock, COUNT, query_string.encode('utf-8')).payload))
+
+
+def framed_positions(sock: socket.socket, query_string: str, offset: int = 0,
+                     limit: int = 0) -> Tuple[int, List[int], bool]:
+    """
+    Get a page of the line numbers of the query on a framed connection.
+
+    Args:
+        sock (socket.socket): The connection to the server, plain or SSL.
+        query_string (str): The query string.
+        offset (int): The number of line numbers to skip.
+        limit (int): The maximum number of line numbers, 0 for the page size of the server.
+
+    Returns:
+        Tuple[int, List[int], bool]: The number of occurrences, the 1-based line numbers of
+        the page in increasing order, and True if more line numbers follow the page.
+    """
+    response = framed_request(sock, POSITIONS,
+                              encode_positions_request(query_string, offset, limit))
+    count, positions = decode_positions(response.payload)
+    return count, positions, bool(response.flags & MORE)
+
+
+def iter_positions(sock: socket.socket, query_string: str, limit: int = 0) -> Iterator[int]:
+    """
+    Get all the line numbers of the query on a framed connection, one page at a time.
+
+    Args:
+        sock (socket.socket): The connection to the server, plain or SSL.
+        query_string (str): The query string.
+        limit (int): The number of line numbers per page, 0 for the page size of the server.
+
+    Returns:
+        Iterator[int]: The 1-based line numbers in increasing order.
+    """
+    offset: int = 0
+    more: bool = True
+    while more:
+        _, positions, more = framed_positions(sock, query_string, offset, limit)
+        offset += len(positions)
+        yield from positions
+
+
+def read_stream_results(sock: socket.socket) -> List[bool]:
+    """
+    Receive the results of the oldest chunk of a query stream still in flight.
+
+    Args:
+        sock (socket.socket): The connection to the server, plain or SSL.
+
+    Returns:
+        List[bool]: True for every query of the chunk that exists.
+
+    Raises:
+        FrameError: If the server answered with an error frame or an unexpected frame.
+    """
+    response = read_frame(sock)
+    if response.kind == ERROR:
+        raise FrameError(f'server error: {str(response.payload, "utf-8")}')
+    if response.kind != STREAM | RESPONSE:
+        raise FrameError(f'unexpected response frame type {response.kind:#x}')
+    return decode_batch_results(response.payload)
+
+
+def stream_queries(sock: socket.socket, queries: Iterable[str],
+                   chunk_queries: int = DEFAULT_CHUNK_QUERIES,
+                   window: int = DEFAULT_WINDOW, corpus: Optional[str] = None) -> Iterator[bool]:
+    """
+    Search for an arbitrarily large stream of queries on a framed connection, i.e. the
+    lines of a file. The queries are sent in chunks and the results are yielded while the
+    rest of the stream is still being sent. At most window chunks are in flight, so
+    neither the client nor the server holds more than a few chunks of the stream.
+
+    The server can only read the next chunk once it has sent the results of the previous
+    ones, so a chunk is only sent when the unread results fit in MAX_UNREAD_RESULT_BYTES
+    and in half of the receive buffer of the socket. Otherwise both sides could block
+    sending to each other. A chunk with more results than that is sent alone, as with a
+    window of 1.
+
+    Args:
+        sock (socket.socket): The connection to the server, plain or SSL.
+        queries (Iterable[str]): The queries, they must not contain new line characters.
+        chunk_queries (int): Number of queries per chunk.
+        window (int): Number of chunks sent before waiting for their results.
+        corpus (Optional[str]): The named corpus searched, None for the main corpus.
+
+    Returns:
+        Iterator[bool]: True for every query that exists, in the order of the queries.
+    """
+    iterator: Iterator[str] = iter(queries)
+    # the size of the results of every chunk in flight, one byte per query
+    in_flight: deque = deque()
+    unread: int = 0
+    max_unread: int = min(MAX_UNREAD_RESULT_BYTES,
+                          sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // 2)
+    chunk: List[str] = list(islice(iterator, chunk_queries))
+    while chunk:
+        following: List[str] = list(islice(iterator, chunk_queries))
+        payload, flags = named(encode_batch(chunk), corpus)
+        sock.sendall(encode_frame(STREAM, payload, flags | (0 if following else LAST_CHUNK)))
+        in_flight.append(len(chunk) + HEADER.size)
+        unread += in_flight[-1]
+        chunk = following
+        while in_flight and (len(in_flight) >= window or unread > max_unread):
+            yield from read_stream_results(sock)
+            unread -= in_flight.popleft()
+    for _ in range(len(in_flight)):
+        yield from read_stream_results(sock)
+
+
+class MultiplexedClient:
+    """
+    Many requests in flight on one framed connection, every request carries an ID and the
+    server answers them in the order their searches complete. A reader thread resolves the
+    future of every request when its response arrives.
+
+    Args:
+        sock (socket.socket): The connection to the server, plain or SSL, owned by the caller.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock: socket.socket = sock
+        # the frames of the threads submitting requests are never interleaved
+        self._send_lock: threading.Lock = threading.Lock()
+        self._lock: threading.Lock = threading.Lock()
+        # the expected response type, the decoder and the future of every request in flight
+        self._pending: Dict[int, Tuple[int, Callable[[Frame], object], Future]] = {}
+        self._ids: Iterator[int] = count(1)
+        self._error: Optional[Exception] = None
+        self._reader: threading.Thread = threading.Thread(target=self._read_responses,
+                                                          name='multiplex-reader', daemon=True)
+        self._reader.start()
+
+    def submit(self, kind: int, payload: bytes, flags: int = 0,
+               decode: Callable[[Frame], object] = lambda frame: frame) -> Future:
+        """
+        Send a request frame without waiting for its response.
+
+        Args:
+            kind (int): The type of the request frame (QUERY, BATCH, FUZZY, COUNT or POSITIONS).
+            payload (bytes): The payload of the request frame.
+            flags (int): The flags of the request frame.
+            decode (Callable[[Frame], object]): Turns the response frame into the result.
+
+        Returns:
+            Future: The decoded response, or a FrameError if the server answered with an
+            error, or a ConnectionError if the connection ended first.
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._error is not None:
+                raise ConnectionError(f'the connection ended: {self._error}')
+            request_id: int = next(self._ids) & MAX_REQUEST_ID
+            self._pending[request_id] = (kind | RESPONSE, decode, future)
+        with self._send_lock:
+            self.sock.sendall(encode_frame(kind, payload, flags, request_id))
+        return future
+
+    def query(self, query_string: str, corpus: Optional[str] = None) -> Future:
+        """
+        Search for a single query, see framed_query.
+
+        Returns:
+            Future: True if the string exists, False otherwise.
+        """
+        return self.submit(QUERY, *named(query_string.encode('utf-8'), corpus),
+                           decode=lambda frame: bytes(frame.payload) == FOUND_RESPONSE)
+
+    def batch(self, queries: List[str], corpus: Optional[str] = None) -> Future:
+        """
+        Search for many queries with a single BATCH frame, see framed_batch.
+
+        Returns:
+            Future: True for every query that exists, in the order of the queries.
+        """
+        return self.submit(BATCH, *named(encode_batch(queries), corpus),
+                           decode=lambda frame: decode_batch_results(frame.payload))
+
+    def _read_responses(self):
+        """Resolve the futures of the responses until the connection ends."""
+        try:
+            while True:
+                frame: Frame = read_frame(self.sock)
+                if frame.request_id is None:
+                    # an error of the whole connection, not of one request
+                    raise FrameError(f'server error: {str(frame.payload, "utf-8")}')
+                with self._lock:
+                    expected, decode, future = self._pending.pop(frame.request_id,
+                                                                 (None, None, None))
+                if future is None:
+                    continue
+                if frame.kind == ERROR:
+                    future.set_exception(FrameError(f'server error: '
+                                                    f'{str(frame.payload, "utf-8")}'))
+                elif frame.kind != expected:
+                    future.set_exception(FrameError(f'unexpected response frame type '
+                                                    f'{frame.kind:#x}'))
+                else:
+                    future.set_result(decode(frame))
+        except (OSError, FrameError) as e:
+            with self._lock:
+                self._error = e
+                pending, self._pending = self._pending, {}
+            for _, _, future in pending.values():
+                future.set_exception(ConnectionError(f'the connection ended: {e}'))
+
+    def close(self):
+        """
+        Stop the reader thread, the requests still in flight fail with a ConnectionError.
+        The socket is shut down but left to the caller to close.
+        """
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._reader.join()
+
+    def __enter__(self) -> 'MultiplexedClient':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 # main function that calls the client_configuration function to begin client execution
 if __name__ == "__main__":
     # The main entry point of the client application
     # handling connection errors
     try:
-        client_config(SERVER_ADDRESS, PORT_NUMBER, QUERY_STRING, USE_SSL)
+        client_config(SERVER_ADDRESS, PORT_NUMBER, QUERY_STRING, USE_SSL, UNIX_SOCKET_PATH)
         # The server is using SSL connections thus client may be using no SSL or
         # wrong SSL certificates
     except ConnectionResetError as reset:
@@ -1,12 +1,27 @@
-""" 
+"""
 This module has been designed to facilitate easier way for measuring
 the performance of various search algorithms by generating text files that
 are saved in the data directory
 
+Every line of a generated file is a pure function of the seed and of the line
+number, so the files are generated in chunks that are written as soon as they
+are ready (the whole file is never held in memory) and the chunks can be
+generated in parallel by several processes. The same function is used to
+generate a query workload that matches the corpus.
 """
 
+# command line options of the generator
+import argparse
+
+# bounded window of the chunks being generated by the worker processes
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# greatest common divisor for the scattering of the hot queries
+import math
+
 # static typing
-from typing import List
+from typing import List, NamedTuple, Optional
 
 # for random number generation
 import random
@@ -14,21 +29,219 @@ import random
 # for IO operations
 import os
 
+# 64 bit mask used by the line hash
+MASK64: int = (1 << 64) - 1
+
+# number of lines generated and written at once
+DEFAULT_CHUNK_SIZE: int = 100_000
+
+# characters used to pad the lines to the requested length
+PADDING_CHARACTERS: str = 'abcdefghijklmnopqrstuvwxyz' * 2
+
+# prime used to scatter the popular query ranks over the corpus
+SCATTER_PRIME: int = 2_654_435_761
+
+# salts that make the different per line decisions independent of each other
+_DUPLICATE_SALT: int = 0x5DEECE66D
+_LENGTH_SALT: int = 0x2545F4914F6CDD1D
+_QUERY_SALT: int = 0x27BB2EE687B0B0FD
+
+
+class CorpusSpec(NamedTuple):
+    """
+    Describes the content of a generated corpus file.
+
+    size: number of lines of the file
+    seed: seed of the generator, the same seed generates the same file
+    duplicate_ratio: fraction (0.0 - 1.0) of the lines that repeat an earlier line
+    min_length, max_length: range of the line lengths, lines are padded up to a length
+    drawn from the range (0 disables the padding)
+    length_distribution: 'uniform' or 'normal' distribution of the line lengths
+    sortedness: None keeps the original line format, otherwise the fraction (0.0 - 1.0)
+    of each chunk left in sorted order, 1.0 generates a sorted file
+    """
+    size: int
+    seed: int
+    duplicate_ratio: float = 0.0
+    min_length: int = 0
+    max_length: int = 0
+    length_distribution: str = 'uniform'
+    sortedness: Optional[float] = None
+
+
+def _mix(value: int) -> int:
+    """
+    The splitmix64 hash, turns any integer into well distributed 64 bits.
+
+    Args:
+        value (int): The value to hash.
+
+    Returns:
+        int: The 64 bit hash.
+    """
+    value = (value + 0x9E3779B97F4A7C15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+
+def _unit(value: int) -> float:
+    """Map a 64 bit hash to a float in [0.0, 1.0)."""
+    return (value >> 11) / float(1 << 53)
+
+
+def source_line_number(spec: CorpusSpec, line_number: int) -> int:
+    """
+    Return the line number whose content is repeated at line_number.
+    It is line_number itself unless the line is a duplicate of an earlier line.
+
+    Args:
+        spec (CorpusSpec): The description of the corpus.
+        line_number (int): The line number in the file.
+
+    Returns:
+        int: The line number of the original line.
+    """
+    while line_number > 0 and spec.duplicate_ratio > 0.0:
+        decision = _mix(spec.seed ^ _DUPLICATE_SALT ^ line_number)
+        if _unit(decision) >= spec.duplicate_ratio:
+            break
+        # a sorted file repeats the previous line so that the order is kept
+        if spec.sortedness is not None:
+            line_number -= 1
+        else:
+            line_number = _mix(decision) % line_number
+    return line_number
+
+
+def generate_line(spec: CorpusSpec, line_number: int) -> str:
+    """
+    Generate the content of a line of the corpus (without the new line character).
+
+    Args:
+        spec (CorpusSpec): The description of the corpus.
+        line_number (int): The line number in the file.
+
+    Returns:
+        str: The content of the line.
+    """
+    source = source_line_number(spec, line_number)
+    value = _mix(spec.seed ^ source)
+    if spec.sortedness is None:
+        key = str(source)
+    else:
+        # zero padded keys make the lexicographic order follow the line numbers
+        key = str(source).zfill(len(str(max(spec.size - 1, 0))))
+    line = f'{key};{value % spec.size};{(value >> 32) % spec.size};'
+    if spec.max_length > 0:
+        length_value = _mix(spec.seed ^ _LENGTH_SALT ^ source)
+        target = _line_length(spec, length_value)
+        missing = target - len(line)
+        if missing > 0:
+            start = length_value % 26
+            padding = PADDING_CHARACTERS[start:start + 26] * (missing // 26 + 1)
+            line += padding[:missing]
+    return line
+
+
+def _line_length(spec: CorpusSpec, length_value: int) -> int:
+    """Draw the target length of a line from the configured distribution."""
+    low, high = spec.min_length, max(spec.max_length, spec.min_length)
+    if spec.length_distribution == 'normal':
+        # Box-Muller transform of two uniform values taken from the hash
+        first = max(_unit(length_value), 1e-12)
+        second = _unit(_mix(length_value))
+        normal = math.sqrt(-2.0 * math.log(first)) * math.cos(2.0 * math.pi * second)
+        length = round((low + high) / 2 + normal * (high - low) / 6)
+        return min(max(length, low), high)
+    return low + length_value % (high - low + 1)
+
 
-def generate_text_files(sizes: List[int]) -> bool:
+def generate_chunk(spec: CorpusSpec, start: int, stop: int) -> List[str]:
+    """
+    Generate the lines start to stop (excluded) of the corpus.
+    Runs in the worker processes, so it only depends on its arguments.
+
+    Args:
+        spec (CorpusSpec): The description of the corpus.
+        start (int): The first line number of the chunk.
+        stop (int): The line number after the last line of the chunk.
+
+    Returns:
+        List[str]: The lines of the chunk including the new line characters.
+    """
+    lines = [generate_line(spec, line_number) + '\n' for line_number in range(start, stop)]
+    if spec.sortedness is not None and spec.sortedness < 1.0 and len(lines) > 1:
+        # unsorted fraction of the chunk is obtained with random swaps
+        shuffler = random.Random(spec.seed ^ start)
+        for _ in range(round((1.0 - spec.sortedness) * len(lines))):
+            first = shuffler.randrange(len(lines))
+            second = shuffler.randrange(len(lines))
+            lines[first], lines[second] = lines[second], lines[first]
+    return lines
+
+
+def write_corpus(path: str, spec: CorpusSpec, workers: int = 1,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Write a corpus file chunk by chunk, generating the chunks in parallel when workers > 1.
+    At most two chunks per worker are held in memory at any time.
+
+    Args:
+        path (str): Path of the file to write.
+        spec (CorpusSpec): The description of the corpus.
+        workers (int): Number of worker processes.
+        chunk_size (int): Number of lines per chunk.
+
+    Raises:
+        OSError: If the file cannot be written.
+    """
+    chunk_size = max(chunk_size, 1)
+    ranges = [(start, min(start + chunk_size, spec.size))
+              for start in range(0, spec.size, chunk_size)]
+    with open(path, 'w', encoding='utf-8') as f:
+        if workers <= 1 or len(ranges) <= 1:
+            for start, stop in ranges:
+                f.writelines(generate_chunk(spec, start, stop))
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for start, stop in ranges:
+                pending.append(pool.submit(generate_chunk, spec, start, stop))
+                # the chunks are written in order as soon as the oldest one is ready
+                if len(pending) >= workers * 2:
+                    f.writelines(pending.popleft().result())
+            while pending:
+                f.writelines(pending.popleft().result())
+
+
+def generate_text_files(sizes: List[int], seed: Optional[int] = None,
+                        workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        duplicate_ratio: float = 0.0, min_length: int = 0, max_length: int = 0,
+                        length_distribution: str = 'uniform',
+                        sortedness: Optional[float] = None) -> bool:
     """
     This function generates a list of text files that will be used for testing performance
-    of search algorithms across different file sizes. The files are saved in the data directory 
-    with a .txt extension. 
-    You can use these text files to perform search queries for different file sizes. 
-    
+    of search algorithms across different file sizes. The files are saved in the data directory
+    with a .txt extension.
+    You can use these text files to perform search queries for different file sizes.
+
     Args:
         sizes (list[int]): A list of text file sizes to generate, e.g., [1000, 10000, 250000].
+        seed (Optional[int]): Seed of the generator, a random seed is used when None.
+        workers (Optional[int]): Number of worker processes, all the CPUs when None.
+        chunk_size (int): Number of lines generated and written at once.
+        duplicate_ratio (float): Fraction of the lines that repeat an earlier line.
+        min_length (int): Minimum length the lines are padded to.
+        max_length (int): Maximum length the lines are padded to, 0 disables the padding.
+        length_distribution (str): 'uniform' or 'normal' distribution of the line lengths.
+        sortedness (Optional[float]): None keeps the original line format, otherwise the
+        fraction of every chunk left sorted (1.0 generates a sorted file).
 
     Returns:
         bool: True if all the list of files are generated,
         or if all files are appropriately handled.
-        bool: False if all the list of files are not generated 
+        bool: False if all the list of files are not generated
         or if any of the files are not generated.
     """
     results = True  # Default to True, only set to False on encountering an unhandled error
@@ -36,15 +249,17 @@ def generate_text_files(sizes: List[int]) -> bool:
     try:
         # Create the directory if it doesn't exist
         os.makedirs(f'{os.getcwd()}/data', exist_ok=True)
+        if seed is None:
+            seed = random.randrange(1 << 63)
+        if workers is None:
+            workers = os.cpu_count() or 1
 
         for size in sizes:
-            # List of file lines as content of the file
-            lines = [f'{i};{random.randrange(size)};{random.randrange(size)};\n' for i in range(size)]
-
+            spec = CorpusSpec(size, seed, duplicate_ratio, min_length, max_length,
+                              length_distribution, sortedness)
             try:
                 # Write the lines to the file
-                with open(f'{os.getcwd()}/data/{size // 1000}k.txt', 'w', encoding='utf-8') as f:
-                    f.writelines(lines)
+                write_corpus(f'{os.getcwd()}/data/{size // 1000}k.txt', spec, workers, chunk_size)
             except FileExistsError as e:
                 print(f'File already exists: {e}')
             except OSError as e:
@@ -57,8 +272,108 @@ def generate_text_files(sizes: List[int]) -> bool:
     return results
 
 
+def zipf_rank(uniform: float, count: int, skew: float) -> int:
+    """
+    Draw a rank in [0, count) from a Zipf distribution with the given skew,
+    using the inverse of the continuous Zipf distribution (skew 0 is uniform).
+
+    Args:
+        uniform (float): A uniform value in [0.0, 1.0).
+        count (int): Number of ranks.
+        skew (float): The Zipf exponent, the higher the more popular the first ranks.
+
+    Returns:
+        int: The drawn rank, 0 being the most popular.
+    """
+    # the continuous rank lies in [1, count + 1) and is truncated to an integer
+    if skew == 1.0:
+        rank = (count + 1) ** uniform
+    else:
+        exponent = 1.0 - skew
+        rank = (((count + 1) ** exponent - 1.0) * uniform + 1.0) ** (1.0 / exponent)
+    return min(max(int(rank) - 1, 0), count - 1)
+
+
+def generate_query_workload(path: str, spec: CorpusSpec, count: int,
+                            hit_ratio: float = 0.5, zipf_skew: float = 1.0) -> int:
+    """
+    Write a query workload matching a generated corpus, one query per line.
+    Hits are lines of the corpus chosen with a Zipf skew (the popular lines are
+    scattered over the file), misses are strings that never occur in the corpus.
+
+    Args:
+        path (str): Path of the workload file.
+        spec (CorpusSpec): The description of the corpus the queries target.
+        count (int): Number of queries.
+        hit_ratio (float): Fraction (0.0 - 1.0) of the queries that are found in the corpus.
+        zipf_skew (float): Zipf exponent of the hits, 0 draws the lines uniformly.
+
+    Returns:
+        int: The number of hits written.
+
+    Raises:
+        OSError: If the file cannot be written.
+    """
+    scatter = SCATTER_PRIME
+    while math.gcd(scatter, max(spec.size, 1)) != 1:
+        scatter += 2
+    hits = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for start in range(0, count, DEFAULT_CHUNK_SIZE):
+            queries: List[str] = []
+            for number in range(start, min(start + DEFAULT_CHUNK_SIZE, count)):
+                value = _mix(spec.seed ^ _QUERY_SALT ^ number)
+                if spec.size > 0 and _unit(value) < hit_ratio:
+                    rank = zipf_rank(_unit(_mix(value)), spec.size, zipf_skew)
+                    queries.append(generate_line(spec, rank * scatter % spec.size) + '\n')
+                    hits += 1
+                else:
+                    # corpus lines start with a digit, the misses never do
+                    queries.append(f'miss;{value};\n')
+            f.writelines(queries)
+    return hits
+
+
+def main(arguments: Optional[List[str]] = None):
+    """
+    Command line entry point, i.e.
+    python3 generate_text.py 1000000 --seed 7 --workers 8 --queries 100000 --hit-ratio 0.8
+
+    Args:
+        arguments (Optional[List[str]]): The command line arguments, sys.argv when None.
+    """
+    parser = argparse.ArgumentParser(description='Generate corpus files in the data directory')
+    parser.add_argument('sizes', type=int, nargs='*',
+                        default=[10000, 100000, 250000, 500000, 1000000])
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0)
+    parser.add_argument('--min-length', type=int, default=0)
+    parser.add_argument('--max-length', type=int, default=0)
+    parser.add_argument('--length-distribution', choices=('uniform', 'normal'), default='uniform')
+    parser.add_argument('--sortedness', type=float, default=None)
+    parser.add_argument('--queries', type=int, default=0,
+                        help='number of queries of the workload written next to each file')
+    parser.add_argument('--hit-ratio', type=float, default=0.5)
+    parser.add_argument('--zipf-skew', type=float, default=1.0)
+    options = parser.parse_args(arguments)
+
+    seed = options.seed if options.seed is not None else random.randrange(1 << 63)
+    generate_text_files(options.sizes, seed, options.workers, options.chunk_size,
+                        options.duplicate_ratio, options.min_length, options.max_length,
+                        options.length_distribution, options.sortedness)
+    if options.queries > 0:
+        for size in options.sizes:
+            spec = CorpusSpec(size, seed, options.duplicate_ratio, options.min_length,
+                              options.max_length, options.length_distribution,
+                              options.sortedness)
+            generate_query_workload(f'{os.getcwd()}/data/{size // 1000}k_queries.txt', spec,
+                                    options.queries, options.hit_ratio, options.zipf_skew)
+
+
 if __name__ == '__main__':
     # start the  generation process. You can pass any number of argument
     # and the file size corresponding to the number will be generated and then
     # saved to the directory named data in the project's root directory
-    generate_text_files([10000, 100000, 250000, 500000, 1000000])
+    main()
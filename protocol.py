@@ -0,0 +1,494 @@
+"""
+This module defines the length-prefixed binary framing shared by the server and the client.
+
+The legacy wire format is "whatever arrives in one recv call", which breaks on TCP
+segmentation and caps the queries at MAX_PAYLOAD_SIZE. A framed connection instead
+sends frames made of a fixed header followed by the payload:
+
+    magic (1 byte, 0xA5) | version (1 byte) | type (1 byte) | flags (1 byte) | length (4 bytes)
+
+The magic byte can never start a UTF-8 string, so the server tells framed and legacy
+connections apart from the first byte it receives. A framed connection stays open and
+carries any number of frames, every request frame is answered by a frame whose type is
+the request type with the RESPONSE bit set.
+
+Frame types:
+
+QUERY: a single UTF-8 query, answered with STRING EXISTS or STRING NOT FOUND
+BATCH: new line separated UTF-8 queries, answered with one byte (1 or 0) per query
+STREAM: a chunk of a query stream, new line separated queries answered like a BATCH as
+soon as the chunk arrives. The last chunk of the stream has the LAST_CHUNK flag, which
+is echoed on its response. The client keeps a bounded number of chunks in flight.
+FUZZY: a single UTF-8 query whose flags are the maximum edit distance (0 for the server
+default), answered with the closest lines as new line separated "distance<TAB>line"
+entries. The TRUNCATED flag of the response tells that the time budget ran out.
+COUNT: a single UTF-8 query, answered with the number of corpus lines equal to it in ASCII
+POSITIONS: an offset and a limit (two unsigned 32 bit integers) followed by a UTF-8 query,
+answered with the number of occurrences and a page of at most limit line numbers (unsigned
+32 bit integers). The MORE flag of the response tells that more line numbers follow the page.
+ERROR: sent by the server when a frame cannot be handled, the payload is the reason
+
+Multiplexed frames (version 2) carry a request ID between the flags and the length:
+
+    magic (1 byte) | version (1 byte, 2) | type | flags | request ID (4 bytes) | length (4 bytes)
+
+The response of a multiplexed request carries the ID of the request, and the server answers
+the multiplexed requests of a connection in the order their searches complete, so a slow
+request does not hold back the cheaper ones sent after it. The STREAM chunks are still
+answered in order. Both versions may be mixed on a connection.
+
+A QUERY, BATCH or STREAM request with the NAMED_CORPUS flag is looked up in a named corpus
+of the server instead of its main corpus: its payload starts with the length of the name
+(1 byte) and the UTF-8 name, followed by the usual payload.
+"""
+
+# packing and unpacking of the frame header
+import struct
+
+# for the sockets used by the helpers
+import socket
+
+# static typing
+from typing import List, NamedTuple, Optional, Tuple
+
+# first byte of every frame, never the first byte of a UTF-8 string
+MAGIC: int = 0xA5
+
+# version of the framing
+VERSION: int = 1
+
+# the frame header, see the module documentation
+HEADER = struct.Struct('!BBBBI')
+
+# version of the multiplexed frames, whose header carries a request ID
+MULTIPLEX_VERSION: int = 2
+
+# the header of the multiplexed frames
+MULTIPLEX_HEADER = struct.Struct('!BBBBII')
+
+# largest request ID of a multiplexed frame
+MAX_REQUEST_ID: int = 0xFFFFFFFF
+
+# request frame types
+QUERY: int = 0x01
+BATCH: int = 0x02
+STREAM: int = 0x03
+FUZZY: int = 0x04
+COUNT: int = 0x05
+POSITIONS: int = 0x06
+
+# flag of the last chunk of a query stream
+LAST_CHUNK: int = 0x01
+
+# flag of a FUZZY response whose lookup ran out of time, its matches may be incomplete
+TRUNCATED: int = 0x01
+
+# flag of a POSITIONS response followed by more line numbers, asked for with a larger offset
+MORE: int = 0x01
+
+# the offset and the limit in front of the query of a POSITIONS request
+POSITIONS_REQUEST = struct.Struct('!II')
+
+# a line number or the occurrence count of a POSITIONS response
+POSITION = struct.Struct('!I')
+
+# flag of a QUERY, BATCH or STREAM request looked up in the named corpus in front of its payload
+NAMED_CORPUS: int = 0x80
+
+# the length of the corpus name in front of the payload of a NAMED_CORPUS request
+CORPUS_NAME = struct.Struct('!B')
+
+# bit set on the type of the frame answering a request
+RESPONSE: int = 0x80
+
+# frame sent by the server when a request frame cannot be handled
+ERROR: int = 0x7F
+
+# responses of the QUERY frames, the same as the legacy responses
+FOUND_RESPONSE: bytes = b'STRING EXISTS\n'
+NOT_FOUND_RESPONSE: bytes = b'STRING NOT FOUND\n'
+
+# default size of the receive buffer of a framed connection
+DEFAULT_BUFFER_SIZE: int = 64 * 1024
+
+# default number of queries per chunk of a query stream
+DEFAULT_CHUNK_QUERIES: int = 4096
+
+# default number of chunks of a query stream sent before waiting for their results
+DEFAULT_WINDOW: int = 8
+
+# upper bound of the results of a query stream left unread before sending another chunk,
+# kept below the socket buffers so the server is never blocked sending while the client sends
+MAX_UNREAD_RESULT_BYTES: int = 64 * 1024
+
+# default upper bound of the payload of a frame
+DEFAULT_MAX_FRAME_SIZE: int = 16 * 1024 * 1024
+
+
+class FrameError(ValueError):
+    """Raised when the received bytes are not a valid frame."""
+
+
+class Frame(NamedTuple):
+    """
+    A received frame.
+
+    kind: the frame type
+    flags: the frame flags
+    payload: the payload, a view into the receive buffer that is only valid
+    until the next call to FrameReader.fill() or FrameReader.next_frame()
+    request_id: the request ID of a multiplexed frame, None for a version 1 frame
+    """
+    kind: int
+    flags: int
+    payload: memoryview
+    request_id: Optional[int] = None
+
+
+def encode_frame(kind: int, payload: bytes = b'', flags: int = 0,
+                 request_id: Optional[int] = None) -> bytes:
+    """
+    Build a frame ready to be sent.
+
+    Args:
+        kind (int): The frame type.
+        payload (bytes): The payload of the frame.
+        flags (int): The frame flags.
+        request_id (Optional[int]): The request ID of a multiplexed frame, None for a
+        version 1 frame.
+
+    Returns:
+        bytes: The header followed by the payload.
+    """
+    if request_id is None:
+        return HEADER.pack(MAGIC, VERSION, kind, flags, len(payload)) + payload
+    return MULTIPLEX_HEADER.pack(MAGIC, MULTIPLEX_VERSION, kind, flags, request_id,
+                                 len(payload)) + payload
+
+
+def tag_frame(frame: bytes, request_id: Optional[int]) -> bytes:
+    """
+    Turn an encoded version 1 frame into the multiplexed frame answering a request.
+
+    Args:
+        frame (bytes): The version 1 frame, as built by encode_frame.
+        request_id (Optional[int]): The ID of the request, None to keep the frame as it is.
+
+    Returns:
+        bytes: The frame carrying the request ID.
+    """
+    if request_id is None:
+        return frame
+    _, _, kind, flags, length = HEADER.unpack_from(frame)
+    return MULTIPLEX_HEADER.pack(MAGIC, MULTIPLEX_VERSION, kind, flags, request_id,
+                                 length) + frame[HEADER.size:]
+
+
+class FrameReader:
+    """
+    Reads frames from a socket into a preallocated buffer with recv_into.
+    The frames are parsed in place, their payloads are views into the buffer and
+    are not copied. The buffer only grows when a frame larger than the buffer arrives,
+    and then with the bytes of the frame actually received, at most doubling each time,
+    so a header announcing a large frame does not allocate it up front.
+
+    Args:
+        connection (socket.socket): The socket the frames are read from.
+        buffer_size (int): Initial size of the receive buffer.
+        max_frame_size (int): Largest payload accepted, larger frames raise FrameError.
+    """
+
+    def __init__(self, connection: socket.socket, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 max_frame_size: int = DEFAULT_MAX_FRAME_SIZE):
+        self.connection: socket.socket = connection
+        self.max_frame_size: int = max_frame_size
+        self.buffer_size: int = max(buffer_size, HEADER.size)
+        self.buffer: bytearray = bytearray(self.buffer_size)
+        self.view: memoryview = memoryview(self.buffer)
+        # the unparsed bytes are buffer[start:end]
+        self.start: int = 0
+        self.end: int = 0
+
+    def feed(self, data: bytes):
+        """
+        Add bytes that were received before the reader was created, i.e. the
+        first bytes read to tell framed and legacy connections apart.
+
+        Args:
+            data (bytes): The bytes received.
+        """
+        if self.end + len(data) > len(self.buffer):
+            self._make_room(self.end - self.start + len(data))
+        self.buffer[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def buffered(self) -> int:
+        """Return the number of received bytes that are not parsed yet."""
+        return self.end - self.start
+
+    def fill(self, limit: Optional[int] = None) -> int:
+        """
+        Receive more bytes into the free space of the buffer.
+        The payloads of the previously returned frames are invalid afterwards.
+
+        Args:
+            limit (Optional[int]): Maximum number of bytes to receive.
+
+        Returns:
+            int: The number of bytes received, 0 when the peer closed the connection.
+        """
+        if self.start == self.end:
+            self.start = self.end = 0
+            # the buffer grown for a large frame is given back once the frame is handled
+            if len(self.buffer) > self.buffer_size * 4:
+                self.buffer = bytearray(self.buffer_size)
+                self.view = memoryview(self.buffer)
+        elif self.end == len(self.buffer):
+            # a full buffer is compacted, or doubled when it holds a single partial frame
+            self._make_room(len(self.buffer) * 2 if self.start == 0 else 0)
+        free = len(self.buffer) - self.end
+        if limit is not None:
+            free = min(free, limit)
+        received = self.connection.recv_into(self.view[self.end:self.end + free])
+        self.end += received
+        return received
+
+    def next_frame(self) -> Optional[Frame]:
+        """
+        Parse the next complete frame from the buffered bytes, without receiving.
+
+        Returns:
+            Optional[Frame]: The frame, or None if more bytes must be received first.
+
+        Raises:
+            FrameError: If the bytes are not a frame or the frame is too large.
+        """
+        if self.end - self.start < HEADER.size:
+            return None
+        magic, version = self.buffer[self.start], self.buffer[self.start + 1]
+        if magic != MAGIC:
+            raise FrameError(f'invalid frame magic byte {magic:#x}')
+        request_id: Optional[int] = None
+        if version == VERSION:
+            header_size: int = HEADER.size
+            _, _, kind, flags, length = HEADER.unpack_from(self.buffer, self.start)
+        elif version == MULTIPLEX_VERSION:
+            header_size = MULTIPLEX_HEADER.size
+            if self.end - self.start < header_size:
+                return None
+            _, _, kind, flags, request_id, length = MULTIPLEX_HEADER.unpack_from(self.buffer,
+                                                                                 self.start)
+        else:
+            raise FrameError(f'unsupported frame version {version}')
+        if length > self.max_frame_size:
+            raise FrameError(f'frame of {length} bytes exceeds the limit of '
+                             f'{self.max_frame_size} bytes')
+        frame_end = self.start + header_size + length
+        if frame_end > self.end:
+            # the frame does not fit in the rest of the buffer, the received bytes are moved
+            # to the front and the buffer grows to at most twice of them, up to the frame size
+            if frame_end > len(self.buffer):
+                pending: int = self.end - self.start
+                self._make_room(min(header_size + length, max(len(self.buffer), pending * 2)))
+            return None
+        payload = self.view[self.start + header_size:frame_end]
+        self.start = frame_end
+        return Frame(kind, flags, payload, request_id)
+
+    def _make_room(self, frame_size: int):
+        """Move the unparsed bytes to the front of the buffer, grown to frame_size if needed."""
+        pending = self.end - self.start
+        if frame_size > len(self.buffer):
+            # the views handed out earlier keep the old buffer alive, a new one is allocated
+            buffer = bytearray(frame_size)
+            buffer[:pending] = self.view[self.start:self.end]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        elif self.start > 0:
+            self.view[:pending] = self.view[self.start:self.end]
+        self.start, self.end = 0, pending
+
+
+def recv_exactly(connection: socket.socket, size: int) -> bytes:
+    """
+    Receive exactly size bytes from a blocking socket.
+
+    Args:
+        connection (socket.socket): The socket.
+        size (int): The number of bytes to receive.
+
+    Returns:
+        bytes: The received bytes.
+
+    Raises:
+        ConnectionError: If the peer closes the connection first.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = connection.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError('connection closed in the middle of a frame')
+        received += count
+    return bytes(buffer)
+
+
+def read_frame(connection: socket.socket) -> Frame:
+    """
+    Receive one complete frame from a blocking socket, used by the client.
+
+    Args:
+        connection (socket.socket): The socket.
+
+    Returns:
+        Frame: The frame, its payload is a view of a private copy.
+
+    Raises:
+        FrameError: If the bytes are not a frame.
+        ConnectionError: If the peer closes the connection first.
+    """
+    header: bytes = recv_exactly(connection, HEADER.size)
+    request_id: Optional[int] = None
+    if header[1] == MULTIPLEX_VERSION:
+        header += recv_exactly(connection, MULTIPLEX_HEADER.size - HEADER.size)
+        magic, _, kind, flags, request_id, length = MULTIPLEX_HEADER.unpack(header)
+    else:
+        magic, version, kind, flags, length = HEADER.unpack(header)
+        if version != VERSION:
+            raise FrameError(f'invalid frame header {magic:#x} version {version}')
+    if magic != MAGIC:
+        raise FrameError(f'invalid frame header {magic:#x} version {header[1]}')
+    return Frame(kind, flags, memoryview(recv_exactly(connection, length)), request_id)
+
+
+def encode_batch(queries: List[str]) -> bytes:
+    """
+    Encode the queries of a BATCH frame.
+
+    Args:
+        queries (List[str]): The queries, they must not contain new line characters.
+
+    Returns:
+        bytes: The payload of the BATCH frame.
+    """
+    return '\n'.join(queries).encode('utf-8')
+
+
+def decode_batch_results(payload: memoryview) -> List[bool]:
+    """
+    Decode the payload of a BATCH response.
+
+    Args:
+        payload (memoryview): One byte per query, 1 if found and 0 if not.
+
+    Returns:
+        List[bool]: True for every query that was found.
+    """
+    return [result == ord('1') for result in payload]
+
+
+def decode_fuzzy_matches(payload: memoryview) -> List[Tuple[int, str]]:
+    """
+    Decode the payload of a FUZZY response.
+
+    Args:
+        payload (memoryview): New line separated "distance<TAB>line" entries.
+
+    Returns:
+        List[Tuple[int, str]]: The (distance, line) pairs, closest first.
+    """
+    matches: List[Tuple[int, str]] = []
+    for entry in str(payload, 'utf-8').split('\n') if len(payload) else ():
+        distance, line = entry.split('\t', 1)
+        matches.append((int(distance), line))
+    return matches
+
+
+def encode_positions_request(query: str, offset: int, limit: int) -> bytes:
+    """
+    Encode the payload of a POSITIONS request.
+
+    Args:
+        query (str): The query.
+        offset (int): The number of line numbers to skip.
+        limit (int): The maximum number of line numbers of the page, 0 for the server default.
+
+    Returns:
+        bytes: The offset and the limit followed by the UTF-8 query.
+    """
+    return POSITIONS_REQUEST.pack(offset, limit) + query.encode('utf-8')
+
+
+def encode_corpus_name(corpus: str, payload: bytes) -> bytes:
+    """
+    Put the name of a corpus in front of the payload of a NAMED_CORPUS request.
+
+    Args:
+        corpus (str): The name of the corpus, at most 255 UTF-8 bytes.
+        payload (bytes): The payload of the request.
+
+    Returns:
+        bytes: The length of the name, the UTF-8 name and the payload.
+    """
+    name: bytes = corpus.encode('utf-8')
+    if not 0 < len(name) <= 255:
+        raise ValueError('a corpus name has 1 to 255 UTF-8 bytes')
+    return CORPUS_NAME.pack(len(name)) + name + payload
+
+
+def decode_corpus_name(payload: memoryview) -> Tuple[str, memoryview]:
+    """
+    Split the payload of a NAMED_CORPUS request into the name of the corpus and the rest.
+
+    Args:
+        payload (memoryview): The payload of the request.
+
+    Returns:
+        Tuple[str, memoryview]: The name of the corpus and the payload that follows it.
+
+    Raises:
+        FrameError: If the payload is shorter than the name or the name is not UTF-8.
+    """
+    if not payload:
+        raise FrameError('NAMED_CORPUS payload without a corpus name')
+    end: int = CORPUS_NAME.size + payload[0]
+    if len(payload) < end:
+        raise FrameError('NAMED_CORPUS payload shorter than its corpus name')
+    try:
+        return str(payload[CORPUS_NAME.size:end], 'utf-8'), payload[end:]
+    except UnicodeDecodeError as e:
+        raise FrameError('the corpus name is not valid UTF-8') from e
+
+
+def encode_positions(count: int, positions: List[int]) -> bytes:
+    """
+    Encode the payload of a POSITIONS response.
+
+    Args:
+        count (int): The number of occurrences of the query.
+        positions (List[int]): The line numbers of the page.
+
+    Returns:
+        bytes: The count followed by the line numbers, as unsigned 32 bit integers.
+    """
+    return struct.pack(f'!{len(positions) + 1}I', count, *positions)
+
+
+def decode_positions(payload: memoryview) -> Tuple[int, List[int]]:
+    """
+    Decode the payload of a POSITIONS response.
+
+    Args:
+        payload (memoryview): The payload encoded by encode_positions.
+
+    Returns:
+        Tuple[int, List[int]]: The number of occurrences and the line numbers of the page.
+
+    Raises:
+        FrameError: If the payload is not a whole number of integers.
+    """
+    if len(payload) < POSITION.size or len(payload) % POSITION.size:
+        raise FrameError(f'invalid POSITIONS payload of {len(payload)} bytes')
+    count, *positions = struct.unpack(f'!{len(payload) // POSITION.size}I', payload)
+    return count, positions
@@ -0,0 +1,206 @@
+"""
+This module implements the admission control of the server.
+
+Every source IP address gets a token bucket that refills at a fixed rate up to
+a burst size, and a count of its open connections. A connection is admitted when
+its IP has a token left and is below the concurrent connection cap, otherwise it
+is rejected by the accept loop before any TLS handshake, decoding or search work.
+A framed connection carries many requests, so every request frame takes a token
+from the same bucket as well.
+
+The rejections are tallied per IP and reason for the admin report. The tally keeps
+the most throttled clients only: once it is full, a new client replaces the client
+with the fewest rejections, so a flood of source addresses cannot grow it.
+"""
+
+# the buckets are shared by the accept loop and the client threads
+import threading
+
+# monotonic clock used to refill the buckets
+import time
+
+# static typing
+from typing import Dict, List, Optional, Tuple
+
+# reasons of a rejection, used as metric labels
+RATE_LIMITED: str = 'rate_limited'
+TOO_MANY_CONNECTIONS: str = 'too_many_connections'
+
+# the idle clients are pruned every this many admissions
+PRUNE_INTERVAL: int = 1024
+
+# clients whose rejections are tallied, the least throttled one is replaced by a new client
+MAX_THROTTLED_CLIENTS: int = 256
+
+
+class TokenBucket:
+    """
+    Token bucket of a single client.
+
+    Args:
+        rate (float): Tokens added per second.
+        burst (float): Maximum number of tokens, the bucket starts full.
+        now (float): The current time of the monotonic clock.
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate: float = rate
+        self.burst: float = burst
+        self.tokens: float = burst
+        self.updated: float = now
+
+    def take(self, now: float) -> bool:
+        """
+        Refill the bucket for the time elapsed and take one token.
+
+        Args:
+            now (float): The current time of the monotonic clock.
+
+        Returns:
+            bool: True if a token was taken, False if the bucket is empty.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def is_full(self, now: float) -> bool:
+        """Check whether the bucket would be full at the given time."""
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class AdmissionController:
+    """
+    Per-client rate limiting and concurrent connection cap.
+
+    Args:
+        rate_per_second (float): Connections admitted per second and per IP, 0 disables the limit.
+        burst (float): Connections an IP can open at once before the rate applies.
+        max_connections_per_ip (int): Concurrent connections per IP, 0 disables the cap.
+        max_throttled_clients (int): Clients whose rejections are tallied.
+    """
+
+    def __init__(self, rate_per_second: float, burst: float, max_connections_per_ip: int,
+                 max_throttled_clients: int = MAX_THROTTLED_CLIENTS):
+        self.rate_per_second: float = max(rate_per_second, 0.0)
+        self.burst: float = max(burst, 1.0)
+        self.max_connections_per_ip: int = max(max_connections_per_ip, 0)
+        self.max_throttled_clients: int = max(max_throttled_clients, 1)
+        self.enabled: bool = self.rate_per_second > 0 or self.max_connections_per_ip > 0
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._connections: Dict[str, int] = {}
+        self._admissions: int = 0
+        # rejections per client IP and reason, the most throttled clients only
+        self._throttled: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def admit(self, client_ip: str) -> Optional[str]:
+        """
+        Decide whether a new connection of the client is admitted.
+        An admitted connection must be released with release() when it is closed.
+
+        Args:
+            client_ip (str): The source IP address of the connection.
+
+        Returns:
+            Optional[str]: None if the connection is admitted, otherwise the reason of
+            the rejection (RATE_LIMITED or TOO_MANY_CONNECTIONS).
+        """
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._admissions += 1
+            if self._admissions % PRUNE_INTERVAL == 0:
+                self._prune(now)
+            open_connections = self._connections.get(client_ip, 0)
+            if 0 < self.max_connections_per_ip <= open_connections:
+                self._tally(client_ip, TOO_MANY_CONNECTIONS)
+                return TOO_MANY_CONNECTIONS
+            if self.rate_per_second > 0:
+                bucket = self._buckets.get(client_ip)
+                if bucket is None:
+                    bucket = TokenBucket(self.rate_per_second, self.burst, now)
+                    self._buckets[client_ip] = bucket
+                if not bucket.take(now):
+                    self._tally(client_ip, RATE_LIMITED)
+                    return RATE_LIMITED
+            if self.max_connections_per_ip > 0:
+                self._connections[client_ip] = open_connections + 1
+        return None
+
+    def take(self, client_ip: str) -> bool:
+        """
+        Take a token of the client for a request of an admitted connection.
+
+        Args:
+            client_ip (str): The source IP address of the connection.
+
+        Returns:
+            bool: True if the request may be answered, False if the client is rate limited.
+        """
+        if self.rate_per_second <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client_ip)
+            if bucket is None:
+                bucket = TokenBucket(self.rate_per_second, self.burst, now)
+                self._buckets[client_ip] = bucket
+            if bucket.take(now):
+                return True
+            self._tally(client_ip, RATE_LIMITED)
+            return False
+
+    def release(self, client_ip: str):
+        """
+        Release an admitted connection of the client once it is closed.
+
+        Args:
+            client_ip (str): The source IP address of the connection.
+        """
+        if self.max_connections_per_ip <= 0:
+            return
+        with self._lock:
+            open_connections = self._connections.get(client_ip, 0) - 1
+            if open_connections > 0:
+                self._connections[client_ip] = open_connections
+            else:
+                self._connections.pop(client_ip, None)
+
+    def open_connections(self, client_ip: str) -> int:
+        """Return the number of admitted connections of the client that are still open."""
+        return self._connections.get(client_ip, 0)
+
+    def throttled_clients(self) -> List[Tuple[str, Dict[str, int]]]:
+        """
+        Return the tally of the rejections of the most throttled clients.
+
+        Returns:
+            List[Tuple[str, Dict[str, int]]]: The client IPs and their rejections per
+            reason, the most throttled client first.
+        """
+        with self._lock:
+            tally = [(client_ip, dict(reasons)) for client_ip, reasons in self._throttled.items()]
+        tally.sort(key=lambda entry: sum(entry[1].values()), reverse=True)
+        return tally
+
+    def _tally(self, client_ip: str, reason: str):
+        """Count a rejection of the client, called with the lock held."""
+        reasons = self._throttled.get(client_ip)
+        if reasons is None:
+            if len(self._throttled) >= self.max_throttled_clients:
+                least = min(self._throttled, key=lambda ip: sum(self._throttled[ip].values()))
+                del self._throttled[least]
+            reasons = self._throttled[client_ip] = {}
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+    def _prune(self, now: float):
+        """Forget the buckets of the clients that are idle and full, called with the lock held."""
+        idle: List[str] = [client_ip for client_ip, bucket in self._buckets.items()
+                           if client_ip not in self._connections and bucket.is_full(now)]
+        for client_ip in idle:
+            del self._buckets[client_ip]
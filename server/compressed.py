@@ -0,0 +1,156 @@
+"""
+This module implements the reading of corpus files compressed with gzip, bz2 or xz.
+
+The compression is recognized from the file suffix (.gz, .bz2 or .xz), any other file is
+read as it is. A compressed corpus is never decompressed to disk: the index is built from
+the decompressed stream. A reader thread decompresses the file block by block into a small
+bounded queue while the caller splits the blocks into lines and inserts them, so the index
+construction overlaps with the decompression (zlib, bz2 and lzma release the GIL while they
+decompress) and at most a few blocks of decompressed data are held in memory.
+"""
+
+# gzip support is always available
+import gzip
+
+# the decompressed blocks are handed over from the reader thread
+import queue
+
+# the reader thread
+import threading
+
+# errors raised by a corrupted gzip stream
+import zlib
+
+# static typing
+from typing import Callable, Dict, IO, Iterator, List
+
+try:
+    # bz2 support, missing from Python builds without libbz2
+    import bz2
+except ImportError:  # pragma: no cover
+    bz2 = None
+
+try:
+    # xz support, missing from Python builds without liblzma
+    import lzma
+except ImportError:  # pragma: no cover
+    lzma = None
+
+# size of the blocks read from the decompressed stream
+BLOCK_SIZE: int = 1024 * 1024
+
+# number of decompressed blocks waiting for the caller at most
+PREFETCH_BLOCKS: int = 4
+
+# the opener of the compressed files by suffix
+OPENERS: Dict[str, Callable[..., IO]] = {'.gz': gzip.open}
+if bz2 is not None:
+    OPENERS['.bz2'] = bz2.open
+if lzma is not None:
+    OPENERS['.xz'] = lzma.open
+
+# errors raised while reading a missing, truncated or corrupted file
+READ_ERRORS: tuple = (OSError, EOFError, zlib.error) + ((lzma.LZMAError,) if lzma else ())
+
+
+def is_compressed(path: str) -> bool:
+    """
+    Tell whether a corpus file is compressed, from its suffix.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        bool: True for the .gz, .bz2 and .xz files that can be decompressed.
+    """
+    return path.endswith(tuple(OPENERS))
+
+
+def open_corpus(path: str, binary: bool = False) -> IO:
+    """
+    Open a corpus file for reading, decompressing it if it is compressed.
+
+    Args:
+        path (str): Path to the file.
+        binary (bool): Whether the file is read as bytes instead of UTF-8 text.
+
+    Returns:
+        IO: The file object, text files decode UTF-8 like the plain corpus files.
+
+    Raises:
+        OSError: If the file does not exist or can not be read.
+    """
+    for suffix, opener in OPENERS.items():
+        if path.endswith(suffix):
+            return opener(path, 'rb') if binary else opener(path, 'rt', encoding='utf-8')
+    return open(path, mode='rb') if binary else open(path, mode='r', encoding='utf-8')
+
+
+def iter_line_blocks(path: str, binary: bool = False, block_size: int = BLOCK_SIZE,
+                     counter=None) -> Iterator[List]:
+    """
+    Read the lines of a corpus file block by block, the next blocks being read and
+    decompressed by a reader thread while the caller handles the lines of this one.
+
+    The lines are split on the new line characters only, like the incremental reloads,
+    and are returned without them.
+
+    Args:
+        path (str): Path to the file.
+        binary (bool): Whether the lines are returned as bytes instead of str.
+        block_size (int): Size of the decompressed blocks.
+        counter (Optional[ReadCounter]): Counts the bytes and the lines of the decompressed
+        blocks, for the index stats.
+
+    Returns:
+        Iterator[List]: The lines of every block, str or bytes.
+
+    Raises:
+        OSError, EOFError, zlib.error or lzma.LZMAError: If the file can not be read or
+        decompressed, raised once the lines before the error are consumed.
+    """
+    blocks: queue.Queue = queue.Queue(PREFETCH_BLOCKS)
+    stop: threading.Event = threading.Event()
+
+    def hand_over(item) -> bool:
+        # the caller may stop consuming, the reader thread then stops instead of blocking
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read_blocks():
+        try:
+            with open_corpus(path, binary=True) as f:
+                while block := f.read(block_size):
+                    if counter is not None:
+                        counter.count(block)
+                    if not hand_over(block):
+                        return
+        except READ_ERRORS as e:
+            hand_over(e)
+            return
+        hand_over(None)
+
+    reader = threading.Thread(target=read_blocks, name='corpus-reader', daemon=True)
+    reader.start()
+    rest: bytes = b''
+    try:
+        while (block := blocks.get()) is not None:
+            if isinstance(block, BaseException):
+                raise block
+            end: int = block.rfind(b'\n') + 1
+            if not end:
+                rest += block
+                continue
+            # a line and a multibyte character may span two blocks, only whole lines are split
+            lines: bytes = rest + block[:end - 1]
+            rest = block[end:]
+            yield lines.split(b'\n') if binary else lines.decode('utf-8').split('\n')
+        if rest:
+            yield [rest] if binary else [rest.decode('utf-8')]
+    finally:
+        stop.set()
@@ -0,0 +1,173 @@
+"""
+This module implements the named corpora hosted next to the main corpus of a server.
+
+Every [corpus:name] section of config.ini names a corpus file:
+
+    [corpus:words]
+    path=words.txt
+
+The relative paths are read from the data directory of the main corpus (linuxpath).
+
+The requests naming a corpus (the NAMED_CORPUS flag of the framed protocol) are answered
+from the set of its lines, loaded on first use. The sets are held under a global memory
+budget: once the resident sets take more than the budget, the least recently used ones are
+evicted and loaded again by their next request. The corpus just used is never evicted, so a
+corpus larger than the whole budget is held alone. A lookup still using an evicted set
+finishes normally, the set is freed once the last lookup drops it.
+"""
+
+# resolving the paths of the corpus files
+import os
+
+# the least recently used order of the resident corpora
+from collections import OrderedDict
+
+# the lookups and the loads run on the threads of the connections
+import threading
+
+# the memory held by a set of lines
+from server.index_stats import estimate_bytes
+
+# static typing
+from typing import Callable, Dict, Optional, Tuple
+
+# prefix of the config.ini sections naming a corpus
+SECTION_PREFIX: str = 'corpus:'
+
+
+def corpus_sections(config, base_dir: str) -> Dict[str, str]:
+    """
+    Read the named corpora of a configuration.
+
+    Args:
+        config (configparser.ConfigParser): The parsed config.ini.
+        base_dir (str): The directory the relative paths are read from.
+
+    Returns:
+        Dict[str, str]: The path of the file of every corpus, by name.
+
+    Raises:
+        ValueError: If a section has no path or an invalid name.
+    """
+    corpora: Dict[str, str] = {}
+    for section in config.sections():
+        if not section.startswith(SECTION_PREFIX):
+            continue
+        name: str = section[len(SECTION_PREFIX):]
+        path: Optional[str] = config[section].get('path')
+        if not name or len(name.encode('utf-8')) > 255:
+            raise ValueError(f'[{section}]: a corpus name has 1 to 255 UTF-8 bytes')
+        if not path:
+            raise ValueError(f'[{section}] has no path')
+        corpora[name] = os.path.join(base_dir, path)
+    return corpora
+
+
+class CorpusRegistry:
+    """
+    The named corpora, loaded on first use and evicted least recently used first.
+
+    Args:
+        paths (Dict[str, str]): The path of the file of every corpus, by name.
+        load (Callable[[str, str], set]): Builds the set of lines of a corpus from its name
+        and the path of its file.
+        budget_bytes (int): The memory the resident sets may take, 0 for no limit.
+        on_event (Callable[[str, str], None]): Called with the event ('hit', 'load' or
+        'eviction') and the name of the corpus, i.e. to count them.
+    """
+
+    def __init__(self, paths: Dict[str, str], load: Callable[[str, str], set],
+                 budget_bytes: int = 0,
+                 on_event: Callable[[str, str], None] = lambda event, name: None):
+        self.paths: Dict[str, str] = dict(paths)
+        self.budget_bytes: int = budget_bytes
+        self._load: Callable[[str, str], set] = load
+        self._on_event: Callable[[str, str], None] = on_event
+        # the set and the estimated size of every resident corpus, the most recent last
+        self._resident: 'OrderedDict[str, Tuple[set, int]]' = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+        # only one thread loads a corpus, the others wait for it instead of loading it again
+        self._load_locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in paths}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.paths
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _resident_lines(self, name: str) -> Optional[set]:
+        """The set of a resident corpus, marked as the most recently used one."""
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is None:
+                return None
+            self._resident.move_to_end(name)
+        self._on_event('hit', name)
+        return entry[0]
+
+    def get(self, name: str) -> set:
+        """
+        Return the set of lines of a corpus, loading it first when it is not resident.
+
+        Args:
+            name (str): The name of the corpus.
+
+        Returns:
+            set: The lines of the corpus.
+
+        Raises:
+            KeyError: If no corpus has this name.
+            OSError: If the file of the corpus can not be read.
+        """
+        lines: Optional[set] = self._resident_lines(name)
+        if lines is not None:
+            return lines
+        with self._load_locks[name]:
+            # loaded by another thread while this one was waiting
+            lines = self._resident_lines(name)
+            if lines is not None:
+                return lines
+            lines = self._load(name, self.paths[name])
+            size: int = estimate_bytes(lines)
+            with self._lock:
+                self._resident[name] = (lines, size)
+                evicted = self._evict()
+        self._on_event('load', name)
+        for evicted_name in evicted:
+            self._on_event('eviction', evicted_name)
+        return lines
+
+    def _evict(self) -> list:
+        """Evict the least recently used corpora over the budget, called with the lock held."""
+        evicted: list = []
+        if not self.budget_bytes:
+            return evicted
+        total: int = sum(size for _, size in self._resident.values())
+        while total > self.budget_bytes and len(self._resident) > 1:
+            name, (_, size) = self._resident.popitem(last=False)
+            total -= size
+            evicted.append(name)
+        return evicted
+
+    @property
+    def resident_bytes(self) -> int:
+        """The estimated memory of the resident sets."""
+        with self._lock:
+            return sum(size for _, size in self._resident.values())
+
+    def report(self) -> dict:
+        """
+        Describe the corpora, for the admin stats.
+
+        Returns:
+            dict: The budget, the resident bytes, and the path, residency and estimated
+            size of every corpus, the resident ones from the least to the most recently used.
+        """
+        with self._lock:
+            resident = {name: size for name, (_, size) in self._resident.items()}
+        corpora: dict = {name: {'path': self.paths[name], 'resident': True, 'bytes': size}
+                         for name, size in resident.items()}
+        for name, path in self.paths.items():
+            corpora.setdefault(name, {'path': path, 'resident': False, 'bytes': 0})
+        return {'budget_bytes': self.budget_bytes, 'resident_bytes': sum(resident.values()),
+                'corpora': corpora}
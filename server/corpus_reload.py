@@ -0,0 +1,355 @@
+"""
+This module implements the incremental reloads of the corpus file.
+
+APPEND mode is meant for data files that only grow by appending lines. The reader
+remembers the inode and the byte offset it consumed up to, and a reload only reads
+the bytes appended since then and inserts their lines into the live set. The whole
+file is only read again when it was truncated or replaced by another file.
+
+DIFF mode is meant for data files rewritten with mostly unchanged content. The file is
+cut into content-defined chunks of lines, a chunk ends after a line whose hash matches
+a bit mask, so an edit only changes the chunks around it. A reload is skipped while the
+size and the modification time of the file are unchanged. Otherwise the new file is read
+block by block and its chunks are hashed, and only the lines of the chunks that appeared
+or disappeared are decoded and inserted into or deleted from the live set. The reader
+keeps no copy of the file, only the digest of every chunk and the keys of its lines,
+which are the same strings as the ones held by the live set.
+"""
+
+# the chunks are compared by digest
+import hashlib
+
+# the file is read in binary mode from the remembered offset
+import os
+
+# counting the chunks that appeared or disappeared
+from collections import Counter
+
+# static typing
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# a compressed corpus is compared decompressed
+from server.compressed import open_corpus
+
+# the size and the lines of the file read by the last load
+from server.index_stats import ReadCounter
+
+# reload modes of the server
+FULL: str = 'full'
+APPEND: str = 'append'
+DIFF: str = 'diff'
+
+# all the reload modes
+RELOAD_MODES = (FULL, APPEND, DIFF)
+
+# a chunk ends after a line whose hash has these bits cleared, about 64 lines per chunk
+CHUNK_MASK: int = 63
+
+# upper bound of the lines of a chunk, for runs of lines that never match the mask
+MAX_CHUNK_LINES: int = 1024
+
+# size of the blocks the file is read in by the diff reloads
+READ_BLOCK_SIZE: int = 1024 * 1024
+
+
+def parse_reload_mode(name: str) -> str:
+    """
+    Convert the name of a reload mode from the configuration file.
+
+    Args:
+        name (str): The name of the mode, case insensitive.
+
+    Returns:
+        str: The reload mode.
+
+    Raises:
+        ValueError: If the name is not a reload mode.
+    """
+    mode: str = name.strip().lower()
+    if mode not in RELOAD_MODES:
+        raise ValueError(f'invalid reload mode {name!r}, '
+                         f'expected one of {", ".join(RELOAD_MODES)}')
+    return mode
+
+
+class TailReader:
+    """
+    Follows an append-only corpus file.
+
+    A last line without a new line character may still be being written, it is indexed
+    but remembered, so that it is replaced by its complete version once the rest arrives.
+
+    Args:
+        path (str): Path to the corpus file.
+        normalize (Callable[[str], str]): Turns a line into its key in the live set.
+    """
+
+    def __init__(self, path: str, normalize: Callable[[str], str] = str.strip):
+        self.path: str = path
+        self.normalize: Callable[[str], str] = normalize
+        self.device: int = -1
+        self.inode: int = -1
+        # bytes of the file consumed up to the end of the last complete line
+        self.offset: int = 0
+        # the unterminated last line, indexed but possibly incomplete
+        self.partial: bytes = b''
+        # whether the unterminated last line is also a complete line of the file
+        self.partial_shared: bool = False
+        # the bytes and the lines read by the last load
+        self.read_counts: ReadCounter = ReadCounter()
+
+    def load(self) -> Set[str]:
+        """
+        Read the whole file and remember where the next reload starts.
+
+        Returns:
+            Set[str]: The stripped lines of the file.
+        """
+        self.offset = 0
+        self.partial = b''
+        self.partial_shared = False
+        self.read_counts = ReadCounter()
+        with open(self.path, mode='rb') as f:
+            info = os.fstat(f.fileno())
+            self.device, self.inode = info.st_dev, info.st_ino
+            lines: Set[str] = set()
+            self._insert(self.read_counts.count(f.read()), lines)
+        return lines
+
+    def changed(self) -> bool:
+        """Check with a single stat whether the file was appended to, truncated or replaced."""
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            return False
+        return ((info.st_dev, info.st_ino) != (self.device, self.inode)
+                or info.st_size != self.offset + len(self.partial))
+
+    def update(self, lines: Set[str]) -> Optional[int]:
+        """
+        Insert the lines appended since the last load or update into the live set.
+
+        Args:
+            lines (Set[str]): The live set of lines, updated in place.
+
+        Returns:
+            Optional[int]: The number of complete lines read, None if the file was truncated
+            or replaced and must be loaded again with load().
+        """
+        with open(self.path, mode='rb') as f:
+            info = os.fstat(f.fileno())
+            if (info.st_dev, info.st_ino) != (self.device, self.inode):
+                return None
+            if info.st_size < self.offset + len(self.partial):
+                return None
+            f.seek(self.offset)
+            data: bytes = f.read()
+        if data == self.partial:
+            return 0
+        if not data.startswith(self.partial):
+            # the unterminated line was rewritten instead of appended to
+            return None
+        if self.partial and not self.partial_shared:
+            # the unterminated line is replaced by its complete version
+            lines.discard(self.normalize(self.partial.decode('utf-8', errors='replace')))
+        return self._insert(data, lines)
+
+    def _insert(self, data: bytes, lines: Set[str]) -> int:
+        """Insert the lines of the bytes read at the offset, then advance the offset."""
+        end: int = data.rfind(b'\n') + 1
+        # split on the new line characters only, like the full load with readlines()
+        complete: List[str] = data[:end].decode('utf-8', errors='replace').split('\n')[:-1]
+        lines.update(map(self.normalize, complete))
+        self.offset += end
+        self.partial = data[end:]
+        self.partial_shared = False
+        if self.partial:
+            partial_line: str = self.normalize(self.partial.decode('utf-8', errors='replace'))
+            self.partial_shared = partial_line in lines
+            lines.add(partial_line)
+        return len(complete)
+
+
+def iter_chunks(blocks: Iterable[bytes], mask: int = CHUNK_MASK,
+                max_lines: int = MAX_CHUNK_LINES) -> Iterator[bytes]:
+    """
+    Cut the content of a file, read block by block, into content-defined chunks of whole
+    lines. The chunks do not depend on where the blocks are cut.
+
+    Args:
+        blocks (Iterable[bytes]): The content of the file, in consecutive blocks.
+        mask (int): A chunk ends after a line whose hash has these bits cleared.
+        max_lines (int): Upper bound of the lines of a chunk.
+
+    Returns:
+        Iterator[bytes]: The chunks, new line separated lines without a trailing new line.
+    """
+    # the lines of the chunk still open at the end of the previous block
+    pending: List[bytes] = []
+    # the incomplete last line of the previous block
+    rest: bytes = b''
+    for block in blocks:
+        lines: List[bytes] = (rest + block).split(b'\n')
+        rest = lines.pop()
+        yield from _cut_chunks(pending, lines, mask, max_lines)
+    if rest:
+        yield from _cut_chunks(pending, [rest], mask, max_lines)
+    if pending:
+        yield b'\n'.join(pending)
+
+
+def _cut_chunks(pending: List[bytes], lines: List[bytes], mask: int,
+                max_lines: int) -> Iterator[bytes]:
+    """Cut the chunks ended by the lines, the lines of the open chunk are left in pending."""
+    lines = pending + lines
+    # the lines ending a chunk, found in one pass without a branch per line
+    ends: List[int] = [index + 1 for index, line_hash in enumerate(map(hash, lines))
+                       if index >= len(pending) and not line_hash & mask]
+    start: int = 0
+    for end in ends:
+        # long runs of lines without a boundary are cut every max_lines lines
+        for cut in range(start + max_lines, end, max_lines):
+            yield b'\n'.join(lines[start:cut])
+            start = cut
+        yield b'\n'.join(lines[start:end])
+        start = end
+    while len(lines) - start >= max_lines:
+        yield b'\n'.join(lines[start:start + max_lines])
+        start += max_lines
+    pending[:] = lines[start:]
+
+
+def split_chunks(data: bytes, mask: int = CHUNK_MASK,
+                 max_lines: int = MAX_CHUNK_LINES) -> List[bytes]:
+    """
+    Cut the content of a file into content-defined chunks of whole lines.
+
+    Args:
+        data (bytes): The content of the file.
+        mask (int): A chunk ends after a line whose hash has these bits cleared.
+        max_lines (int): Upper bound of the lines of a chunk.
+
+    Returns:
+        List[bytes]: The chunks, new line separated lines without a trailing new line.
+    """
+    return list(iter_chunks((data,), mask, max_lines))
+
+
+def chunk_lines(chunk: bytes, normalize: Callable[[str], str] = str.strip) -> List[str]:
+    """Return the lines of a chunk as they are held in the live set."""
+    return list(map(normalize, chunk.decode('utf-8', errors='replace').split('\n')))
+
+
+class DiffReader:
+    """
+    Follows a corpus file rewritten in place with mostly unchanged content.
+
+    The reader keeps the keys of the lines of every chunk of the loaded file by digest,
+    and the number of extra copies of the lines present more than once, so that deleting
+    one copy of a duplicated line keeps it in the live set.
+
+    Args:
+        path (str): Path to the corpus file.
+        normalize (Callable[[str], str]): Turns a line into its key in the live set.
+    """
+
+    def __init__(self, path: str, normalize: Callable[[str], str] = str.strip):
+        self.path: str = path
+        self.normalize: Callable[[str], str] = normalize
+        self.stat: tuple = ()
+        # the keys of the lines of the chunks of the loaded file by digest, and how many
+        # times each chunk occurs
+        self.chunks: Dict[bytes, Tuple[str, ...]] = {}
+        self.chunk_counts: Counter = Counter()
+        # extra copies of the lines held more than once by the file
+        self.duplicates: Dict[str, int] = {}
+        # lines inserted into and deleted from the live set by the last update
+        self.inserted: int = 0
+        self.deleted: int = 0
+        # the bytes and the lines read by the last load or update
+        self.read_counts: ReadCounter = ReadCounter()
+
+    def load(self) -> Set[str]:
+        """
+        Read the whole file and remember its chunks.
+
+        Returns:
+            Set[str]: The stripped lines of the file.
+        """
+        lines: Set[str] = set()
+        self.chunks, self.chunk_counts, self.duplicates = {}, Counter(), {}
+        self._apply(self._read(), lines)
+        return lines
+
+    def changed(self) -> bool:
+        """Check with a single stat whether the file may have been rewritten."""
+        try:
+            return self._stat(os.stat(self.path)) != self.stat
+        except OSError:
+            return False
+
+    def update(self, lines: Set[str]) -> Optional[int]:
+        """
+        Apply the lines of the chunks that appeared or disappeared since the last load
+        or update to the live set.
+
+        Args:
+            lines (Set[str]): The live set of lines, updated in place.
+
+        Returns:
+            Optional[int]: The number of lines inserted into or deleted from the live set.
+        """
+        if not self.changed():
+            self.inserted = self.deleted = 0
+            return 0
+        self._apply(self._read(), lines)
+        return self.inserted + self.deleted
+
+    def _read(self) -> Counter:
+        """
+        Read the file block by block and count its chunks by digest, only the lines of the
+        chunks not seen before are decoded.
+        """
+        counts: Counter = Counter()
+        self.read_counts = ReadCounter()
+        with open_corpus(self.path, binary=True) as f:
+            self.stat = self._stat(os.fstat(f.fileno()))
+            blocks = map(self.read_counts.count, iter(lambda: f.read(READ_BLOCK_SIZE), b''))
+            for chunk in iter_chunks(blocks):
+                digest: bytes = hashlib.blake2b(chunk, digest_size=16).digest()
+                counts[digest] += 1
+                if digest not in self.chunks:
+                    self.chunks[digest] = tuple(chunk_lines(chunk, self.normalize))
+        return counts
+
+    def _apply(self, counts: Counter, lines: Set[str]):
+        """Insert the lines of the new chunks, then delete the lines of the removed chunks."""
+        self.inserted = self.deleted = 0
+        # the insertions come first so a line moved to another chunk is never missing
+        for digest, count in (counts - self.chunk_counts).items():
+            for _ in range(count):
+                for line in self.chunks[digest]:
+                    if line in lines:
+                        self.duplicates[line] = self.duplicates.get(line, 0) + 1
+                    else:
+                        lines.add(line)
+                        self.inserted += 1
+        for digest, count in (self.chunk_counts - counts).items():
+            for _ in range(count):
+                for line in self.chunks[digest]:
+                    extra: int = self.duplicates.get(line, 0)
+                    if extra > 1:
+                        self.duplicates[line] = extra - 1
+                    elif extra:
+                        del self.duplicates[line]
+                    else:
+                        lines.discard(line)
+                        self.deleted += 1
+        for digest in set(self.chunk_counts) - set(counts):
+            del self.chunks[digest]
+        self.chunk_counts = counts
+
+    @staticmethod
+    def _stat(info: os.stat_result) -> tuple:
+        """The fields of a stat result that change when the file is rewritten."""
+        return info.st_dev, info.st_ino, info.st_size, info.st_mtime_ns
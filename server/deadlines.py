@@ -0,0 +1,159 @@
+"""
+This module implements the connection deadlines of the server.
+
+All the deadlines of all the connections are kept in a single heap served by one
+timer thread, instead of a timeout poll on every socket. A client thread arms a
+deadline before a blocking step (TLS handshake, reading a request, waiting for the
+next request, sending a response) and cancels it when the step is done. When a
+deadline expires first, the timer thread shuts the socket down, which wakes up the
+blocked client thread with an error or an end of file, and the expiry is counted by kind.
+
+Cancelled deadlines are removed lazily, the heap is compacted when they make up
+more than half of it.
+"""
+
+# the socket of an expired deadline is shut down
+import socket
+
+# the deadlines are kept in a heap ordered by expiry time
+import heapq
+
+# the timer thread and its condition
+import threading
+
+# monotonic clock used for the deadlines
+import time
+
+# static typing
+from typing import Callable, List, Optional, Tuple
+
+# kinds of deadlines, used as metric labels
+HANDSHAKE: str = 'handshake'
+READ: str = 'read'
+IDLE: str = 'idle'
+WRITE: str = 'write'
+
+
+class Deadline:
+    """
+    A deadline armed on a socket.
+
+    Args:
+        connection (Optional[socket.socket]): The socket shut down on expiry.
+        kind (str): The kind of deadline i.e. handshake, read, idle or write.
+        expires_at (float): The expiry time on the monotonic clock.
+    """
+    __slots__ = ('connection', 'kind', 'expires_at', 'cancelled', 'expired')
+
+    def __init__(self, connection: Optional[socket.socket], kind: str, expires_at: float):
+        self.connection: Optional[socket.socket] = connection
+        self.kind: str = kind
+        self.expires_at: float = expires_at
+        self.cancelled: bool = False
+        # set by the timer thread when the deadline fired before being cancelled
+        self.expired: bool = False
+
+
+# returned when a deadline is disabled (timeout of 0), it never expires
+NO_DEADLINE: Deadline = Deadline(None, '', float('inf'))
+
+
+class DeadlineScheduler:
+    """
+    Single timer structure enforcing the deadlines of all the connections.
+
+    Args:
+        on_timeout (Optional[Callable[[str], None]]): Called with the kind of every expired
+        deadline, i.e. to count the timeouts.
+    """
+
+    def __init__(self, on_timeout: Optional[Callable[[str], None]] = None):
+        self._on_timeout: Optional[Callable[[str], None]] = on_timeout
+        self._heap: List[Tuple[float, int, Deadline]] = []
+        self._sequence: int = 0
+        self._cancelled: int = 0
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def arm(self, connection: socket.socket, kind: str, seconds: float) -> Deadline:
+        """
+        Arm a deadline on the socket.
+
+        Args:
+            connection (socket.socket): The socket shut down if the deadline expires.
+            kind (str): The kind of deadline i.e. handshake, read, idle or write.
+            seconds (float): Time allowed from now, 0 or less disables the deadline.
+
+        Returns:
+            Deadline: The deadline to pass to cancel() once the step is done.
+        """
+        if seconds <= 0:
+            return NO_DEADLINE
+        deadline = Deadline(connection, kind, time.monotonic() + seconds)
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='deadline-timer',
+                                                daemon=True)
+                self._thread.start()
+            self._sequence += 1
+            heapq.heappush(self._heap, (deadline.expires_at, self._sequence, deadline))
+            # the timer thread only needs waking up when the earliest deadline changed
+            if self._heap[0][2] is deadline:
+                self._condition.notify()
+        return deadline
+
+    def cancel(self, deadline: Deadline):
+        """
+        Cancel a deadline whose step completed in time.
+
+        Args:
+            deadline (Deadline): The deadline returned by arm().
+        """
+        if deadline is NO_DEADLINE:
+            return
+        with self._condition:
+            if deadline.cancelled or deadline.expired:
+                return
+            deadline.cancelled = True
+            deadline.connection = None
+            self._cancelled += 1
+            if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def pending(self) -> int:
+        """Return the number of armed deadlines that are neither cancelled nor expired."""
+        with self._condition:
+            return len(self._heap) - self._cancelled
+
+    def _run(self):
+        """Body of the timer thread, expires the deadlines in order."""
+        while True:
+            expired: List[Deadline] = []
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                now = time.monotonic()
+                while self._heap and self._heap[0][0] <= now:
+                    _, _, deadline = heapq.heappop(self._heap)
+                    if deadline.cancelled:
+                        self._cancelled -= 1
+                    else:
+                        deadline.expired = True
+                        expired.append(deadline)
+                if not expired and self._heap:
+                    self._condition.wait(self._heap[0][0] - now)
+            for deadline in expired:
+                self._expire(deadline)
+
+    def _expire(self, deadline: Deadline):
+        """Report the timeout and shut down the socket of an expired deadline."""
+        if self._on_timeout is not None:
+            self._on_timeout(deadline.kind)
+        try:
+            # the plain socket shutdown also works on SSL sockets without touching the SSL state
+            socket.socket.shutdown(deadline.connection, socket.SHUT_RDWR)
+        except (OSError, TypeError):
+            pass
+        deadline.connection = None
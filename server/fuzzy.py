@@ -0,0 +1,182 @@
+"""
+This module implements the approximate matching of the queries against the corpus.
+
+The index relies on the pigeonhole principle: every line is cut into max_distance + 1
+pieces, and a line within k <= max_distance edits of a query keeps at least one of its
+pieces intact, at most k characters away from its place in the query. The index maps
+every piece (with the line length and the piece number) to its lines, so a lookup only
+probes a few dozen substrings of the query, and the edit distance is only computed for
+the lines sharing one of them, with a bound of k. The index holds max_distance + 1
+entries per line whatever the alphabet, where a deletion index over low entropy lines
+such as the numeric corpus degenerates into huge candidate lists.
+
+A lookup stops at its deadline and reports that its results may be incomplete, so a
+fuzzy query can never hold a client thread for long.
+"""
+
+# the deadline of a lookup
+import time
+
+# static typing
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Set, Tuple, Union
+
+# the candidates are checked against the deadline every this many lines
+DEADLINE_CHECK_INTERVAL: int = 64
+
+
+class FuzzyResult(NamedTuple):
+    """
+    The result of a fuzzy lookup.
+
+    matches: the (distance, line) pairs sorted by distance then line
+    truncated: True if the time budget ran out before all the candidates were checked
+    """
+    matches: List[tuple]
+    truncated: bool
+
+
+def pieces(length: int, count: int) -> List[Tuple[int, int]]:
+    """
+    Cut a line of the given length into count pieces of nearly equal lengths.
+
+    Args:
+        length (int): The length of the line.
+        count (int): The number of pieces.
+
+    Returns:
+        List[Tuple[int, int]]: The start and the end of every piece.
+    """
+    bounds: List[int] = [length * number // count for number in range(count + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def bounded_distance(first: str, second: str, bound: int) -> int:
+    """
+    Levenshtein distance of two strings, computed only while it can stay within the bound.
+
+    Args:
+        first (str): The first string.
+        second (str): The second string.
+        bound (int): The largest distance of interest.
+
+    Returns:
+        int: The distance, or bound + 1 if it is larger than the bound.
+    """
+    if abs(len(first) - len(second)) > bound:
+        return bound + 1
+    if first == second:
+        return 0
+    previous: List[int] = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, 1):
+        current: List[int] = [row]
+        for column, second_char in enumerate(second, 1):
+            current.append(min(previous[column] + 1, current[column - 1] + 1,
+                               previous[column - 1] + (first_char != second_char)))
+        # every later row is at least the minimum of this one
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+    return previous[-1] if previous[-1] <= bound else bound + 1
+
+
+class FuzzyIndex:
+    """
+    Partition index of the corpus lines for approximate lookups.
+
+    Args:
+        lines (Iterable[str]): The lines of the corpus, as held in the index.
+        max_distance (int): The largest edit distance a lookup can ask for.
+    """
+
+    def __init__(self, lines: Iterable[str], max_distance: int = 2):
+        self.max_distance: int = max_distance
+        self.lines: List[str] = list(lines)
+        # most pieces belong to a single line, stored as an int instead of a list
+        self.pieces: Dict[str, Union[int, List[int]]] = {}
+        count: int = max_distance + 1
+        # the pieces only depend on the line length, they are cut once per length
+        layouts: Dict[int, List[Tuple[int, int, int]]] = {}
+        add = self._add
+        for line_id, line in enumerate(self.lines):
+            layout = layouts.get(len(line))
+            if layout is None:
+                layout = [(number, start, end)
+                          for number, (start, end) in enumerate(pieces(len(line), count))]
+                layouts[len(line)] = layout
+            for number, start, end in layout:
+                add(f'{len(line)}:{number}:{line[start:end]}', line_id)
+
+    @staticmethod
+    def key(length: int, number: int, piece: str) -> str:
+        """The key of a piece, prefixed with the line length and the piece number."""
+        return f'{length}:{number}:{piece}'
+
+    def _add(self, key: str, line_id: int):
+        """Register a line under the key of one of its pieces."""
+        line_ids = self.pieces.get(key)
+        if line_ids is None:
+            self.pieces[key] = line_id
+        elif isinstance(line_ids, int):
+            self.pieces[key] = [line_ids, line_id]
+        else:
+            line_ids.append(line_id)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def candidates(self, query: str, distance: int) -> Iterator[int]:
+        """
+        Generate the lines sharing an intact piece with the query, possibly several times.
+
+        Args:
+            query (str): The query.
+            distance (int): The largest edit distance of the lookup.
+
+        Returns:
+            Iterator[int]: The ids of the candidate lines.
+        """
+        count: int = self.max_distance + 1
+        for length in range(max(0, len(query) - distance), len(query) + distance + 1):
+            for number, (start, end) in enumerate(pieces(length, count)):
+                # the piece moves by at most distance characters in the query
+                for shift in range(max(0, start - distance),
+                                   min(start + distance, len(query) - (end - start)) + 1):
+                    line_ids = self.pieces.get(
+                        self.key(length, number, query[shift:shift + end - start]))
+                    if line_ids is None:
+                        continue
+                    if isinstance(line_ids, int):
+                        yield line_ids
+                    else:
+                        yield from line_ids
+
+    def search(self, query: str, max_distance: int, limit: int, deadline: float) -> FuzzyResult:
+        """
+        Find the lines within max_distance edits of the query.
+
+        Args:
+            query (str): The query, normalized like the lines.
+            max_distance (int): The largest edit distance, capped to the one of the index.
+            limit (int): The maximum number of matches returned.
+            deadline (float): Time of the monotonic clock at which the lookup stops.
+
+        Returns:
+            FuzzyResult: The closest matches, and whether the lookup ran out of time.
+        """
+        distance: int = max(0, min(max_distance, self.max_distance))
+        matches: List[tuple] = []
+        seen: Set[int] = set()
+        # every candidate counts towards the deadline checks, the duplicates too, so a
+        # query whose candidates are mostly duplicates still stops on time
+        for position, line_id in enumerate(self.candidates(query, distance), 1):
+            if position % DEADLINE_CHECK_INTERVAL == 0 and time.monotonic() > deadline:
+                matches.sort()
+                return FuzzyResult(matches[:limit], True)
+            if line_id in seen:
+                continue
+            seen.add(line_id)
+            line_distance: int = bounded_distance(query, self.lines[line_id], distance)
+            if line_distance <= distance:
+                matches.append((line_distance, self.lines[line_id]))
+        matches.sort()
+        return FuzzyResult(matches[:limit], False)
@@ -0,0 +1,172 @@
+"""
+This module implements the hash array engine of the batch lookups.
+
+The engine holds the 64 bit hashes of the corpus lines in a sorted NumPy array, next to
+the lines in the same order. A batch of queries is hashed, sorted, and resolved with one
+vectorized searchsorted; the candidate hits are then confirmed against the actual lines
+with one vectorized comparison, so a hash collision is never reported as a match. Only
+the queries whose hash equals the hash of another line are checked one by one.
+
+The hashes are the built-in hash() of the lines, which is cached by the strings of the
+index and differs between processes, so an engine is never shared between processes.
+
+NumPy is an optional dependency (pip install numpy), needed for this engine only.
+
+Compare the engine with the set lookups of the server on a generated corpus with:
+
+    python -m server.hash_array --lines 1000000 --queries 100000
+"""
+
+# command line of the benchmark
+import argparse
+
+# timing of the benchmark
+import time
+
+# queries of the benchmark
+import random
+
+# static typing
+from typing import Iterable, List, Sequence
+
+try:
+    # the vectorized engine
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# whether the engine can be built, the server refuses to start with it otherwise
+NUMPY_AVAILABLE: bool = np is not None
+
+
+class HashArrayIndex:
+    """
+    Sorted array of the hashes of the corpus lines, for vectorized batch lookups.
+
+    Args:
+        lines (Iterable): The lines of the index, str or bytes, without duplicates.
+
+    Raises:
+        ImportError: If NumPy is not installed.
+    """
+
+    def __init__(self, lines: Iterable):
+        if np is None:
+            raise ImportError('the hash_array engine needs NumPy, install it with '
+                              'pip install numpy')
+        lines = list(lines)
+        hashes = np.fromiter(map(hash, lines), dtype=np.int64, count=len(lines))
+        order = np.argsort(hashes, kind='stable')
+        self.hashes = hashes[order]
+        # an object array so the candidate lines are compared in one vectorized operation
+        self.lines = np.empty(len(lines), dtype=object)
+        self.lines[:] = lines
+        self.lines = self.lines[order]
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def __contains__(self, query) -> bool:
+        query_hash: int = hash(query)
+        return self._confirm(int(np.searchsorted(self.hashes, query_hash)), query_hash, query)
+
+    def _confirm(self, position: int, query_hash: int, query) -> bool:
+        """Compare the query with every line of the run of lines sharing its hash."""
+        while position < len(self.hashes) and self.hashes[position] == query_hash:
+            if self.lines[position] == query:
+                return True
+            position += 1
+        return False
+
+    def contains_batch(self, queries: Sequence) -> bytes:
+        """
+        Look a batch of queries up with vectorized operations.
+
+        Args:
+            queries (Sequence): The queries, str or bytes like the lines.
+
+        Returns:
+            bytes: One byte per query, 1 if it was found and 0 if not, like the results
+            of the BATCH frames.
+        """
+        count: int = len(queries)
+        if not count or not len(self.hashes):
+            return b'0' * count
+        query_hashes = np.fromiter(map(hash, queries), dtype=np.int64, count=count)
+        # sorted queries walk the hash array in order, which is far more cache friendly
+        order = np.argsort(query_hashes)
+        positions = np.empty(count, dtype=np.intp)
+        positions[order] = np.searchsorted(self.hashes, query_hashes[order])
+        np.minimum(positions, len(self.hashes) - 1, out=positions)
+        candidates = np.flatnonzero(self.hashes[positions] == query_hashes)
+        query_array = np.empty(count, dtype=object)
+        query_array[:] = queries
+        confirmed = self.lines[positions[candidates]] == query_array[candidates]
+        results = np.full(count, ord('0'), dtype=np.uint8)
+        results[candidates[confirmed]] = ord('1')
+        # a query sharing its hash with another line may still match a later line of the run
+        for candidate in candidates[~confirmed].tolist():
+            if self._confirm(int(positions[candidate]) + 1, int(query_hashes[candidate]),
+                             queries[candidate]):
+                results[candidate] = ord('1')
+        return results.tobytes()
+
+
+def benchmark(lines: List[str], queries: List[str], repeat: int = 5) -> dict:
+    """
+    Time the batch lookups of the set index and of the hash array engine.
+
+    Args:
+        lines (List[str]): The lines of the corpus.
+        queries (List[str]): The batch of queries.
+        repeat (int): Number of runs, the best one is kept.
+
+    Returns:
+        dict: The build time of both indexes and the best batch time of both engines,
+        in seconds.
+    """
+    start: float = time.perf_counter()
+    line_set = set(lines)
+    set_build: float = time.perf_counter() - start
+    start = time.perf_counter()
+    engine = HashArrayIndex(line_set)
+    engine_build: float = time.perf_counter() - start
+    set_times: List[float] = []
+    engine_times: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        expected: bytes = bytes(0x31 if query in line_set else 0x30 for query in queries)
+        set_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        results: bytes = engine.contains_batch(queries)
+        engine_times.append(time.perf_counter() - start)
+        assert results == expected, 'the engines disagree'
+    return {'set_build': set_build, 'hash_array_build': engine_build,
+            'set_batch': min(set_times), 'hash_array_batch': min(engine_times)}
+
+
+def main():
+    """Compare the set lookups and the hash array engine on a generated corpus."""
+    # the generator of the benchmark corpora, only needed by the benchmark
+    from generate_text import CorpusSpec, generate_chunk  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description='Benchmark the hash array engine.')
+    parser.add_argument('--lines', type=int, default=1000000, help='lines of the corpus')
+    parser.add_argument('--queries', type=int, default=100000, help='queries of the batch')
+    parser.add_argument('--hit-ratio', type=float, default=0.5,
+                        help='fraction of the queries found in the corpus')
+    parser.add_argument('--seed', type=int, default=1)
+    arguments = parser.parse_args()
+    spec = CorpusSpec(arguments.lines, arguments.seed, 0.0, 0, 0, 'uniform', None)
+    lines: List[str] = [line.strip() for line in generate_chunk(spec, 0, spec.size)]
+    generator = random.Random(arguments.seed)
+    queries: List[str] = [generator.choice(lines) if generator.random() < arguments.hit_ratio
+                          else f'missing;{number};' for number in range(arguments.queries)]
+    timings: dict = benchmark(lines, queries)
+    print(f'{arguments.lines} lines, batch of {arguments.queries} queries')
+    for name, seconds in timings.items():
+        print(f'{name:>18}: {seconds * 1000:9.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+This module implements the memory and build cost accounting of the corpus indexes.
+
+Every index build is measured (wall time, resident set size before and after, and the
+peak of the resident set size sampled while the build runs) and the footprint of the
+built structure is estimated by walking it with sys.getsizeof, the large containers and
+NumPy object arrays from a sample of their elements. The estimate of a structure includes
+the strings it references, including the elements of its NumPy object arrays,
+so the lines shared by several indexes are counted once per index, which is the memory
+each index would need on its own. The size and the lines of the corpus file are counted
+while the build reads it, the file is never read again for the statistics.
+
+The report is a JSON document, served by the admin listener and written to a file.
+"""
+
+# the report is written and served as JSON
+import json
+
+# for the resident set size and the atomic replacement of the report file
+import os
+
+# for the sizes of the objects
+import sys
+
+# the build time and the build date
+import time
+
+# the builds of several threads are recorded in the same report
+import threading
+
+# the elements of the large containers are sampled
+from itertools import islice
+
+# static typing
+from typing import Dict, Optional
+
+try:
+    # peak resident set size of the process, not available on Windows
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+# interval in seconds between two samples of the resident set size during a build
+RSS_SAMPLE_SECONDS: float = 0.01
+
+# elements measured per container by estimate_bytes, the larger containers are sampled
+SAMPLE_SIZE: int = 1000
+
+# the containers walked by estimate_bytes, the other objects are walked through __dict__
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+# objects that are not part of a structure, i.e. the functions held as attributes
+_SKIPPED = (type, type(len), type(lambda: None), type(sys))
+
+
+def rss_bytes() -> Optional[int]:
+    """
+    Return the resident set size of the process.
+
+    Returns:
+        Optional[int]: The resident set size in bytes, None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm', encoding='ascii') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    Return the peak resident set size of the process since it started, not of a build.
+
+    Returns:
+        Optional[int]: The peak resident set size in bytes, None if it can not be measured.
+    """
+    if resource is None:
+        return None
+    peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class ReadCounter:
+    """
+    Counts the bytes and the lines of a corpus file from the blocks a build reads.
+    """
+
+    def __init__(self):
+        self.raw_bytes: int = 0
+        self._new_lines: int = 0
+        self._last: bytes = b'\n'
+
+    def count(self, block: bytes) -> bytes:
+        """
+        Count a block of the file.
+
+        Args:
+            block (bytes): The next block of the file.
+
+        Returns:
+            bytes: The block, so the counter can be called on the read path.
+        """
+        if block:
+            self.raw_bytes += len(block)
+            self._new_lines += block.count(b'\n')
+            self._last = block[-1:]
+        return block
+
+    @property
+    def lines(self) -> int:
+        """The number of lines counted, a last line without a new line character included."""
+        return self._new_lines + (self._last != b'\n')
+
+
+def estimate_bytes(structure, sample_size: int = SAMPLE_SIZE) -> int:
+    """
+    Estimate the memory held by a structure and everything it references.
+
+    The containers larger than sample_size are estimated from an evenly spaced sample of
+    their elements, so estimating an index takes a fraction of the time of building it.
+    A NumPy array counts for its buffer, and an array of objects (i.e. the lines of the
+    hash array engine) also for the objects it references, walked like a list.
+
+    Args:
+        structure: The structure, i.e. a set of lines or an index object. The buffers
+        (memoryview, i.e. of a shared memory segment) count for their nbytes.
+        sample_size (int): The number of elements measured per container.
+
+    Returns:
+        int: The estimated size in bytes, every object measured counted once.
+    """
+    seen: set = set()
+
+    def size(item) -> float:
+        if id(item) in seen or isinstance(item, _SKIPPED):
+            return 0
+        seen.add(id(item))
+        if isinstance(item, memoryview):
+            return item.nbytes
+        total: float = sys.getsizeof(item)
+        # the arrays of objects hold references, the other arrays only their buffer
+        object_array: bool = getattr(getattr(item, 'dtype', None), 'hasobject', False)
+        if isinstance(item, _CONTAINERS) or object_array:
+            elements = item.flat if object_array else item
+            count: int = len(elements)
+            step: int = max(1, count // sample_size)
+            sampled: int = 0
+            sampled_bytes: float = 0
+            if isinstance(item, dict):
+                for key, value in islice(item.items(), 0, None, step):
+                    sampled += 1
+                    sampled_bytes += size(key) + size(value)
+            else:
+                for element in islice(elements, 0, None, step):
+                    sampled += 1
+                    sampled_bytes += size(element)
+            if sampled:
+                total += sampled_bytes * count / sampled
+        elif hasattr(item, '__dict__'):
+            total += size(vars(item))
+        return total
+
+    return round(size(structure))
+
+
+class BuildMeter:
+    """
+    Context manager measuring the wall time and the resident set size of an index build.
+    The peak of the build is the largest resident set size sampled by a thread while the
+    build runs, the peak of the process is only reported by IndexStats.report.
+
+    Args:
+        sample_seconds (float): Interval between two samples of the resident set size.
+    """
+
+    def __init__(self, sample_seconds: float = RSS_SAMPLE_SECONDS):
+        self.seconds: float = 0.0
+        self.rss_before: Optional[int] = None
+        self.rss_after: Optional[int] = None
+        self.peak_rss: Optional[int] = None
+        self._start: float = 0.0
+        self._sample_seconds: float = sample_seconds
+        self._done: threading.Event = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def _sample(self):
+        """Sample the resident set size until the build is done."""
+        while not self._done.wait(self._sample_seconds):
+            rss: Optional[int] = rss_bytes()
+            if rss is not None and rss > self.peak_rss:
+                self.peak_rss = rss
+
+    def __enter__(self) -> 'BuildMeter':
+        self.rss_before = self.peak_rss = rss_bytes()
+        if self.rss_before is not None:
+            self._sampler = threading.Thread(target=self._sample, name='rss-sampler',
+                                             daemon=True)
+            self._sampler.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        self._done.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.rss_after = rss_bytes()
+        if self.rss_after is not None and self.peak_rss is not None:
+            self.peak_rss = max(self.peak_rss, self.rss_after)
+
+
+class IndexStats:
+    """
+    The footprint and the build cost of the last build of every index.
+    """
+
+    def __init__(self):
+        self.indexes: Dict[str, dict] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def record(self, name: str, structure, meter: BuildMeter, **fields) -> dict:
+        """
+        Record the build of an index, replacing the previous build of the same index.
+
+        Args:
+            name (str): Name of the index.
+            structure: The built structure, its size is estimated by estimate_bytes.
+            meter (BuildMeter): The measures of the build.
+            **fields: Extra fields of the entry, i.e. the lines and the bytes of the corpus.
+
+        Returns:
+            dict: The entry of the index in the report.
+        """
+        entry: dict = {
+            'structure': type(structure).__name__,
+            'entries': len(structure),
+            **fields,
+            'estimated_bytes': estimate_bytes(structure),
+            'build_seconds': round(meter.seconds, 6),
+            'rss_before_bytes': meter.rss_before,
+            'rss_after_bytes': meter.rss_after,
+            'peak_rss_bytes': meter.peak_rss,
+            'built_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with self._lock:
+            self.indexes[name] = entry
+        return entry
+
+    def report(self) -> dict:
+        """
+        Build the report of the recorded builds and of the current memory of the process.
+
+        Returns:
+            dict: The report.
+        """
+        with self._lock:
+            indexes: Dict[str, dict] = {name: dict(entry) for name, entry in self.indexes.items()}
+        return {
+            'indexes': indexes,
+            'estimated_bytes': sum(entry['estimated_bytes'] for entry in indexes.values()),
+            'rss_bytes': rss_bytes(),
+            'process_peak_rss_bytes': peak_rss_bytes(),
+        }
+
+    def write(self, path: str):
+        """
+        Write the report to a file, replaced atomically so readers never see a partial file.
+
+        Args:
+            path (str): Path of the report file, its directory is created if needed.
+
+        Raises:
+            OSError: If the file can not be written.
+        """
+        directory: str = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary: str = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
+        os.replace(temporary, path)
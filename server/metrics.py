@@ -0,0 +1,492 @@
+"""
+This module implements the metrics of the server and the optional HTTP listener
+that serves them in the Prometheus text format.
+
+Recording a metric must cost almost nothing on the request path, so the metrics
+do not take a lock when they are updated. Every thread updates its own shard of
+values (a plain list held in thread local storage) and the shards are only summed
+when the metrics are scraped. The shards of the threads that have finished are
+folded into a single retired shard on scrape, and when a new thread creates its
+shard once the shards have doubled since the last fold, so the short-lived client
+threads do not accumulate even when the metrics are never scraped.
+
+A registry created disabled records nothing: its metrics hand out a shared child
+whose updates do nothing, so the request path neither shards nor allocates.
+
+Three kinds of metrics are supported:
+
+counter: a value that only goes up i.e. number of requests
+gauge: a value that goes up and down i.e. active connections, or is computed on scrape
+histogram: the distribution of observed values i.e. request latency
+"""
+
+# bisect module finds the histogram bucket of an observed value
+import bisect
+
+# threads own their shard of the metric values
+import threading
+
+# the admin routes may be restricted to the clients on the same host
+import ipaddress
+
+# HTTP listener that serves the metrics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# parsing of the admin request parameters
+from urllib.parse import parse_qsl, urlsplit
+
+# static typing
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# handler of an extra route of the listener, called with the query parameters
+# and returning the HTTP status and the text body of the response
+RouteHandler = Callable[[Dict[str, str]], Tuple[int, str]]
+
+# default latency buckets in seconds, from 50 microseconds up to 10 seconds
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# number of live shards below which the shards of the finished threads are left for the scrape
+MIN_FOLD_SHARDS: int = 64
+
+
+class _ShardedValues:
+    """
+    Fixed size list of numeric values, sharded per thread.
+
+    Args:
+        size (int): Number of values held by every shard.
+    """
+
+    def __init__(self, size: int):
+        self._size: int = size
+        self._local = threading.local()
+        # the lock is only taken when a thread creates its shard and on scrape
+        self._lock = threading.Lock()
+        self._live: List[Tuple[threading.Thread, List[float]]] = []
+        self._retired: List[float] = [0] * size
+        # the shards are folded again once they have doubled since the last fold
+        self._fold_at: int = MIN_FOLD_SHARDS
+
+    def shard(self) -> List[float]:
+        """
+        Return the shard of the calling thread, creating it on the first call.
+
+        Returns:
+            List[float]: The values owned by the calling thread.
+        """
+        try:
+            return self._local.values
+        except AttributeError:
+            values: List[float] = [0] * self._size
+            self._local.values = values
+            with self._lock:
+                if len(self._live) >= self._fold_at:
+                    self._fold_finished()
+                    self._fold_at = max(MIN_FOLD_SHARDS, 2 * len(self._live))
+                self._live.append((threading.current_thread(), values))
+            return values
+
+    def _fold_finished(self):
+        """Fold the shards of the finished threads into the retired shard, called with the lock."""
+        live: List[Tuple[threading.Thread, List[float]]] = []
+        for thread, values in self._live:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                for index, value in enumerate(values):
+                    self._retired[index] += value
+        self._live = live
+
+    @property
+    def shard_count(self) -> int:
+        """The number of shards not folded yet."""
+        with self._lock:
+            return len(self._live)
+
+    def snapshot(self) -> List[float]:
+        """
+        Sum the shards of all the threads and fold the finished threads into the retired shard.
+
+        Returns:
+            List[float]: The summed values.
+        """
+        with self._lock:
+            self._fold_finished()
+            totals = list(self._retired)
+            for _, values in self._live:
+                for index, value in enumerate(values):
+                    totals[index] += value
+        return totals
+
+
+class _Metric:
+    """
+    Common base of the metrics, holds the name, help text and the labelled children.
+
+    Args:
+        name (str): Name of the metric.
+        documentation (str): Help text of the metric.
+        label_names (Sequence[str]): Names of the labels of the metric.
+        enabled (bool): Whether the updates are recorded.
+    """
+    kind: str = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 enabled: bool = True):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self.enabled: bool = enabled
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *label_values: str):
+        """
+        Return the child of the metric for the given label values, creating it if needed.
+
+        Args:
+            *label_values (str): The label values in the order of label_names.
+
+        Returns:
+            The child metric for the label values.
+        """
+        if not self.enabled:
+            if len(label_values) != len(self.label_names):
+                raise ValueError(f'{self.name} expects labels {self.label_names}, '
+                                 f'got {label_values}')
+            return _DISABLED_CHILD
+        key = tuple(str(value) for value in label_values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f'{self.name} expects labels {self.label_names}, got {key}')
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _new_child(self):
+        """Create a new child of the metric."""
+        raise NotImplementedError
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        """Format the label values of a child as {name="value",...}."""
+        pairs = list(zip(self.label_names, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def render(self) -> List[str]:
+        """
+        Render the metric in the Prometheus text format.
+
+        Returns:
+            List[str]: The lines of the metric.
+        """
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        # the metric without labels is always rendered, even before it is first updated
+        if not self.label_names and not self._children:
+            self.labels()
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key: Tuple[str, ...], child) -> List[str]:
+        """Render one child of the metric."""
+        raise NotImplementedError
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value: float) -> str:
+    """Format a sample value, integers are written without a decimal point."""
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+class _DisabledChild:
+    """The child of every metric of a disabled registry, its updates do nothing."""
+
+    def inc(self, amount: float = 1):
+        """Ignore the increase."""
+
+    def dec(self, amount: float = 1):
+        """Ignore the decrease."""
+
+    def observe(self, value: float):
+        """Ignore the observed value."""
+
+    def set_function(self, function: Callable[[], float]):
+        """Ignore the function."""
+
+
+# shared by all the metrics of the disabled registries
+_DISABLED_CHILD: _DisabledChild = _DisabledChild()
+
+
+class _CounterChild:
+    """A single counter value."""
+
+    def __init__(self):
+        self._values = _ShardedValues(1)
+
+    def inc(self, amount: float = 1):
+        """Increase the counter by amount."""
+        self._values.shard()[0] += amount
+
+    def value(self) -> float:
+        """Return the current value of the counter."""
+        return self._values.snapshot()[0]
+
+
+class Counter(_Metric):
+    """A metric that only goes up, i.e. the number of requests."""
+    kind = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        """Increase the counter without labels by amount."""
+        self.labels().inc(amount)
+
+    def _render_child(self, key: Tuple[str, ...], child: _CounterChild) -> List[str]:
+        return [f'{self.name}{self._format_labels(key)} {_format_number(child.value())}']
+
+
+class _GaugeChild:
+    """A single gauge value, either updated by inc/dec or computed by a callback on scrape."""
+
+    def __init__(self):
+        self._values = _ShardedValues(1)
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1):
+        """Increase the gauge by amount."""
+        self._values.shard()[0] += amount
+
+    def dec(self, amount: float = 1):
+        """Decrease the gauge by amount."""
+        self._values.shard()[0] -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the value of the gauge with function every time it is scraped."""
+        self._function = function
+
+    def value(self) -> float:
+        """Return the current value of the gauge."""
+        if self._function is not None:
+            return self._function()
+        return self._values.snapshot()[0]
+
+
+class Gauge(_Metric):
+    """A metric that goes up and down, i.e. the number of active connections."""
+    kind = 'gauge'
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1):
+        """Increase the gauge without labels by amount."""
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        """Decrease the gauge without labels by amount."""
+        self.labels().dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the gauge without labels with function every time it is scraped."""
+        self.labels().set_function(function)
+
+    def _render_child(self, key: Tuple[str, ...], child: _GaugeChild) -> List[str]:
+        return [f'{self.name}{self._format_labels(key)} {_format_number(child.value())}']
+
+
+class _HistogramChild:
+    """
+    A single histogram, the shard holds one count per bucket, the +Inf count and the sum.
+
+    Args:
+        buckets (Tuple[float, ...]): The sorted upper bounds of the buckets.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets: Tuple[float, ...] = buckets
+        self._values = _ShardedValues(len(buckets) + 2)
+
+    def observe(self, value: float):
+        """Record an observed value."""
+        values = self._values.shard()
+        values[bisect.bisect_left(self._buckets, value)] += 1
+        values[-1] += value
+
+    def snapshot(self) -> Tuple[List[float], float]:
+        """Return the per bucket counts (including +Inf) and the sum of the observed values."""
+        values = self._values.snapshot()
+        return values[:-1], values[-1]
+
+
+class Histogram(_Metric):
+    """
+    A metric that records the distribution of observed values, i.e. request latency.
+
+    Args:
+        name (str): Name of the metric.
+        documentation (str): Help text of the metric.
+        label_names (Sequence[str]): Names of the labels of the metric.
+        buckets (Sequence[float]): The upper bounds of the buckets.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, enabled: bool = True):
+        super().__init__(name, documentation, label_names, enabled)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        """Record an observed value on the histogram without labels."""
+        self.labels().observe(value)
+
+    def _render_child(self, key: Tuple[str, ...], child: _HistogramChild) -> List[str]:
+        counts, total = child.snapshot()
+        lines: List[str] = []
+        cumulative: float = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            upper = '+Inf' if bound == float('inf') else repr(bound)
+            labels = self._format_labels(key, ('le', upper))
+            lines.append(f'{self.name}_bucket{labels} {_format_number(cumulative)}')
+        labels = self._format_labels(key)
+        lines.append(f'{self.name}_sum{labels} {_format_number(total)}')
+        lines.append(f'{self.name}_count{labels} {_format_number(cumulative)}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds all the metrics of the server and renders them for a scrape.
+
+    Args:
+        enabled (bool): Whether the updates of the metrics are recorded, a disabled
+        registry renders its metrics without samples.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled: bool = enabled
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        """Create and register a counter."""
+        return self._register(Counter(name, documentation, label_names, self.enabled))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        """Create and register a gauge."""
+        return self._register(Gauge(name, documentation, label_names, self.enabled))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Create and register a histogram."""
+        return self._register(Histogram(name, documentation, label_names, buckets,
+                                        self.enabled))
+
+    def render(self) -> str:
+        """
+        Render all the registered metrics in the Prometheus text format.
+
+        Returns:
+            str: The text served to Prometheus.
+        """
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler serving GET /metrics from the registry attached to the HTTP server,
+    and the extra routes (i.e. admin commands) registered on the server.
+    """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve the metrics or an extra route, any other path is answered with 404."""
+        url = urlsplit(self.path)
+        if url.path == '/metrics' and self.server.registry is not None:
+            status, text = 200, self.server.registry.render()
+        elif url.path in self.server.routes:
+            if url.path in self.server.local_routes and not is_local_client(self.client_address[0]):
+                self.send_error(403)
+                return
+            status, text = self.server.routes[url.path](dict(parse_qsl(url.query)))
+        else:
+            self.send_error(404)
+            return
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """The scrapes are not logged, they would flood the output."""
+
+
+def is_local_client(address: str) -> bool:
+    """Return whether the address of an HTTP client is a loopback address."""
+    try:
+        return ipaddress.ip_address(address).is_loopback
+    except ValueError:
+        return False
+
+
+def start_metrics_server(port: int, registry: Optional[MetricsRegistry], host: str = '0.0.0.0',
+                         routes: Optional[Dict[str, RouteHandler]] = None,
+                         local_routes: Iterable[str] = ()) -> ThreadingHTTPServer:
+    """
+    Start the HTTP listener serving the metrics on its own daemon thread.
+
+    Args:
+        port (int): The port the metrics are served on, separate from the search port.
+        registry (Optional[MetricsRegistry]): The registry whose metrics are served, None
+        serves only the extra routes and answers /metrics with 404.
+        host (str): The interface the listener binds to.
+        routes (Optional[Dict[str, RouteHandler]]): Extra paths served by the listener,
+        i.e. the admin commands of the server.
+        local_routes (Iterable[str]): Extra paths only answered to the clients on the same
+        host, the other clients get 403.
+
+    Returns:
+        ThreadingHTTPServer: The running HTTP server, call shutdown() on it to stop it.
+    """
+    http_server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    http_server.daemon_threads = True
+    http_server.registry = registry
+    http_server.routes = dict(routes or {})
+    http_server.local_routes = frozenset(local_routes)
+    threading.Thread(target=http_server.serve_forever, name='metrics-listener',
+                     daemon=True).start()
+    return http_server
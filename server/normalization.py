@@ -0,0 +1,86 @@
+"""
+This module implements the normalization of the corpus lines and of the queries.
+
+The normalization pipeline is configured as a comma separated list of steps, it runs
+once per line when the index is built and once per query, so a normalized lookup is
+still a single set membership test.
+
+Steps:
+
+nfc or nfkc: Unicode normalization form (at most one of them)
+casefold: case insensitive matching with str.casefold
+whitespace: surrounding whitespace removed and inner whitespace runs collapsed to one space
+"""
+
+# Unicode normalization forms
+import unicodedata
+
+# static typing
+from typing import Callable, Optional
+
+# the normalization steps
+NFC: str = 'nfc'
+NFKC: str = 'nfkc'
+CASEFOLD: str = 'casefold'
+WHITESPACE: str = 'whitespace'
+
+# all the normalization steps
+STEPS = (NFC, NFKC, CASEFOLD, WHITESPACE)
+
+# a normalization function, from a line or query to its key in the index
+Normalizer = Callable[[str], str]
+
+
+def parse_steps(value: str) -> tuple:
+    """
+    Parse the normalization steps of the configuration file.
+
+    Args:
+        value (str): Comma separated steps, case insensitive, empty for none.
+
+    Returns:
+        tuple: The steps.
+
+    Raises:
+        ValueError: If a step is unknown or both nfc and nfkc are given.
+    """
+    steps = tuple(step.strip().lower() for step in value.split(',') if step.strip())
+    for step in steps:
+        if step not in STEPS:
+            raise ValueError(f'invalid normalization step {step!r}, '
+                             f'expected some of {", ".join(STEPS)}')
+    if NFC in steps and NFKC in steps:
+        raise ValueError('nfc and nfkc normalization are exclusive')
+    return steps
+
+
+def build_normalizer(value: str) -> Optional[Normalizer]:
+    """
+    Build the normalization function of the configured steps.
+
+    Args:
+        value (str): Comma separated steps i.e. "nfkc,casefold,whitespace".
+
+    Returns:
+        Optional[Normalizer]: The function applied to the lines and the queries,
+        None when no step is configured and the matching is exact.
+    """
+    steps = parse_steps(value)
+    if not steps:
+        return None
+    form: Optional[str] = NFKC.upper() if NFKC in steps else NFC.upper() if NFC in steps else None
+    casefold: bool = CASEFOLD in steps
+    whitespace: bool = WHITESPACE in steps
+
+    def normalize(text: str) -> str:
+        text = text.strip()
+        # most of the text is already normalized, checking is cheaper than normalizing
+        if form is not None and not text.isascii() and not unicodedata.is_normalized(form, text):
+            text = unicodedata.normalize(form, text)
+        if casefold:
+            text = text.casefold()
+        if whitespace:
+            text = ' '.join(text.split())
+        return text
+
+    return normalize
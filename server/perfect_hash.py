@@ -0,0 +1,422 @@
+"""
+This module implements the static perfect hash index of the read-only corpora.
+
+A corpus that does not change between deploys is preprocessed once into a minimal perfect
+hash table: every unique normalized line gets its own slot, there are exactly as many slots
+as lines, so no slot is wasted and a lookup never probes. The table is built with the hash
+and displace method (CHD): the lines are split into small buckets, and every bucket gets the
+displacement that sends its lines to free slots, the largest buckets first. The single line
+buckets left at the end are sent straight to the remaining free slots.
+
+    file: header | displacement of every bucket | offset of every slot | line bytes
+
+The displacements and the offsets are 32 bit (64 bit for the files of 4 GiB or more)
+integers in the byte order of the machine that built them. The line bytes are the UTF-8
+lines in slot order, a query is compared with the line of its slot, so the missing queries
+are never reported. The server maps the file with mmap and reads the arrays in place, so
+loading it costs almost nothing and its pages are shared by the processes of the host.
+
+The hashes are 128 bit BLAKE2b digests salted with the seed of the table, since the
+built-in hash() differs between processes. Build, check and benchmark the table with:
+
+    python -m server.perfect_hash build data/200k.txt data/200k.phf
+    python -m server.perfect_hash verify data/200k.txt data/200k.phf
+    python -m server.perfect_hash bench data/200k.txt data/200k.phf
+"""
+
+# command line of the preprocessing
+import argparse
+
+# the hash shared by all the processes
+import hashlib
+
+# mapping of the table file
+import mmap
+
+# atomic replacement of the table file
+import os
+
+# queries of the benchmark
+import random
+
+# layout of the header of the table file
+import struct
+
+# duration of the preprocessing and of the benchmark
+import time
+
+# the arrays written to the table file
+from array import array
+
+# the normalization of the lines, the same as the one of the servers
+from server.normalization import build_normalizer
+
+# the corpus file may be compressed
+from server.compressed import open_corpus
+
+# memory held by the set of lines in the benchmark
+from server.index_stats import estimate_bytes
+
+# the set lookups the table is compared with
+from search_algorithms import hash_search
+
+# static typing
+from typing import Callable, List, Optional, Tuple
+
+# identifies a table file
+MAGIC: bytes = b'PHFX'
+
+# version of the layout
+VERSION: int = 1
+
+# magic, version, seed, size of an offset, line count, bucket count, size of the line bytes
+HEADER = struct.Struct('<4sIIIQQQ')
+
+# the salt of the hashes, derived from the seed of the table
+SALT = struct.Struct('<Q')
+
+# default average number of lines per bucket, more buckets build faster but take more room
+DEFAULT_BUCKET_SIZE: int = 3
+
+# a displacement d moves the lines of a bucket d % STEPS steps and d // STEPS slots further,
+# the shifts reach every slot even from a step sharing a large factor with the slot count
+STEPS: int = 64
+
+# number of seeds tried before the build gives up, a seed fails when two lines of a bucket
+# share their first slot and their step
+MAX_SEEDS: int = 16
+
+
+def seeded_hash(seed: int):
+    """The BLAKE2b hash salted with a seed, copied for every line."""
+    return hashlib.blake2b(digest_size=16, salt=SALT.pack(seed))
+
+
+def slot_hashes(key: bytes, hasher, bucket_count: int, slot_count: int) -> Tuple[int, int, int]:
+    """
+    Hashes of a line in a table, the same in every process.
+
+    Args:
+        key (bytes): The UTF-8 bytes of the line.
+        hasher: The seeded hash of the table, see seeded_hash.
+        bucket_count (int): The number of buckets of the table.
+        slot_count (int): The number of slots of the table, at least 1.
+
+    Returns:
+        Tuple[int, int, int]: The bucket of the line, and the first slot and the step of
+        its displaced slots, see displaced.
+    """
+    line_hasher = hasher.copy()
+    line_hasher.update(key)
+    value: int = int.from_bytes(line_hasher.digest(), 'little')
+    return value % bucket_count, (value >> 64) % slot_count, (value >> 32) % slot_count
+
+
+def displaced(first: int, step: int, displacement: int, slot_count: int) -> int:
+    """The slot of a line moved by the displacement of its bucket."""
+    return (first + displacement % STEPS * step + displacement // STEPS) % slot_count
+
+
+def place(keys: List[bytes], seed: int, bucket_count: int,
+          max_trials: int) -> Optional[Tuple[array, List[bytes]]]:
+    """
+    Find a displacement for every bucket so that every line gets its own slot.
+
+    A displacement d is stored as d << 1, a line sent straight to slot s as s << 1 | 1.
+
+    Args:
+        keys (List[bytes]): The unique lines.
+        seed (int): The seed of the hashes.
+        bucket_count (int): The number of buckets.
+        max_trials (int): The number of displacements tried per bucket.
+
+    Returns:
+        Optional[Tuple[array, List[bytes]]]: The displacements of the buckets and the lines in
+        slot order, None if a bucket could not be placed with this seed.
+    """
+    slot_count: int = len(keys)
+    buckets: List[List[Tuple[int, int, bytes]]] = [[] for _ in range(bucket_count)]
+    hasher = seeded_hash(seed)
+    for key in keys:
+        bucket, first, step = slot_hashes(key, hasher, bucket_count, slot_count)
+        buckets[bucket].append((first, step, key))
+    slots: List[Optional[bytes]] = [None] * slot_count
+    displacements = array('I', bytes(4 * bucket_count))
+    order: List[int] = sorted(range(bucket_count), key=lambda index: -len(buckets[index]))
+    singles: int = 0
+    for index in order:
+        bucket = buckets[index]
+        if len(bucket) < 2:
+            break
+        singles += 1
+        for displacement in range(max_trials):
+            positions = [displaced(first, step, displacement, slot_count)
+                         for first, step, _ in bucket]
+            if (len(set(positions)) == len(positions)
+                    and all(slots[position] is None for position in positions)):
+                break
+        else:
+            return None
+        for position, (_, _, key) in zip(positions, bucket):
+            slots[position] = key
+        displacements[index] = displacement << 1
+    # the buckets of one line take the free slots left, without any search
+    free = (position for position in range(slot_count) if slots[position] is None)
+    for index in order[singles:]:
+        if not buckets[index]:
+            break
+        position: int = next(free)
+        slots[position] = buckets[index][0][2]
+        displacements[index] = position << 1 | 1
+    return displacements, slots
+
+
+def build(source: str, destination: str, bucket_size: int = DEFAULT_BUCKET_SIZE,
+          normalize: Callable[[str], str] = str.strip) -> int:
+    """
+    Preprocess a corpus into the minimal perfect hash table of its unique lines.
+    The table is written aside and replaced atomically.
+
+    Args:
+        source (str): Path of the corpus file, may be compressed.
+        destination (str): Path of the table file.
+        bucket_size (int): The average number of lines per bucket.
+        normalize (Callable[[str], str]): Turns a line into its key in the table,
+        the servers must normalize their queries the same way.
+
+    Returns:
+        int: The number of unique lines.
+
+    Raises:
+        ValueError: If the corpus has 2**31 unique lines or more, or if no seed places
+        every line.
+    """
+    with open_corpus(source) as f:
+        keys: List[bytes] = sorted({normalize(line).encode('utf-8') for line in f})
+    if len(keys) >= 1 << 31:
+        raise ValueError(f'{source} has too many unique lines for a perfect hash table')
+    bucket_count: int = max(1, -(-len(keys) // bucket_size))
+    # an empty corpus gives an empty table with one bucket
+    placed = (array('I', [0]), [])
+    for seed in range(MAX_SEEDS if keys else 1):
+        if keys:
+            # enough trials for the shifts to reach every slot, the displacements are 31 bit
+            placed = place(keys, seed, bucket_count, min(STEPS * len(keys), 1 << 31))
+        if placed is not None:
+            break
+    else:
+        raise ValueError(f'could not build a perfect hash table of {source}')
+    displacements, slots = placed
+    size: int = sum(map(len, slots))
+    offsets = array('I' if size < 1 << 32 else 'Q', [0])
+    for key in slots:
+        offsets.append(offsets[-1] + len(key))
+    temporary: str = f'{destination}.{os.getpid()}.tmp'
+    with open(temporary, mode='wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, seed, offsets.itemsize, len(slots), bucket_count,
+                            size))
+        f.write(displacements.tobytes())
+        # the offsets start on a multiple of their size
+        f.write(bytes(-(HEADER.size + len(displacements) * 4) % offsets.itemsize))
+        f.write(offsets.tobytes())
+        f.writelines(slots)
+    os.replace(temporary, destination)
+    return len(slots)
+
+
+class PerfectHash:
+    """
+    Lookups of the lines of a perfect hash table file, read in place through mmap.
+
+    Args:
+        path (str): Path of the table file.
+
+    Raises:
+        OSError: If the file can not be read.
+        ValueError: If the file is not a valid table.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        with open(path, mode='rb') as f:
+            file_size: int = os.fstat(f.fileno()).st_size
+            if file_size < HEADER.size:
+                raise ValueError(f'{path} is not a perfect hash table')
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, seed, itemsize, self.key_count, self.bucket_count, size = \
+            HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION or itemsize not in (4, 8):
+            self.data.close()
+            raise ValueError(f'{path} is not a perfect hash table')
+        self.hasher = seeded_hash(seed)
+        start: int = HEADER.size + self.bucket_count * 4
+        start += -start % itemsize
+        self.keys_start: int = start + (self.key_count + 1) * itemsize
+        if file_size != self.keys_start + size:
+            self.data.close()
+            raise ValueError(f'{path} is truncated')
+        view = memoryview(self.data)
+        self.displacements: memoryview = view[HEADER.size:HEADER.size + self.bucket_count * 4] \
+            .cast('I')
+        self.offsets: memoryview = view[start:self.keys_start].cast('I' if itemsize == 4 else 'Q')
+
+    def slot(self, key: bytes) -> int:
+        """The only slot that may hold a line."""
+        bucket, first, step = slot_hashes(key, self.hasher, self.bucket_count, self.key_count)
+        displacement: int = self.displacements[bucket]
+        if displacement & 1:
+            return displacement >> 1
+        return displaced(first, step, displacement >> 1, self.key_count)
+
+    def key_at(self, slot: int) -> bytes:
+        """The line held in a slot."""
+        return self.data[self.keys_start + self.offsets[slot]:
+                         self.keys_start + self.offsets[slot + 1]]
+
+    def __contains__(self, query: str | bytes) -> bool:
+        slot_count: int = self.key_count
+        if not slot_count:
+            return False
+        key: bytes = query.encode('utf-8') if isinstance(query, str) else query
+        # slot and key_at inlined, the lookups are on the request path
+        hasher = self.hasher.copy()
+        hasher.update(key)
+        value: int = int.from_bytes(hasher.digest(), 'little')
+        displacement: int = self.displacements[value % self.bucket_count]
+        if displacement & 1:
+            slot: int = displacement >> 1
+        else:
+            displacement >>= 1
+            slot = ((value >> 64) + displacement % STEPS * (value >> 32)
+                    + displacement // STEPS) % slot_count
+        start: int = self.keys_start + self.offsets[slot]
+        return self.data[start:self.keys_start + self.offsets[slot + 1]] == key
+
+    def __len__(self) -> int:
+        return self.key_count
+
+    def __iter__(self):
+        return (self.key_at(slot) for slot in range(self.key_count))
+
+    @property
+    def resident_bytes(self) -> int:
+        """Bytes of the displacements and the offsets, the arrays read by every lookup."""
+        return self.displacements.nbytes + self.offsets.nbytes
+
+    def close(self):
+        """Release the arrays and unmap the table file."""
+        self.displacements.release()
+        self.offsets.release()
+        self.data.close()
+
+
+def verify(source: str, path: str, normalize: Callable[[str], str] = str.strip) -> int:
+    """
+    Check that a table holds exactly the unique lines of a corpus, every one of them in
+    the slot its hashes lead to.
+
+    Args:
+        source (str): Path of the corpus file, may be compressed.
+        path (str): Path of the table file.
+        normalize (Callable[[str], str]): The normalization the table was built with.
+
+    Returns:
+        int: The number of lines checked.
+
+    Raises:
+        ValueError: If the table does not match the corpus.
+    """
+    table = PerfectHash(path)
+    try:
+        for slot, key in enumerate(table):
+            if table.slot(key) != slot:
+                raise ValueError(f'{path}: slot {slot} holds a line that hashes elsewhere')
+        with open_corpus(source) as f:
+            keys = {normalize(line).encode('utf-8') for line in f}
+        for key in keys:
+            if key not in table:
+                raise ValueError(f'{path} is missing the line {key!r} of {source}')
+        if len(keys) != len(table):
+            raise ValueError(f'{path} holds {len(table)} lines, {source} has {len(keys)}')
+    finally:
+        table.close()
+    return len(keys)
+
+
+def benchmark(source: str, path: str, query_count: int = 100000, hit_ratio: float = 0.5,
+              normalize: Callable[[str], str] = str.strip) -> dict:
+    """
+    Compare the table with the set of lines searched by hash_search: the time to load
+    them, the memory they hold and the time of a lookup.
+
+    Args:
+        source (str): Path of the corpus file.
+        path (str): Path of the table file built from it.
+        query_count (int): Number of lookups timed.
+        hit_ratio (float): Fraction of the queries taken from the corpus.
+        normalize (Callable[[str], str]): The normalization the table was built with.
+
+    Returns:
+        dict: The load time in seconds, the memory in bytes and the lookup time in
+        nanoseconds of the set and of the table.
+    """
+    start: float = time.perf_counter()
+    with open_corpus(source) as f:
+        lines = set(map(normalize, f))
+    set_load: float = time.perf_counter() - start
+    start = time.perf_counter()
+    table = PerfectHash(path)
+    table_load: float = time.perf_counter() - start
+    generator = random.Random(0)
+    corpus: List[str] = list(lines)
+    queries: List[str] = [generator.choice(corpus) if generator.random() < hit_ratio
+                          else f'missing;{number};' for number in range(query_count)]
+    start = time.perf_counter()
+    expected: List[bool] = [hash_search(lines, query) for query in queries]
+    set_lookup: float = time.perf_counter() - start
+    start = time.perf_counter()
+    found: List[bool] = [query in table for query in queries]
+    table_lookup: float = time.perf_counter() - start
+    if found != expected:
+        raise ValueError(f'{path} does not answer like the set of the lines of {source}')
+    report: dict = {
+        'set': {'load_seconds': set_load, 'bytes': estimate_bytes(lines),
+                'lookup_ns': set_lookup / query_count * 1e9},
+        'perfect_hash': {'load_seconds': table_load, 'bytes': table.resident_bytes,
+                         'file_bytes': len(table.data),
+                         'lookup_ns': table_lookup / query_count * 1e9},
+    }
+    table.close()
+    return report
+
+
+def main():
+    """Build, verify or benchmark the perfect hash table of a corpus file."""
+    parser = argparse.ArgumentParser(description='Build the perfect hash table of a corpus.')
+    parser.add_argument('command', choices=('build', 'verify', 'bench'))
+    parser.add_argument('corpus', help='path of the corpus file, may be .gz, .bz2 or .xz')
+    parser.add_argument('table', help='path of the table file')
+    parser.add_argument('--bucket-size', type=int, default=DEFAULT_BUCKET_SIZE,
+                        help='average number of lines per bucket')
+    parser.add_argument('--queries', type=int, default=100000, help='lookups of the benchmark')
+    parser.add_argument('--normalize', default='',
+                        help='normalization steps, the same as NORMALIZE of the servers')
+    arguments = parser.parse_args()
+    normalize: Callable[[str], str] = build_normalizer(arguments.normalize) or str.strip
+    start: float = time.perf_counter()
+    if arguments.command == 'build':
+        count: int = build(arguments.corpus, arguments.table, arguments.bucket_size, normalize)
+        print(f'built the perfect hash table of {count} unique lines into {arguments.table} '
+              f'in {time.perf_counter() - start:.3f} seconds')
+    elif arguments.command == 'verify':
+        count = verify(arguments.corpus, arguments.table, normalize)
+        print(f'{arguments.table} holds the {count} unique lines of {arguments.corpus}')
+    else:
+        for name, result in benchmark(arguments.corpus, arguments.table, arguments.queries,
+                                      normalize=normalize).items():
+            print(f'{name:>12}: ' + ', '.join(f'{key} {value:.6g}'
+                                               for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+This module implements the positional index of the corpus: the line numbers of every
+distinct line, so the server can tell how many times and on which lines a query occurs.
+
+Most lines of a corpus occur once, their only line number is stored as a plain int.
+The line numbers of a repeated line are stored as a varint encoded array of the gaps
+between consecutive line numbers, which takes one or two bytes per occurrence instead of
+a list of int objects. The count is kept next to the array, so counting never decodes it,
+and a page of line numbers only decodes the array up to the end of the page.
+"""
+
+# static typing
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+
+def encode_deltas(numbers: List[int]) -> bytes:
+    """
+    Encode increasing numbers as the varints of their gaps, the first gap is from 0.
+
+    Args:
+        numbers (List[int]): The increasing numbers.
+
+    Returns:
+        bytes: Seven bits per byte, the high bit set on every byte but the last of a gap.
+    """
+    data = bytearray()
+    previous: int = 0
+    for number in numbers:
+        gap: int = number - previous
+        previous = number
+        while gap >= 0x80:
+            data.append(gap & 0x7F | 0x80)
+            gap >>= 7
+        data.append(gap)
+    return bytes(data)
+
+
+def decode_deltas(data: bytes, count: int) -> List[int]:
+    """
+    Decode the first numbers of an array encoded by encode_deltas.
+
+    Args:
+        data (bytes): The encoded gaps.
+        count (int): The number of numbers to decode.
+
+    Returns:
+        List[int]: The first count numbers, fewer if the array is shorter.
+    """
+    numbers: List[int] = []
+    number: int = 0
+    gap: int = 0
+    shift: int = 0
+    for byte in data:
+        gap |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        number += gap
+        numbers.append(number)
+        if len(numbers) == count:
+            break
+        gap = shift = 0
+    return numbers
+
+
+class PositionalIndex:
+    """
+    Line numbers and occurrence counts of every distinct line of the corpus.
+
+    Args:
+        lines (Iterable[str]): The lines of the corpus, in file order.
+        normalize (Callable[[str], str]): Turns a line into its key in the index.
+    """
+
+    def __init__(self, lines: Iterable[str], normalize: Callable[[str], str] = str.strip):
+        # the first line number of every line, then the later ones of the repeated lines
+        first: Dict[str, int] = {}
+        repeated: Dict[str, List[int]] = {}
+        total: int = 0
+        for total, line in enumerate(lines, 1):
+            key: str = normalize(line)
+            number = first.setdefault(key, total)
+            if number != total:
+                repeated.setdefault(key, [number]).append(total)
+        # a line occurring once is its line number, a repeated line its count and gaps
+        self.positions: Dict[str, Union[int, Tuple[int, bytes]]] = first
+        for key, numbers in repeated.items():
+            first[key] = (len(numbers), encode_deltas(numbers))
+        self.lines: int = total
+        self.repeated: int = len(repeated)
+
+    def __len__(self) -> int:
+        """The number of distinct lines."""
+        return len(self.positions)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.positions
+
+    def count(self, key: str) -> int:
+        """
+        Count the occurrences of a line.
+
+        Args:
+            key (str): The line, normalized like the lines of the index.
+
+        Returns:
+            int: The number of lines of the corpus equal to it.
+        """
+        entry = self.positions.get(key)
+        if entry is None:
+            return 0
+        return 1 if isinstance(entry, int) else entry[0]
+
+    def page(self, key: str, offset: int, limit: int) -> Tuple[int, List[int]]:
+        """
+        Return a page of the line numbers of a line.
+
+        Args:
+            key (str): The line, normalized like the lines of the index.
+            offset (int): The number of line numbers skipped.
+            limit (int): The maximum number of line numbers returned.
+
+        Returns:
+            Tuple[int, List[int]]: The number of occurrences, and the 1-based line numbers
+            of the page in increasing order.
+        """
+        entry = self.positions.get(key)
+        if entry is None:
+            return 0, []
+        if isinstance(entry, int):
+            return 1, [entry][offset:offset + limit]
+        count, data = entry
+        if offset >= count or limit <= 0:
+            return count, []
+        return count, decode_deltas(data, offset + limit)[offset:]
@@ -0,0 +1,254 @@
+"""
+This module implements the on-demand profiling of the live server.
+
+A profiling window is started by a signal (SIGUSR1) or by the admin command
+of the metrics listener. Since Python 3.12 a cProfile profiler covers all the
+threads and only one may be enabled at a time, so a single profiler is enabled
+for the whole window. On the older versions a profiler only covers the thread
+that enables it, so every client connection and every multiplexed request
+started during the window is handled under its own profiler and the results are
+merged into one set of statistics. When the window ends the statistics are
+written to the profile directory as a .prof file (for pstats or snakeviz) and a
+text summary.
+
+A handler always runs, even when its profiler can not be enabled, so a profiling
+window never keeps a connection from being answered and released.
+
+Index builds that happen during the window are also wrapped in tracemalloc
+snapshots, the allocations of the build are written to a text file.
+
+When no window is active the server only checks the boolean attribute active,
+the request path is otherwise untouched.
+"""
+
+# the CPU profiler
+import cProfile
+
+# merging and printing of the profiler statistics
+import pstats
+
+# allocation tracing around the index builds
+import tracemalloc
+
+# for the no-op context manager used when the profiler is off
+import contextlib
+
+# for IO operations
+import io
+import os
+
+# the window is closed by a timer thread
+import threading
+
+# for naming the output files
+import time
+
+# the length of a window must be a finite number of seconds
+import math
+
+# the profilers are process wide since Python 3.12
+import sys
+
+# static typing
+from typing import Callable, Iterator, List, Optional
+
+# number of entries written in the text summaries
+SUMMARY_LINES: int = 40
+
+# the context manager returned when no allocation tracking is needed
+_NO_TRACKING = contextlib.nullcontext()
+
+# whether one profiler enabled by any thread profiles all the threads
+PROCESS_WIDE: bool = sys.version_info >= (3, 12)
+
+# longest window by default, a longer window is cut to it
+MAX_WINDOW_SECONDS: float = 300.0
+
+
+class LiveProfiler:
+    """
+    Captures cProfile windows and tracemalloc snapshots of the running server.
+
+    Args:
+        output_dir (str): Directory the profile files are written to.
+        max_seconds (float): Longest window, a longer window is cut to it.
+    """
+
+    def __init__(self, output_dir: str, max_seconds: float = MAX_WINDOW_SECONDS):
+        self.output_dir: str = output_dir
+        self.max_seconds: float = max_seconds
+        # checked by the server for every connection, nothing else is done while it is False
+        self.active: bool = False
+        # paths of the files written by the last window
+        self.written: List[str] = []
+        self._stats: Optional[pstats.Stats] = None
+        # the profiler of the whole window when the profilers are process wide
+        self._profile: Optional[cProfile.Profile] = None
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._started_tracemalloc: bool = False
+
+    def start(self, seconds: float) -> bool:
+        """
+        Start a profiling window of the given number of seconds, at most max_seconds.
+
+        Args:
+            seconds (float): Length of the window.
+
+        Returns:
+            bool: True if the window was started, False if a window is already active or
+            another profiler is enabled.
+
+        Raises:
+            ValueError: If seconds is not a positive finite number, such a window would
+            never be closed by its timer.
+        """
+        if not math.isfinite(seconds) or seconds <= 0:
+            raise ValueError(f'the window must last a positive number of seconds, not {seconds}')
+        seconds = min(seconds, self.max_seconds)
+        with self._lock:
+            if self.active:
+                return False
+            self._stats = None
+            self.written = []
+            if PROCESS_WIDE:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    return False
+                self._profile = profile
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            self._timer = threading.Timer(seconds, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+            self.active = True
+        return True
+
+    def stop(self) -> List[str]:
+        """
+        Close the active window and write the collected statistics.
+
+        Returns:
+            List[str]: The paths of the files written during the window.
+        """
+        with self._lock:
+            if not self.active:
+                return self.written
+            self.active = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+            profile, self._profile = self._profile, None
+            if profile is not None:
+                profile.disable()
+                self._add(profile)
+            stats, self._stats = self._stats, None
+        if stats is not None:
+            self._write_stats(stats)
+        return self.written
+
+    def profiled(self, function: Callable) -> Callable:
+        """
+        Wrap a handler so that it runs under its own profiler and its statistics are
+        merged into the window. When the profilers are process wide the window profiler
+        already covers the handler and it is returned as is.
+
+        Args:
+            function (Callable): The connection or request handler.
+
+        Returns:
+            Callable: The wrapped handler.
+        """
+        if PROCESS_WIDE:
+            return function
+
+        def run(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is enabled, the handler runs unprofiled
+                return function(*args, **kwargs)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._merge(profile)
+
+        return run
+
+    def track_allocations(self, label: str):
+        """
+        Return a context manager that writes the allocations made inside it
+        when a window is active, and does nothing otherwise.
+
+        Args:
+            label (str): Name of the index build, used in the file name.
+
+        Returns:
+            The context manager.
+        """
+        if not self.active:
+            return _NO_TRACKING
+        return self._allocation_snapshot(label)
+
+    @contextlib.contextmanager
+    def _allocation_snapshot(self, label: str) -> Iterator[None]:
+        """Take tracemalloc snapshots before and after the block and write the difference."""
+        if not tracemalloc.is_tracing():
+            yield
+            return
+        before = tracemalloc.take_snapshot()
+        yield
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        top = after.compare_to(before, 'lineno')[:SUMMARY_LINES]
+        lines = [f'allocations of {label}, traced peak {peak} bytes']
+        lines.extend(str(stat) for stat in top)
+        self._write_file(f'alloc-{label}', '.txt', '\n'.join(lines) + '\n')
+
+    def _merge(self, profile: cProfile.Profile):
+        """Merge the statistics of one connection into the window."""
+        with self._lock:
+            if self.active:
+                self._add(profile)
+
+    def _add(self, profile: cProfile.Profile):
+        """Add the statistics of a profiler to the window, called with the lock held."""
+        try:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+        except TypeError:
+            # a profiler that recorded nothing has no statistics
+            pass
+
+    def _write_stats(self, stats: pstats.Stats):
+        """Write the merged statistics as a .prof file and a text summary."""
+        path = self._output_path('profile', '.prof')
+        stats.dump_stats(path)
+        self.written.append(path)
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats('cumulative').print_stats(SUMMARY_LINES)
+        self._write_file('profile', '.txt', summary.getvalue())
+
+    def _output_path(self, prefix: str, suffix: str) -> str:
+        """Build a unique path in the output directory."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        return os.path.join(self.output_dir, f'{prefix}-{stamp}-{time.perf_counter_ns()}{suffix}')
+
+    def _write_file(self, prefix: str, suffix: str, text: str):
+        """Write a text file to the output directory."""
+        path = self._output_path(prefix, suffix)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        self.written.append(path)
@@ -0,0 +1,216 @@
+"""
+This module implements the structured request logging used by the server.
+
+Instead of printing several lines to stdout for every request, the request handler
+builds a single record (a dictionary) and hands it over to a bounded queue.
+A background writer thread takes records from the queue, formats them as one
+JSON line each and writes them to the output stream.
+
+The request thread therefore never blocks on a slow stdout pipe, and the costly
+parts of logging (timestamp formatting and serialisation) happen on the writer thread.
+When the queue is full the record is dropped and counted instead of blocking the request.
+Verbosity levels and sampling make debug output almost free in production.
+"""
+
+# bounded queue shared between the request threads and the writer thread
+import queue
+
+# json module for serialising the structured records
+import json
+
+# random sampling of the low level records
+import random
+
+# the stream used by default is standard output
+import sys
+
+# background writer thread
+import threading
+
+# time module for the record timestamps
+import time
+
+# static typing
+from typing import Any, Dict, Optional, TextIO
+
+# numeric verbosity levels, the higher the level the more important the record
+DEBUG: int = 10
+INFO: int = 20
+WARNING: int = 30
+ERROR: int = 40
+OFF: int = 100
+
+# mapping of the level names used in config.ini to the numeric levels
+LEVELS: Dict[str, int] = {
+    'DEBUG': DEBUG,
+    'INFO': INFO,
+    'WARNING': WARNING,
+    'ERROR': ERROR,
+    'OFF': OFF,
+}
+
+# reverse mapping used when writing the level name into the record
+LEVEL_NAMES: Dict[int, str] = {value: key for key, value in LEVELS.items()}
+
+
+def parse_level(level_name: Optional[str]) -> int:
+    """
+    Convert a level name from the configuration file into a numeric level.
+
+    Args:
+        level_name (Optional[str]): The level name i.e. DEBUG, INFO, WARNING, ERROR or OFF.
+
+    Returns:
+        int: The numeric level, INFO if the name is empty or unknown.
+    """
+    if not level_name:
+        return INFO
+    return LEVELS.get(level_name.strip().upper(), INFO)
+
+
+class RequestLogger:
+    """
+    Non-blocking structured logger with a background writer thread.
+
+    Records below WARNING level are sampled using sample_rate, so that
+    DEBUG and INFO records can be kept on in production at a fraction of their cost.
+    WARNING and ERROR records are never sampled out.
+
+    Args:
+        level (int): The minimum level of the records that are written.
+        sample_rate (float): Fraction (0.0 - 1.0) of DEBUG and INFO records that are written.
+        queue_size (int): Maximum number of records waiting for the writer thread.
+        stream (Optional[TextIO]): Output stream, standard output by default.
+    """
+
+    def __init__(self, level: int = INFO, sample_rate: float = 1.0,
+                 queue_size: int = 10000, stream: Optional[TextIO] = None):
+        self.level: int = level
+        self.sample_rate: float = min(max(sample_rate, 0.0), 1.0)
+        self.stream: Optional[TextIO] = stream
+        # number of records dropped because the queue was full
+        self.dropped: int = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max(queue_size, 1))
+        # the timestamp of the last formatted second is cached by the writer thread
+        self._cached_second: int = -1
+        self._cached_stamp: str = ''
+        self._writer = threading.Thread(target=self._write_records,
+                                        name='request-log-writer', daemon=True)
+        self._writer.start()
+
+    def is_enabled(self, level: int) -> bool:
+        """
+        Check whether records of the given level would be written at all.
+        The request path uses it to skip building records that would be discarded.
+
+        Args:
+            level (int): The level of the record.
+
+        Returns:
+            bool: True if the level is enabled, False otherwise.
+        """
+        return level >= self.level
+
+    def log(self, level: int, event: str, **fields: Any) -> bool:
+        """
+        Queue a structured record for the writer thread without blocking.
+
+        Args:
+            level (int): The level of the record.
+            event (str): Short name of the event i.e. request, error.
+            **fields (Any): The fields of the record.
+
+        Returns:
+            bool: True if the record was queued, False if it was filtered, sampled out or dropped.
+        """
+        if level < self.level:
+            return False
+        if level < WARNING and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        fields['level'] = level
+        fields['event'] = event
+        fields['time'] = time.time()
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            # never block the request thread, the lost record is only counted
+            self.dropped += 1
+            return False
+        return True
+
+    def debug(self, event: str, **fields: Any) -> bool:
+        """Queue a DEBUG record, see log()."""
+        return self.log(DEBUG, event, **fields)
+
+    def info(self, event: str, **fields: Any) -> bool:
+        """Queue an INFO record, see log()."""
+        return self.log(INFO, event, **fields)
+
+    def warning(self, event: str, **fields: Any) -> bool:
+        """Queue a WARNING record, see log()."""
+        return self.log(WARNING, event, **fields)
+
+    def error(self, event: str, **fields: Any) -> bool:
+        """Queue an ERROR record, see log()."""
+        return self.log(ERROR, event, **fields)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until the writer thread has written all the queued records.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            bool: True if the queue was drained before the timeout, False otherwise.
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def format_record(self, record: Dict[str, Any]) -> str:
+        """
+        Format a record as a single JSON line. Runs on the writer thread.
+
+        Args:
+            record (Dict[str, Any]): The record taken from the queue.
+
+        Returns:
+            str: The JSON line including the trailing new line character.
+        """
+        record_time: float = record.pop('time')
+        second = int(record_time)
+        # strftime is only called once per second and not once per record
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_stamp = time.strftime("%Y-%m-%d %H:%M:%S %A", time.localtime(second))
+        level = record.pop('level')
+        event = record.pop('event')
+        line = {
+            'timestamp': self._cached_stamp,
+            'level': LEVEL_NAMES.get(level, str(level)),
+            'event': event,
+        }
+        line.update(record)
+        return json.dumps(line, default=str) + '\n'
+
+    def _write_records(self):
+        """
+        Body of the writer thread, writes the records one JSON line each and
+        flushes the stream only when the queue runs empty.
+        """
+        while True:
+            record = self._queue.get()
+            try:
+                stream = self.stream if self.stream is not None else sys.stdout
+                stream.write(self.format_record(record))
+                if self._queue.empty():
+                    stream.flush()
+            except (OSError, ValueError, TypeError):
+                # a broken output stream must never kill the writer thread
+                pass
+            finally:
+                self._queue.task_done()
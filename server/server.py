@@ -20,20 +20,114 @@ import configparser
 # this module is used for file path compatibility i.e. windows, linux or macOS
 import os
 
-# import datetime module for time logging
-from datetime import datetime
-
 # provides functions to manipulate time. I used it to get time deference between executions
 import time
 
+# the index stats are served as JSON
+import json
+
+# the length of a profiling window must be finite
+import math
+
 # this module enables static typing functionality
-from typing import Optional, List, Set, Tuple
+from typing import Optional, Dict, Iterator, List, Set, Tuple
 
 # ssl module for ssl related functionality
 import ssl
 
+# tells a stale unix domain socket file from any other file
+import stat
+
+# signal module lets the operator start a profiling window with SIGUSR1
+import signal
+
 # threading module helps in achieving multithread execution to the server
 import threading
+
+# the responses of the multiplexed requests wait for the writer of their connection
+import queue
+
+# for taking the warmup queries from the loaded corpus, and for the lines of compressed corpora
+from itertools import chain, islice
+
+# the workers searching the multiplexed requests
+from concurrent.futures import ThreadPoolExecutor
+
+# structured request logging written by a background thread
+from server.request_log import RequestLogger, parse_level, DEBUG, INFO
+
+# lock-light metrics served in the Prometheus text format
+from server.metrics import MetricsRegistry, start_metrics_server
+
+# on-demand CPU and allocation profiling of the live server
+from server.profiler import LiveProfiler
+
+# per-client rate limiting and concurrent connection cap
+from server.admission import AdmissionController, RATE_LIMITED
+
+# handshake, read and idle deadlines of the connections
+from server.deadlines import DeadlineScheduler, NO_DEADLINE, HANDSHAKE, READ, IDLE, WRITE
+
+# incremental reloads of the corpus file
+from server.corpus_reload import TailReader, DiffReader, parse_reload_mode, APPEND, DIFF
+
+# normalization of the corpus lines and of the queries
+from server.normalization import build_normalizer, Normalizer
+
+# approximate matching of the queries
+from server.fuzzy import FuzzyIndex
+
+# memory and build cost accounting of the indexes
+from server.index_stats import IndexStats, BuildMeter, ReadCounter, estimate_bytes
+
+# corpus files compressed with gzip, bz2 or xz
+from server.compressed import open_corpus, iter_line_blocks, is_compressed, READ_ERRORS
+
+# line numbers and occurrence counts of the corpus lines
+from server.positional_index import PositionalIndex
+
+# corpus index shared by the server processes of the host
+from server.shared_index import SharedIndex, SharedIndexReader, IndexNotPublished
+
+# out-of-core index of the corpora larger than the memory
+from server.sorted_file import SortedFile
+
+# static perfect hash index of the read-only corpora
+from server.perfect_hash import PerfectHash
+
+# vectorized lookups of the batch queries, NumPy is optional
+from server.hash_array import HashArrayIndex, NUMPY_AVAILABLE
+
+# the named corpora hosted next to the main corpus
+from server.corpora import CorpusRegistry, corpus_sections
+
+# length-prefixed framing shared with the client
+from protocol import (
+    MAGIC,
+    QUERY,
+    BATCH,
+    STREAM,
+    FUZZY,
+    COUNT,
+    POSITIONS,
+    LAST_CHUNK,
+    TRUNCATED,
+    MORE,
+    POSITIONS_REQUEST,
+    NAMED_CORPUS,
+    RESPONSE,
+    ERROR,
+    FOUND_RESPONSE,
+    NOT_FOUND_RESPONSE,
+    Frame,
+    FrameError,
+    FrameReader,
+    encode_frame,
+    encode_positions,
+    decode_corpus_name,
+    tag_frame
+)
+
 # this module contains various search algorithms defined in
 from search_algorithms import (
     linear_search,
@@ -69,10 +163,45 @@ SSL_KEYS_DIR: str = CONFIG_FILE['DEFAULT'].get('SSL_DIR_FILES')
 # that are custom and saves them in the data directory. the default file is 200k.txt which contains
 # 200,000 lines of text can be replaced with any text within the directory
 # when the file "performance.py"  is executed for it creates other text files.
-FILE_PATH: str = os.path.join(f'{os.getcwd()}/{TEMP_DIR}', '200k.txt')
+FILE_PATH: str = os.path.join(f'{os.getcwd()}/{TEMP_DIR}',
+                              CONFIG_FILE['DEFAULT'].get('CORPUS_FILE', fallback='200k.txt'))
 
 # retrieving REREAD_ON_QUERY from the config.ini file
 REREAD_ON_QUERY: bool = CONFIG_FILE['DEFAULT'].getboolean('REREAD_ON_QUERY')
+# retrieving how the corpus is reloaded when REREAD_ON_QUERY is set: full rereads the whole
+# file, append only reads the lines appended since the last reload, diff only applies the
+# lines of the chunks that changed since the last reload
+RELOAD_MODE: str = parse_reload_mode(CONFIG_FILE['DEFAULT'].get('RELOAD_MODE', fallback='full'))
+
+# retrieving the seconds between two checks of the corpus file in append and diff mode
+# (0 checks on every query)
+RELOAD_CHECK_INTERVAL: float = CONFIG_FILE['DEFAULT'].getfloat('RELOAD_CHECK_INTERVAL',
+                                                               fallback=0.0)
+
+# retrieving the normalization steps applied to the lines and to the queries
+# (comma separated nfc or nfkc, casefold, whitespace), empty for exact matching
+NORMALIZER: Optional[Normalizer] = build_normalizer(CONFIG_FILE['DEFAULT'].get('NORMALIZE',
+                                                                             fallback=''))
+
+# turns a corpus line into its key in the index, the lines are only stripped without normalization
+LINE_NORMALIZER: Normalizer = NORMALIZER or str.strip
+
+# retrieving whether the corpus index holds the raw bytes of the lines and the exact queries
+# are looked up without decoding them
+BYTES_MODE: bool = CONFIG_FILE['DEFAULT'].getboolean('BYTES_MODE', fallback=False)
+
+# retrieving whether the queries are still checked to be valid UTF-8 in bytes mode
+VALIDATE_UTF8: bool = CONFIG_FILE['DEFAULT'].getboolean('VALIDATE_UTF8', fallback=True)
+
+# an appended compressed file can not be read from the offset of the decompressed data
+if RELOAD_MODE == APPEND and is_compressed(FILE_PATH):
+    raise ValueError('an append RELOAD_MODE needs an uncompressed CORPUS_FILE, use full or diff')
+
+# the normalization and the incremental reloads work on decoded lines
+if BYTES_MODE and (NORMALIZER is not None or RELOAD_MODE in (APPEND, DIFF)):
+    raise ValueError('BYTES_MODE can not be combined with NORMALIZE or an append or diff '
+                     'RELOAD_MODE, they work on decoded lines')
+
 # retrieve the path to the SSL certificate from the ssl_keys folder
 SSL_CERT: str = os.path.join(SSL_KEYS_DIR, 'self_signed_cert.pem')
 
@@ -88,11 +217,311 @@ PORT_NUMBER: int = CONFIG_FILE['DEFAULT'].getint('PORT_NUMBER')
 # retrieving the boolean variable from the configuration file for checking ssl flag
 USE_SSL_CONNECTION: bool = CONFIG_FILE['DEFAULT'].getboolean('SSL_ENABLED')
 
+# retrieving the verbosity level of the request log (DEBUG, INFO, WARNING, ERROR or OFF)
+LOG_LEVEL: int = parse_level(CONFIG_FILE['DEFAULT'].get('LOG_LEVEL', fallback='INFO'))
+
+# fraction of the DEBUG and INFO request records that are written to the log
+LOG_SAMPLE_RATE: float = CONFIG_FILE['DEFAULT'].getfloat('LOG_SAMPLE_RATE', fallback=1.0)
+
+# maximum number of request records waiting for the log writer thread
+LOG_QUEUE_SIZE: int = CONFIG_FILE['DEFAULT'].getint('LOG_QUEUE_SIZE', fallback=10000)
+
+# the request logger shared by all the client threads
+REQUEST_LOG: RequestLogger = RequestLogger(LOG_LEVEL, LOG_SAMPLE_RATE, LOG_QUEUE_SIZE)
+
+# retrieving whether the corpus is loaded and warmed up before the server starts listening
+PRELOAD_ON_START: bool = CONFIG_FILE['DEFAULT'].getboolean('PRELOAD_ON_START', fallback=True)
+
+# retrieving the number of warmup queries run against the loaded corpus
+WARMUP_QUERIES: int = CONFIG_FILE['DEFAULT'].getint('WARMUP_QUERIES', fallback=1000)
+
+# set once the corpus is loaded and warmed up, the readiness probe reports it
+SERVER_READY: threading.Event = threading.Event()
+
+# retrieving the connections admitted per second and per client IP (0 disables the limit)
+RATE_LIMIT_PER_SECOND: float = CONFIG_FILE['DEFAULT'].getfloat('RATE_LIMIT_PER_SECOND',
+                                                               fallback=0.0)
+
+# retrieving the connections a client IP can open at once before the rate limit applies
+RATE_LIMIT_BURST: float = CONFIG_FILE['DEFAULT'].getfloat('RATE_LIMIT_BURST', fallback=20.0)
+
+# retrieving the concurrent connections allowed per client IP (0 disables the cap)
+MAX_CONNECTIONS_PER_IP: int = CONFIG_FILE['DEFAULT'].getint('MAX_CONNECTIONS_PER_IP', fallback=0)
+
+# admission control applied by the accept loop before any other work
+ADMISSION: AdmissionController = AdmissionController(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST,
+                                                     MAX_CONNECTIONS_PER_IP)
+
+# retrieving the seconds allowed for the TLS handshake of a connection (0 disables it)
+HANDSHAKE_TIMEOUT: float = CONFIG_FILE['DEFAULT'].getfloat('HANDSHAKE_TIMEOUT', fallback=5.0)
+
+# retrieving the seconds allowed to receive a complete request (0 disables it)
+READ_TIMEOUT: float = CONFIG_FILE['DEFAULT'].getfloat('READ_TIMEOUT', fallback=10.0)
+
+# retrieving the seconds a connection may stay open without sending anything (0 disables it)
+IDLE_TIMEOUT: float = CONFIG_FILE['DEFAULT'].getfloat('IDLE_TIMEOUT', fallback=30.0)
+
+# retrieving the seconds allowed to send a response on a framed connection (0 disables it)
+WRITE_TIMEOUT: float = CONFIG_FILE['DEFAULT'].getfloat('WRITE_TIMEOUT', fallback=10.0)
+
+# retrieving the path of the unix domain socket listener for local clients (empty disables it)
+UNIX_SOCKET_PATH: str = CONFIG_FILE['DEFAULT'].get('UNIX_SOCKET_PATH', fallback='')
+
+# retrieving the octal file mode of the unix domain socket, it stands in for TLS on the host
+UNIX_SOCKET_MODE: int = int(CONFIG_FILE['DEFAULT'].get('UNIX_SOCKET_MODE', fallback='660'), 8)
+
+# retrieving the pointer file of the shared memory index published by the loader
+# (python -m server.shared_index), empty to keep a private index in every process
+SHARED_INDEX_POINTER: str = CONFIG_FILE['DEFAULT'].get('SHARED_INDEX_POINTER', fallback='')
+
+# retrieving the seconds between two checks for a newly published shared index
+SHARED_INDEX_CHECK_INTERVAL: float = CONFIG_FILE['DEFAULT'].getfloat('SHARED_INDEX_CHECK_INTERVAL',
+                                                                     fallback=1.0)
+
+# retrieving the seconds a query waits for the first shared index to be published before it
+# is refused, a worker never builds its own copy of the corpus in the meantime
+SHARED_INDEX_WAIT: float = CONFIG_FILE['DEFAULT'].getfloat('SHARED_INDEX_WAIT', fallback=5.0)
+
+# the shared memory index followed by this process, None when every process has its own index
+SHARED_INDEX: Optional[SharedIndexReader] = (
+    SharedIndexReader(SHARED_INDEX_POINTER, SHARED_INDEX_CHECK_INTERVAL)
+    if SHARED_INDEX_POINTER else None)
+
+# retrieving the path of the sorted file built by python -m server.sorted_file, when set the
+# queries are looked up in it through mmap and the corpus is never loaded in memory
+SORTED_FILE: str = CONFIG_FILE['DEFAULT'].get('SORTED_FILE', fallback='')
+
+# the sorted file and its sparse index, a missing or invalid file stops the server
+SORTED_INDEX: Optional[SortedFile] = SortedFile(SORTED_FILE) if SORTED_FILE else None
+
+# retrieving the path of the table built by python -m server.perfect_hash, when set the queries
+# are looked up in it through mmap and the corpus is never loaded in memory
+PERFECT_HASH_FILE: str = CONFIG_FILE['DEFAULT'].get('PERFECT_HASH_FILE', fallback='')
+
+# the perfect hash table, a missing or invalid file stops the server
+PERFECT_HASH_INDEX: Optional[PerfectHash] = (PerfectHash(PERFECT_HASH_FILE)
+                                             if PERFECT_HASH_FILE else None)
+
+# retrieving whether the FUZZY queries are served, the fuzzy index is built at warm up
+FUZZY_ENABLED: bool = CONFIG_FILE['DEFAULT'].getboolean('FUZZY_ENABLED', fallback=False)
+
+# retrieving the largest edit distance of the fuzzy queries
+FUZZY_MAX_DISTANCE: int = CONFIG_FILE['DEFAULT'].getint('FUZZY_MAX_DISTANCE', fallback=2)
+
+# retrieving the maximum number of lines returned by a fuzzy query
+FUZZY_RESULT_LIMIT: int = CONFIG_FILE['DEFAULT'].getint('FUZZY_RESULT_LIMIT', fallback=10)
+
+# retrieving the time budget of a fuzzy query in milliseconds
+FUZZY_TIME_BUDGET_MS: float = CONFIG_FILE['DEFAULT'].getfloat('FUZZY_TIME_BUDGET_MS',
+                                                              fallback=50.0)
+
+# retrieving the number of fuzzy queries served at once, the others are rejected
+FUZZY_MAX_CONCURRENT: int = CONFIG_FILE['DEFAULT'].getint('FUZZY_MAX_CONCURRENT', fallback=2)
+
+# the fuzzy queries running at once are capped so they can not starve the exact lookups
+FUZZY_SLOTS: threading.BoundedSemaphore = threading.BoundedSemaphore(max(FUZZY_MAX_CONCURRENT, 1))
+
+# retrieving whether the COUNT and POSITIONS queries are served from a positional index
+POSITIONAL_INDEX_ENABLED: bool = CONFIG_FILE['DEFAULT'].getboolean('POSITIONAL_INDEX',
+                                                                   fallback=False)
+
+# retrieving the maximum number of line numbers of a POSITIONS response
+POSITIONS_PAGE_SIZE: int = CONFIG_FILE['DEFAULT'].getint('POSITIONS_PAGE_SIZE', fallback=1000)
+
+# retrieving the file the index stats are written to after every index build, empty for none
+INDEX_STATS_FILE: str = CONFIG_FILE['DEFAULT'].get('INDEX_STATS_FILE', fallback='')
+
+# retrieving the named corpora of the [corpus:name] sections, looked up by the requests naming them
+NAMED_CORPORA: Dict[str, str] = corpus_sections(CONFIG_FILE, f'{os.getcwd()}/{TEMP_DIR}')
+
+# retrieving the memory in megabytes the resident named corpora may take, 0 for no limit
+CORPUS_MEMORY_BUDGET_MB: float = CONFIG_FILE['DEFAULT'].getfloat('CORPUS_MEMORY_BUDGET_MB',
+                                                                 fallback=0.0)
+
+# retrieving the largest frame payload accepted on a framed connection
+MAX_FRAME_SIZE: int = CONFIG_FILE['DEFAULT'].getint('MAX_FRAME_SIZE', fallback=16 * 1024 * 1024)
+
+# retrieving the initial size of the receive buffer of a framed connection
+FRAME_BUFFER_SIZE: int = CONFIG_FILE['DEFAULT'].getint('FRAME_BUFFER_SIZE', fallback=64 * 1024)
+
+# retrieving the number of workers searching the multiplexed requests of all the connections
+MULTIPLEX_WORKERS: int = CONFIG_FILE['DEFAULT'].getint('MULTIPLEX_WORKERS', fallback=4)
+
+# retrieving the number of multiplexed requests of a connection searched at once, the next
+# frames are not read until one of them is answered
+MULTIPLEX_MAX_IN_FLIGHT: int = CONFIG_FILE['DEFAULT'].getint('MULTIPLEX_MAX_IN_FLIGHT',
+                                                             fallback=64)
+
+# the workers searching the multiplexed requests, shared by the connections
+MULTIPLEX_POOL: ThreadPoolExecutor = ThreadPoolExecutor(max(MULTIPLEX_WORKERS, 1),
+                                                        thread_name_prefix='multiplex')
+
+# retrieving the search algorithm used to answer the clients, hash_array needs NumPy
+SEARCH_ALGORITHM: str = CONFIG_FILE['DEFAULT'].get('SEARCH_ALGORITHM', fallback='linear')
+
+# retrieving whether the metrics listener is started next to the search listener
+METRICS_ENABLED: bool = CONFIG_FILE['DEFAULT'].getboolean('METRICS_ENABLED', fallback=False)
+
+# retrieving the port number the metrics are served on
+METRICS_PORT: int = CONFIG_FILE['DEFAULT'].getint('METRICS_PORT', fallback=9100)
+
+# retrieving whether the readiness probe is served on METRICS_PORT when the metrics are disabled
+READY_PROBE_ENABLED: bool = CONFIG_FILE['DEFAULT'].getboolean('READY_PROBE_ENABLED',
+                                                              fallback=True)
+
+# retrieving the directory the profiling results are written to
+PROFILE_DIR: str = os.path.join(os.getcwd(), CONFIG_FILE['DEFAULT'].get('PROFILE_DIR',
+                                                                      fallback='profiles'))
+
+# retrieving the default length in seconds of a profiling window
+PROFILE_WINDOW_SECONDS: float = CONFIG_FILE['DEFAULT'].getfloat('PROFILE_WINDOW_SECONDS',
+                                                                fallback=30.0)
+
+# retrieving the longest profiling window, longer windows requested are cut to it
+PROFILE_MAX_WINDOW_SECONDS: float = CONFIG_FILE['DEFAULT'].getfloat('PROFILE_MAX_WINDOW_SECONDS',
+                                                                    fallback=300.0)
+
+# retrieving whether the admin commands are only answered to the clients on the same host
+ADMIN_LOCAL_ONLY: bool = CONFIG_FILE['DEFAULT'].getboolean('ADMIN_LOCAL_ONLY', fallback=True)
+
+# the profiler of the live server, idle until a window is started
+PROFILER: LiveProfiler = LiveProfiler(PROFILE_DIR, PROFILE_MAX_WINDOW_SECONDS)
+
+# the registry holding all the metrics of the server, recording nothing unless they are served
+METRICS: MetricsRegistry = MetricsRegistry(METRICS_ENABLED)
+
+# number of requests by result (found, not_found, error) and search algorithm
+REQUESTS_TOTAL = METRICS.counter('search_requests_total',
+                                 'Search requests by result and algorithm',
+                                 ('result', 'algorithm'))
+
+# end to end latency of the requests
+REQUEST_LATENCY = METRICS.histogram('search_request_duration_seconds',
+                                    'Latency of the search requests in seconds', ('algorithm',))
+
+# duration of each phase of the request path (handshake, recv, decode, load, search, send)
+PHASE_LATENCY = METRICS.histogram('search_request_phase_duration_seconds',
+                                  'Duration of each phase of the search requests in seconds',
+                                  ('phase',))
+
+# client connections currently being handled
+ACTIVE_CONNECTIONS = METRICS.gauge('search_active_connections',
+                                   'Client connections currently being handled')
+
+# threads alive in the server process, computed when the metrics are scraped
+ACTIVE_THREADS = METRICS.gauge('search_active_threads', 'Threads alive in the server process')
+ACTIVE_THREADS.set_function(threading.active_count)
+
+# connections and framed requests rejected by the admission control, per reason, the client
+# IP of a rejection is only logged so the number of series stays bounded
+CLIENT_THROTTLED = METRICS.counter('search_client_throttled_total',
+                                   'Connections and framed requests rejected by the admission '
+                                   'control', ('reason',))
+
+# connections shut down because a deadline expired, per kind of deadline
+TIMEOUTS = METRICS.counter('search_timeouts_total',
+                           'Connections shut down by a handshake, read or idle deadline',
+                           ('kind',))
+
+# the single timer structure enforcing the deadlines of all the connections
+DEADLINES: DeadlineScheduler = DeadlineScheduler(lambda kind: TIMEOUTS.labels(kind).inc())
+
+# failed TLS handshakes
+TLS_HANDSHAKE_FAILURES = METRICS.counter('search_tls_handshake_failures_total',
+                                         'Failed TLS handshakes with the clients')
+
+# number of corpus loads and reloads and their duration
+CORPUS_RELOADS = METRICS.counter('search_corpus_reloads_total',
+                                 'Loads and reloads of the corpus file')
+CORPUS_RELOAD_DURATION = METRICS.histogram('search_corpus_reload_duration_seconds',
+                                           'Duration of the corpus loads and reloads in seconds')
+
+# 1 once the server is warmed up and accepting traffic, 0 before
+READY_GAUGE = METRICS.gauge('search_ready', 'Whether the server is warmed up and accepting traffic')
+READY_GAUGE.set_function(lambda: 1 if SERVER_READY.is_set() else 0)
+
 # the SSLContext variable
 SSL_CONTEXT: ssl.SSLContext | None = None
 # Global variable to store file lines if reread_on_query is False
 ALL_LINES: Optional[Set[str]] | Optional[List[str]] = None
 
+# follows the corpus file in append and diff mode
+CORPUS_READER: Optional[TailReader | DiffReader] = None
+
+# only one thread reloads at a time, the others keep answering from the live set
+RELOAD_LOCK: threading.Lock = threading.Lock()
+
+# monotonic time of the last check of the corpus file in append and diff mode
+LAST_RELOAD_CHECK: float = float('-inf')
+
+# lines inserted into or deleted from the index by the incremental reloads
+CORPUS_CHANGED_LINES = METRICS.counter('search_corpus_changed_lines_total',
+                                       'Lines inserted into or deleted from the index by the '
+                                       'append and diff reloads')
+
+# incremented by every load or reload of the corpus, the derived indexes are rebuilt on change
+CORPUS_GENERATION: int = 0
+
+# the fuzzy index, built from the set of lines of the given corpus generation
+FUZZY_INDEX: Optional[FuzzyIndex] = None
+FUZZY_GENERATION: int = -1
+
+# only one thread builds the fuzzy index at a time
+FUZZY_LOCK: threading.Lock = threading.Lock()
+
+# fuzzy queries rejected because too many were running
+FUZZY_REJECTED = METRICS.counter('search_fuzzy_rejected_total',
+                                 'Fuzzy queries rejected because too many were running')
+
+# the positional index, built from the corpus file at the given corpus generation
+POSITIONAL: Optional[PositionalIndex] = None
+POSITIONAL_GENERATION: int = -1
+
+# only one thread builds the positional index at a time
+POSITIONAL_LOCK: threading.Lock = threading.Lock()
+
+# footprint and build cost of the last build of every index
+INDEX_STATS: IndexStats = IndexStats()
+
+# the corpus generation and the hash array engine built from its set of lines, replaced
+# as a whole so a reader never pairs an engine with the generation of another one
+HASH_ARRAY: Optional[Tuple[int, HashArrayIndex]] = None
+
+# held by the background thread building the hash array engine, one build at a time
+HASH_ARRAY_LOCK: threading.Lock = threading.Lock()
+
+# number of lines held in the index, computed when the metrics are scraped
+INDEX_SIZE = METRICS.gauge('search_index_lines', 'Lines held in the corpus index')
+INDEX_SIZE.set_function(lambda: len(current_index() or ()))
+
+# requests of a named corpus answered from its resident set, loads and evictions of its set
+CORPUS_EVENTS = {
+    'hit': METRICS.counter('search_named_corpus_hits_total',
+                           'Requests of a named corpus answered from its resident index',
+                           ('corpus',)),
+    'load': METRICS.counter('search_named_corpus_loads_total',
+                            'Loads of the index of a named corpus', ('corpus',)),
+    'eviction': METRICS.counter('search_named_corpus_evictions_total',
+                                'Evictions of the index of a named corpus over the memory budget',
+                                ('corpus',)),
+}
+
+# queries of the named corpora by result (found, not_found)
+CORPUS_QUERIES = METRICS.counter('search_named_corpus_queries_total',
+                                 'Queries of the named corpora by corpus and result',
+                                 ('corpus', 'result'))
+
+# the named corpora, load_named_corpus is resolved when the first one is loaded
+CORPORA: CorpusRegistry = CorpusRegistry(
+    NAMED_CORPORA, lambda name, path: load_named_corpus(name, path),
+    round(CORPUS_MEMORY_BUDGET_MB * 1024 * 1024),
+    lambda event, name: CORPUS_EVENTS[event].labels(name).inc())
+
+# estimated memory of the resident named corpora, computed when the metrics are scraped
+CORPUS_RESIDENT_BYTES = METRICS.gauge('search_named_corpus_resident_bytes',
+                                      'Estimated memory of the resident named corpora')
+CORPUS_RESIDENT_BYTES.set_function(lambda: CORPORA.resident_bytes)
+
 
 def create_ssl_connection_context() -> Optional[ssl.SSLContext]:
     """ 
@@ -154,77 +583,1103 @@ def retrieve_all_file_lines(path_to_file: str) -> List[str]:
         IOError: If an I/O error occurs while reading the file.
     """
     try:
-        # reading from the file
-        with open(file=path_to_file, mode='r', encoding='utf-8') as f:
+        # reading from the file, decompressed when it is a .gz, .bz2 or .xz file
+        with open_corpus(path_to_file) as f:
             # retrieves all lines in the file
             return f.readlines()
 
-    except OSError as e:
-        print(f'something went wrong check the file existence or permissions and try again: {e}')
+    except READ_ERRORS as e:
+        REQUEST_LOG.error('file_error', path=path_to_file,
+                          message=f'something went wrong check the file existence or '
+                                  f'permissions and try again: {e}')
         return []
 
 
-def searching_string(path: str, search_string: str, reread: bool, algorithm_used: callable) -> bool:
+def stream_file_lines(path_to_file: str, binary: bool = False,
+                      counter: Optional[ReadCounter] = None) -> Iterator[str] | Iterator[bytes]:
+    """
+    Read the lines of a compressed file while it is being decompressed, so the index is
+    built from the stream without holding the decompressed file in memory.
+
+    Args:
+        path_to_file (str): Path to the .gz, .bz2 or .xz file.
+        binary (bool): Whether the lines are returned as bytes, for the bytes mode.
+        counter (Optional[ReadCounter]): Counts the decompressed bytes and lines.
+
+    Returns:
+        Iterator[str] | Iterator[bytes]: The lines of the file without their line ending,
+        the lines read before an error when the file can not be read or decompressed.
+    """
+    try:
+        yield from chain.from_iterable(iter_line_blocks(path_to_file, binary, counter=counter))
+    except READ_ERRORS as e:
+        REQUEST_LOG.error('file_error', path=path_to_file,
+                          message=f'something went wrong check the file existence, '
+                                  f'permissions or compression and try again: {e}')
+
+
+def retrieve_all_file_bytes(path_to_file: str) -> List[bytes]:
+    """
+    Read all lines from the file specified by file_path without decoding them, for the
+    bytes mode. The lines are split like readlines() splits them in text mode.
+
+    Args:
+        path_to_file (str): Path to the file. The file must exist and be accessible.
+
+    Returns:
+        List[bytes]: List of lines in the file, without their line ending.
+    """
+    try:
+        with open_corpus(path_to_file, binary=True) as f:
+            return f.read().splitlines()
+
+    except READ_ERRORS as e:
+        REQUEST_LOG.error('file_error', path=path_to_file,
+                          message=f'something went wrong check the file existence or '
+                                  f'permissions and try again: {e}')
+        return []
+
+
+def check_utf8(data: bytes) -> bytes:
+    """
+    Check that a query of the bytes mode is valid UTF-8 when VALIDATE_UTF8 is on,
+    without keeping the decoded text.
+
+    Args:
+        data (bytes): The query.
+
+    Returns:
+        bytes: The query.
+
+    Raises:
+        UnicodeDecodeError: If the query is not valid UTF-8.
+    """
+    # most queries are ASCII, which is checked without decoding
+    if VALIDATE_UTF8 and not data.isascii():
+        str(data, 'utf-8')
+    return data
+
+
+def record_build(name: str, structure, meter: BuildMeter, path: Optional[str] = None,
+                 lines: Optional[int] = None, raw_bytes: Optional[int] = None):
+    """
+    Record the footprint and the build cost of an index, log them and write the index
+    stats file when one is configured. The corpus file is never read again for the stats.
+
+    Args:
+        name (str): Name of the index, i.e. 'corpus', 'fuzzy' or 'positional'.
+        structure: The built index.
+        meter (BuildMeter): The measures of the build.
+        path (Optional[str]): The corpus file the index was built from, the size of a
+        compressed file is recorded with the index.
+        lines (Optional[int]): The number of lines the build read from the file.
+        raw_bytes (Optional[int]): The bytes the build read from the file, decompressed. By
+        default the size of an uncompressed file.
+
+    Returns:
+        None
+    """
+    fields: Dict[str, int] = {}
+    if path is not None:
+        try:
+            if is_compressed(path):
+                fields['compressed_bytes'] = os.path.getsize(path)
+            elif raw_bytes is None:
+                raw_bytes = os.path.getsize(path)
+        except OSError:
+            pass
+    if raw_bytes is not None:
+        fields['raw_bytes'] = raw_bytes
+    if lines is not None:
+        fields['lines'] = lines
+    entry: dict = INDEX_STATS.record(name, structure, meter, **fields)
+    REQUEST_LOG.warning('index_stats', index=name, **entry)
+    if INDEX_STATS_FILE:
+        try:
+            INDEX_STATS.write(INDEX_STATS_FILE)
+        except OSError as e:
+            REQUEST_LOG.error('file_error', path=INDEX_STATS_FILE,
+                              message=f'failed to write the index stats: {e}')
+
+
+def external_index():
+    """
+    Return the index held outside of this process, the sorted file or the perfect hash table
+    when one is configured, otherwise the shared memory index when one is published and
+    followed by this process.
+
+    Returns:
+        The SortedFile, the PerfectHash or the SharedIndex, None if the lines are loaded by
+        this process.
+    """
+    if SORTED_INDEX is not None:
+        return SORTED_INDEX
+    if PERFECT_HASH_INDEX is not None:
+        return PERFECT_HASH_INDEX
+    if SHARED_INDEX is not None:
+        return SHARED_INDEX.current()
+    return None
+
+
+def current_index():
+    """
+    Return the index the queries are answered from, the sorted file, the perfect hash table
+    or the shared memory index (see external_index), otherwise the lines loaded by this process.
+
+    Returns:
+        The SortedFile, the PerfectHash, the SharedIndex, the set or list of lines, or None
+        if nothing is loaded yet.
+    """
+    external = external_index()
+    return external if external is not None else ALL_LINES
+
+
+def reload_incremental(path: str) -> bool:
+    """
+    Bring the live set up to date with the corpus file without rebuilding it. In append mode
+    only the lines appended since the last reload are read and inserted, in diff mode only
+    the lines of the changed chunks are inserted or deleted. The whole set is only built on
+    the first load, or in append mode when the file was truncated or replaced.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        bool: True if the index was loaded or updated by this call.
+    """
+    global ALL_LINES, CORPUS_READER, LAST_RELOAD_CHECK  # pylint: disable=W0603
+    following: bool = (isinstance(ALL_LINES, set) and CORPUS_READER is not None
+                       and CORPUS_READER.path == path)
+    if following:
+        now: float = time.monotonic()
+        if now - LAST_RELOAD_CHECK < RELOAD_CHECK_INTERVAL:
+            return False
+        LAST_RELOAD_CHECK = now
+        if not CORPUS_READER.changed():
+            return False
+    # once an index exists, a reload in progress on another thread is not waited for
+    if not RELOAD_LOCK.acquire(blocking=not following):
+        return False
+    try:
+        # the threads that waited for the first load find the index loaded by another thread
+        if not following and (isinstance(ALL_LINES, set) and CORPUS_READER is not None
+                              and CORPUS_READER.path == path):
+            return False
+        if following:
+            update_start: float = time.perf_counter()
+            changed: Optional[int] = CORPUS_READER.update(ALL_LINES)
+            if changed is not None:
+                CORPUS_CHANGED_LINES.inc(changed)
+                REQUEST_LOG.info('corpus_reloaded', path=path, mode=RELOAD_MODE, changed=changed,
+                                 duration_ms=round((time.perf_counter() - update_start) * 1000, 3))
+                return True
+            REQUEST_LOG.warning('corpus_replaced', path=path,
+                                message='truncated or replaced, rebuilding the index')
+        reader = (DiffReader(path, LINE_NORMALIZER) if RELOAD_MODE == DIFF
+                  else TailReader(path, LINE_NORMALIZER))
+        # the new set is built aside and swapped in, queries keep using the old one meanwhile
+        with PROFILER.track_allocations('index_build'), BuildMeter() as meter:
+            ALL_LINES = reader.load()
+        CORPUS_READER = reader
+        record_build('corpus', ALL_LINES, meter, path, reader.read_counts.lines,
+                     reader.read_counts.raw_bytes)
+    except OSError as e:
+        REQUEST_LOG.error('file_error', path=path,
+                          message=f'something went wrong check the file existence or '
+                                  f'permissions and try again: {e}')
+        if ALL_LINES is None:
+            ALL_LINES = set()
+    finally:
+        RELOAD_LOCK.release()
+    return True
+
+
+def searching_string(path: str, search_string: str | bytes, reread: bool,
+                     algorithm_used: callable, phases: Optional[Dict[str, int]] = None) -> bool:
     """
     Search for the exact string in the file using the specified algorithm.
+    When NORMALIZE is configured, the query is normalized like the lines of the index.
 
     Args:
         path (str): Path to the file.
-        search_string (str): String to search for.
+        search_string (str | bytes): String to search for, the raw bytes of the query
+        in bytes mode.
         reread (bool): Whether to re-read the file on each query.
         algorithm_used (function): Search algorithm to use 
         (default is "linear" for linear search algorithm).
+        phases (Optional[Dict[str, int]]): If given, the duration in nanoseconds of the
+        corpus load or reload ('load') and of the search algorithm ('search') are stored in it.
 
     Returns:
         bool: True if the string is found, False otherwise.
 
     Raises:
         Exception: If an error occurs while reading the file or the search algorithm is invalid.
+        IndexNotPublished: If a shared index is configured and none was published within
+        SHARED_INDEX_WAIT seconds.
 
     Global Variables:
         file_lines_present (List[str]): Global variable holding the list of lines in a file.
         current_algorithm (str): Global variable holding the name of the algorithm used.
     """
-    # printing the name of the algorithm in use
-    print('--------------------------------------------------------')
-    print(f'\nDEBUG Algorithm: {str(algorithm_used).split()[1]}')
     # holding the list of lines in a file, and also I am suppressing for this reason
-    global ALL_LINES  # pylint: disable=W0603
+    global ALL_LINES, CORPUS_GENERATION  # pylint: disable=W0603
     # holds the True if the string is found and False if not or Exception occurs
     found_status: bool = False
     try:
-
+        load_start: int = time.perf_counter_ns()
+        # True when the corpus is loaded or reloaded by this call
+        loaded: bool = False
+        # the query is normalized once, the same way as the lines of the index
+        if NORMALIZER is not None:
+            search_string = NORMALIZER(search_string)
+
+        # the sorted file, the perfect hash table and the index published in shared memory
+        # are looked up directly, they are searched by their own structure so the algorithm
+        # does not apply, and they are never loaded by this process
+        external = external_index() if not reread else None
+        if external is None and SHARED_INDEX is not None and not reread:
+            # the worker waits for the loader instead of building a private copy of the corpus
+            external = SHARED_INDEX.wait(SHARED_INDEX_WAIT)
+            if external is None:
+                raise IndexNotPublished(f'no index published at {SHARED_INDEX_POINTER}')
+        if external is not None:
+            found_status = search_string in external
+            if phases is not None:
+                phases['load'] = 0
+                phases['search'] = time.perf_counter_ns() - load_start
+            return found_status
+
+        # in append and diff mode only the lines that changed since the last query are applied
+        if reread and RELOAD_MODE in (APPEND, DIFF):
+            loaded = reload_incremental(path)
         # if REREAD_ON_QUERY True reread the path afresh considering that it COULD change
-        if reread:
+        elif reread:
             # using the list approach will be faster since retrieving the list
             # and then converting to it into a set will lead to poor performance
             # especially it is a repetitive operation due to rereading
-
-            ALL_LINES = list(retrieve_all_file_lines(path))
+            with PROFILER.track_allocations('reread'):
+                ALL_LINES = (retrieve_all_file_bytes(path) if BYTES_MODE
+                             else list(retrieve_all_file_lines(path)))
+                if NORMALIZER is not None:
+                    ALL_LINES = list(map(NORMALIZER, ALL_LINES))
+            loaded = True
         # no reread thus the best way to facilitate searching for preloaded files is Set
         # changing the list into a set that will contain only unique data without duplicates
         if ALL_LINES is None:
-            ALL_LINES = {line.strip() for line in retrieve_all_file_lines(path)}
+            # the decompressed bytes and lines are counted while the stream is indexed
+            counter: ReadCounter = ReadCounter()
+            with PROFILER.track_allocations('index_build'), BuildMeter() as meter:
+                # a compressed corpus is indexed while it is decompressed
+                if is_compressed(path):
+                    lines = stream_file_lines(path, BYTES_MODE, counter)
+                else:
+                    lines = (retrieve_all_file_bytes(path) if BYTES_MODE
+                             else retrieve_all_file_lines(path))
+                # in bytes mode the lines are never decoded, bytes.strip strips ASCII whitespace
+                ALL_LINES = set(map(bytes.strip if BYTES_MODE else LINE_NORMALIZER, lines))
+            if is_compressed(path):
+                record_build('corpus', ALL_LINES, meter, path, counter.lines, counter.raw_bytes)
+            else:
+                record_build('corpus', ALL_LINES, meter, path, len(lines))
+            loaded = True
+        search_start: int = time.perf_counter_ns()
+        if loaded:
+            CORPUS_GENERATION += 1
+            CORPUS_RELOADS.inc()
+            CORPUS_RELOAD_DURATION.observe((search_start - load_start) / 1e9)
         # invocation of the search algorithm function
         found_status = algorithm_used(ALL_LINES, search_string)
+        if phases is not None:
+            phases['load'] = search_start - load_start
+            phases['search'] = time.perf_counter_ns() - search_start
 
     except ValueError as e:
-        print(f"Error: Invalid algorithm type detected check the algorithm value.\n{e}")
+        REQUEST_LOG.error('search_error', algorithm=algorithm_used.__name__,
+                          message=f'Invalid algorithm type detected check the algorithm value: {e}')
         found_status = False
     # returning the status
     return found_status
 
 
-def client_conn(connection: socket.socket, address: Tuple[str, int]):
+def warm_up(path: str, query_count: int = WARMUP_QUERIES) -> float:
+    """
+    Load the corpus and build the index, then run warmup queries against it so that
+    the first client after a restart does not pay for the load.
+    Marks the server as ready when done.
+
+    Args:
+        path (str): Path to the file.
+        query_count (int): Number of warmup queries, half of them taken from the corpus
+        and half of them missing from it. Only one query is run when the file is reread
+        on every query.
+
+    Returns:
+        float: Duration of the warm up in seconds.
+    """
+    start: float = time.perf_counter()
+    algorithm_used = algorithms[SEARCH_ALGORITHM]
+    # a worker of a shared index is only ready once the loader has published it
+    while (SHARED_INDEX is not None and not REREAD_ON_QUERY
+           and SHARED_INDEX.wait(SHARED_INDEX_WAIT) is None):
+        REQUEST_LOG.warning('index_unavailable', pointer=SHARED_INDEX_POINTER,
+                            message='waiting for the shared index to be published')
+    # the first search loads the corpus and builds the index
+    searching_string(path, b'' if BYTES_MODE else '', REREAD_ON_QUERY, algorithm_used)
+    index = current_index()
+    if not REREAD_ON_QUERY and index:
+        # the shared memory index and the sorted file are not iterated, they are only warmed up
+        # with misses
+        for line in islice(iter(index) if isinstance(index, set) else (), query_count // 2):
+            searching_string(path, line.strip(), False, algorithm_used)
+        for number in range(query_count - query_count // 2):
+            query: str = f'warmup;{number};'
+            searching_string(path, query.encode('utf-8') if BYTES_MODE else query, False,
+                             algorithm_used)
+    # the fuzzy index is built before the first fuzzy query instead of by it
+    if FUZZY_ENABLED:
+        fuzzy_index()
+    if POSITIONAL_INDEX_ENABLED:
+        positional_index()
+    duration: float = time.perf_counter() - start
+    SERVER_READY.set()
+    REQUEST_LOG.warning('ready', path=path, duration_ms=round(duration * 1000, 3),
+                        lines=len(current_index() or ()))
+    return duration
+
+
+def record_phases(phases: Dict[str, int]):
+    """
+    Record the duration of the phases of a request on the phase latency histogram.
+
+    Args:
+        phases (Dict[str, int]): The duration in nanoseconds of every phase of the request.
+
+    Returns:
+        None
+    """
+    for phase, duration_ns in phases.items():
+        PHASE_LATENCY.labels(phase).observe(duration_ns / 1e9)
+
+
+def record_request(address: Tuple[str, int], query: str | bytes, found: bool, start_time: int,
+                   phases: Dict[str, int]):
+    """
+    Record the metrics and the log record of a completed search request.
+
+    Args:
+        address (Tuple[str, int]): A tuple containing the client's IP address and port number.
+        query (str | bytes): The search query of the request, in bytes mode it is only
+        decoded when the request is logged.
+        found (bool): Whether the query was found.
+        start_time (int): The perf_counter_ns() value when the request started.
+        phases (Dict[str, int]): The duration in nanoseconds of every phase of the request.
+
+    Returns:
+        None
+    """
+    duration: float = (time.perf_counter_ns() - start_time) / 1e9
+    REQUESTS_TOTAL.labels('found' if found else 'not_found', SEARCH_ALGORITHM).inc()
+    REQUEST_LATENCY.labels(SEARCH_ALGORITHM).observe(duration)
+    record_phases(phases)
+
+    # one structured record per request instead of several prints, the timestamp
+    # is formatted by the log writer thread and not by the request thread
+    if REQUEST_LOG.is_enabled(INFO):
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', errors='replace')
+        REQUEST_LOG.info('request', query=query, client=address, found=found,
+                         algorithm=SEARCH_ALGORITHM, duration_ms=round(duration * 1000, 3),
+                         phases_us={phase: duration_ns // 1000
+                                    for phase, duration_ns in phases.items()},
+                         ssl=USE_SSL_CONNECTION, reread=REREAD_ON_QUERY)
+
+
+def build_hash_array(lines: Set[str] | Set[bytes], generation: int):
+    """
+    Build the hash array engine of a corpus generation and publish it, run on a background
+    thread that holds HASH_ARRAY_LOCK. The previous engine stays published until the new
+    one replaces it.
+
+    Args:
+        lines (Set[str] | Set[bytes]): The set of lines of the corpus generation.
+        generation (int): The corpus generation of the lines.
+
+    Returns:
+        None
+    """
+    global HASH_ARRAY  # pylint: disable=W0603
+    try:
+        build_start: float = time.perf_counter()
+        with PROFILER.track_allocations('hash_array_build'), BuildMeter() as meter:
+            engine: HashArrayIndex = HashArrayIndex(lines)
+        HASH_ARRAY = (generation, engine)
+        REQUEST_LOG.warning('hash_array', lines=len(engine),
+                            duration_ms=round((time.perf_counter() - build_start) * 1000, 3))
+        record_build('hash_array', engine, meter)
+    finally:
+        HASH_ARRAY_LOCK.release()
+
+
+def hash_array_index() -> Optional[HashArrayIndex]:
+    """
+    Return the hash array engine of the loaded corpus. On first use and after a reload the
+    engine is built on a background thread, no request ever waits for it: until the new
+    engine is published the queries are answered from the set of lines, as the previous
+    engine does not hold the lines of the current generation.
+
+    Returns:
+        Optional[HashArrayIndex]: The engine of the current corpus generation, None when it
+        is being built or when the corpus is not held as a set.
+    """
+    # the generation is read before the lines, so an engine is never labeled newer than them
+    generation: int = CORPUS_GENERATION
+    built = HASH_ARRAY
+    if built is not None and built[0] == generation:
+        return built[1]
+    lines = ALL_LINES
+    if not isinstance(lines, set) or not HASH_ARRAY_LOCK.acquire(blocking=False):
+        return None
+    built = HASH_ARRAY
+    if built is not None and built[0] == generation:
+        # a build finished between the first check and the lock
+        HASH_ARRAY_LOCK.release()
+        return built[1]
+    try:
+        threading.Thread(target=build_hash_array, args=(lines, generation),
+                         name='hash-array-build', daemon=True).start()
+    except RuntimeError:
+        HASH_ARRAY_LOCK.release()
+        raise
+    return None
+
+
+def hash_array_search(all_lines: Set[str] | List[str], q_string: str) -> bool:
+    """
+    Search for the exact string with the hash array engine, the batches are looked up
+    all at once by search_batch. Falls back to a membership test of the lines while the
+    engine is being built, or when the corpus is reread on every query.
+
+    Args:
+        all_lines (Set[str] | List[str]): The lines of the corpus.
+        q_string (str): The string to search for.
+
+    Returns:
+        bool: True if the string is found, False otherwise.
+    """
+    engine: Optional[HashArrayIndex] = hash_array_index() if all_lines is ALL_LINES else None
+    return q_string in (engine if engine is not None else all_lines)
+
+
+# the engines built from the state of the server are registered once they are defined
+algorithms["hash_array"] = hash_array_search
+
+# an unknown algorithm stops the server instead of failing every query
+if SEARCH_ALGORITHM not in algorithms:
+    raise ValueError(f'SEARCH_ALGORITHM must be one of {", ".join(algorithms)}, '
+                     f'not {SEARCH_ALGORITHM}')
+
+# the hash array engine is only available with NumPy installed
+if SEARCH_ALGORITHM == 'hash_array' and not NUMPY_AVAILABLE:
+    raise ImportError('SEARCH_ALGORITHM=hash_array needs NumPy, install it with pip install numpy')
+
+
+def search_batch(queries: List[str] | List[bytes], reread: bool = REREAD_ON_QUERY) -> bytes:
+    """
+    Search for every query of a batch, the corpus is reread at most once per batch.
+
+    Args:
+        queries (List[str] | List[bytes]): The queries of the batch, bytes in bytes mode.
+        reread (bool): Whether the corpus is reread before the first query.
+
+    Returns:
+        bytes: One byte per query, 1 if the query was found and 0 if not.
+    """
+    if not queries:
+        return b''
+    algorithm_used = algorithms[SEARCH_ALGORITHM]
+    results = bytearray(len(queries))
+    # the first query loads or rereads the corpus when needed
+    results[0] = 0x31 if searching_string(FILE_PATH, queries[0], reread, algorithm_used) else 0x30
+    index = current_index() if not reread else ALL_LINES
+    engine: Optional[HashArrayIndex] = (hash_array_index()
+                                        if algorithm_used is hash_array_search else None)
+    if engine is not None:
+        # the whole batch is resolved with a few vectorized operations
+        rest = queries[1:] if NORMALIZER is None else list(map(NORMALIZER, queries[1:]))
+        results[1:] = engine.contains_batch(rest)
+    elif isinstance(index, (SharedIndex, SortedFile, PerfectHash)) or (
+            isinstance(index, set) and algorithm_used in (linear_search, hash_array_search)):
+        # the same answer as linear_search over the set index, without a call per query,
+        # also while the hash array engine is being built
+        rest = queries[1:] if NORMALIZER is None else map(NORMALIZER, queries[1:])
+        results[1:] = (0x31 if query in index else 0x30 for query in rest)
+    else:
+        for position in range(1, len(queries)):
+            results[position] = 0x31 if searching_string(FILE_PATH, queries[position], False,
+                                                         algorithm_used) else 0x30
+    return bytes(results)
+
+
+def load_named_corpus(name: str, path: str) -> set:
+    """
+    Build the set of lines of a named corpus, like the set of the main corpus.
+    Unlike the main corpus a file that can not be read is not indexed as empty.
+
+    Args:
+        name (str): The name of the corpus.
+        path (str): The path of its file, may be compressed.
+
+    Returns:
+        set: The normalized lines, the raw bytes of the lines in bytes mode.
+
+    Raises:
+        OSError, EOFError, UnicodeDecodeError: If the file can not be read.
+    """
+    build_start: float = time.perf_counter()
+    # the decompressed bytes and lines are counted while the stream is indexed
+    counter: ReadCounter = ReadCounter()
+    with PROFILER.track_allocations('named_corpus_build'), BuildMeter() as meter:
+        if is_compressed(path):
+            lines = chain.from_iterable(iter_line_blocks(path, BYTES_MODE, counter=counter))
+        else:
+            with open_corpus(path, binary=BYTES_MODE) as f:
+                lines = f.read().splitlines() if BYTES_MODE else f.readlines()
+        corpus: set = set(map(bytes.strip if BYTES_MODE else LINE_NORMALIZER, lines))
+    REQUEST_LOG.warning('named_corpus', corpus=name, path=path, lines=len(corpus),
+                        duration_ms=round((time.perf_counter() - build_start) * 1000, 3))
+    if is_compressed(path):
+        record_build(f'corpus:{name}', corpus, meter, path, counter.lines, counter.raw_bytes)
+    else:
+        record_build(f'corpus:{name}', corpus, meter, path, len(lines))
+    return corpus
+
+
+def search_corpus(name: str, queries: List[str] | List[bytes],
+                  phases: Dict[str, int]) -> bytes:
+    """
+    Search for every query of a request in a named corpus, loaded first when it is not
+    resident. The queries are normalized like the ones of the main corpus.
+
+    Args:
+        name (str): The name of the corpus.
+        queries (List[str] | List[bytes]): The queries, bytes in bytes mode.
+        phases (Dict[str, int]): The duration in nanoseconds of the load ('load') and of the
+        lookups ('search') are stored in it.
+
+    Returns:
+        bytes: One byte per query, 1 if the query was found and 0 if not.
+
+    Raises:
+        OSError, EOFError, UnicodeDecodeError: If the corpus is loaded and its file can
+        not be read.
+    """
+    load_start: int = time.perf_counter_ns()
+    lines: set = CORPORA.get(name)
+    search_start: int = time.perf_counter_ns()
+    phases['load'] = search_start - load_start
+    rest = queries if NORMALIZER is None else map(NORMALIZER, queries)
+    results: bytes = bytes(0x31 if query in lines else 0x30 for query in rest)
+    phases['search'] = time.perf_counter_ns() - search_start
+    found_count: int = results.count(b'1')
+    CORPUS_QUERIES.labels(name, 'found').inc(found_count)
+    CORPUS_QUERIES.labels(name, 'not_found').inc(len(results) - found_count)
+    return results
+
+
+def fuzzy_index() -> Optional[FuzzyIndex]:
+    """
+    Return the fuzzy index of the loaded corpus, built on first use and rebuilt after a reload.
+    While one thread rebuilds it the other fuzzy queries keep using the previous index.
+
+    Returns:
+        Optional[FuzzyIndex]: The fuzzy index, None when the corpus is not held as a set,
+        i.e. when it is reread on every query or held in shared memory.
+    """
+    global FUZZY_INDEX, FUZZY_GENERATION  # pylint: disable=W0603
+    lines = ALL_LINES
+    if not isinstance(lines, set):
+        return None
+    if FUZZY_INDEX is not None and FUZZY_GENERATION == CORPUS_GENERATION:
+        return FUZZY_INDEX
+    if not FUZZY_LOCK.acquire(blocking=FUZZY_INDEX is None):
+        return FUZZY_INDEX
+    try:
+        generation: int = CORPUS_GENERATION
+        if FUZZY_INDEX is None or FUZZY_GENERATION != generation:
+            build_start: float = time.perf_counter()
+            with PROFILER.track_allocations('fuzzy_index_build'), BuildMeter() as meter:
+                FUZZY_INDEX = FuzzyIndex([line.decode('utf-8', errors='replace') for line in lines]
+                                         if BYTES_MODE else list(lines), FUZZY_MAX_DISTANCE)
+            FUZZY_GENERATION = generation
+            REQUEST_LOG.warning('fuzzy_index', lines=len(FUZZY_INDEX),
+                                duration_ms=round((time.perf_counter() - build_start) * 1000, 3))
+            record_build('fuzzy', FUZZY_INDEX, meter)
+    finally:
+        FUZZY_LOCK.release()
+    return FUZZY_INDEX
+
+
+def fuzzy_response(query: str, max_distance: int, address: Tuple[str, int], start_time: int,
+                   phases: Dict[str, int]) -> bytes:
+    """
+    Answer a FUZZY frame with the corpus lines closest to the query.
+
+    Args:
+        query (str): The query.
+        max_distance (int): The maximum edit distance asked by the client, 0 for the default.
+        address (Tuple[str, int]): A tuple containing the client's IP address and port number.
+        start_time (int): The perf_counter_ns() value when the frame was received.
+        phases (Dict[str, int]): The duration in nanoseconds of the phases so far.
+
+    Returns:
+        bytes: The encoded response frame.
+    """
+    if not FUZZY_ENABLED:
+        return encode_frame(ERROR, b'fuzzy queries are disabled')
+    # a fuzzy query never waits for a slot, the client retries later
+    if not FUZZY_SLOTS.acquire(blocking=False):
+        FUZZY_REJECTED.inc()
+        return encode_frame(ERROR, b'too many fuzzy queries, retry later')
+    try:
+        index: Optional[FuzzyIndex] = fuzzy_index()
+        if index is None:
+            return encode_frame(ERROR, b'fuzzy queries need the corpus preloaded in memory')
+        if NORMALIZER is not None:
+            query = NORMALIZER(query)
+        search_start: int = time.perf_counter_ns()
+        result = index.search(query, max_distance or FUZZY_MAX_DISTANCE, FUZZY_RESULT_LIMIT,
+                              time.monotonic() + FUZZY_TIME_BUDGET_MS / 1000)
+        phases['search'] = time.perf_counter_ns() - search_start
+    finally:
+        FUZZY_SLOTS.release()
+    duration: float = (time.perf_counter_ns() - start_time) / 1e9
+    REQUESTS_TOTAL.labels('found' if result.matches else 'not_found', 'fuzzy').inc()
+    REQUEST_LATENCY.labels('fuzzy').observe(duration)
+    record_phases(phases)
+    if REQUEST_LOG.is_enabled(INFO):
+        REQUEST_LOG.info('fuzzy', query=query, client=address, matches=len(result.matches),
+                         truncated=result.truncated, duration_ms=round(duration * 1000, 3))
+    payload: bytes = '\n'.join(f'{distance}\t{line}'
+                               for distance, line in result.matches).encode('utf-8')
+    return encode_frame(FUZZY | RESPONSE, payload, TRUNCATED if result.truncated else 0)
+
+
+def positional_index() -> Optional[PositionalIndex]:
+    """
+    Return the positional index of the corpus file, built on first use and rebuilt after a
+    reload. While one thread rebuilds it the other queries keep using the previous index.
+
+    Returns:
+        Optional[PositionalIndex]: The positional index, None if the file can not be read.
+    """
+    global POSITIONAL, POSITIONAL_GENERATION  # pylint: disable=W0603
+    if POSITIONAL is not None and POSITIONAL_GENERATION == CORPUS_GENERATION:
+        return POSITIONAL
+    if not POSITIONAL_LOCK.acquire(blocking=POSITIONAL is None):
+        return POSITIONAL
+    try:
+        generation: int = CORPUS_GENERATION
+        if POSITIONAL is None or POSITIONAL_GENERATION != generation:
+            build_start: float = time.perf_counter()
+            # the set index drops the duplicates and the order, the file is read again
+            with PROFILER.track_allocations('positional_index_build'), BuildMeter() as meter, \
+                    open_corpus(FILE_PATH) as f:
+                POSITIONAL = PositionalIndex(f, LINE_NORMALIZER)
+                # the file is read to its end, the position is its decompressed size
+                raw_bytes: int = f.buffer.tell()
+            POSITIONAL_GENERATION = generation
+            REQUEST_LOG.warning('positional_index', lines=POSITIONAL.lines,
+                                distinct=len(POSITIONAL), repeated=POSITIONAL.repeated,
+                                duration_ms=round((time.perf_counter() - build_start) * 1000, 3))
+            record_build('positional', POSITIONAL, meter, FILE_PATH, POSITIONAL.lines, raw_bytes)
+    except READ_ERRORS as e:
+        REQUEST_LOG.error('file_error', path=FILE_PATH,
+                          message=f'something went wrong check the file existence or '
+                                  f'permissions and try again: {e}')
+    finally:
+        POSITIONAL_LOCK.release()
+    return POSITIONAL
+
+
+def positional_response(kind: int, query: str, offset: int, limit: int,
+                        address: Tuple[str, int], start_time: int,
+                        phases: Dict[str, int]) -> bytes:
+    """
+    Answer a COUNT or POSITIONS frame from the positional index.
+
+    Args:
+        kind (int): COUNT or POSITIONS.
+        query (str): The query.
+        offset (int): The number of line numbers skipped, for POSITIONS.
+        limit (int): The maximum number of line numbers, 0 or above POSITIONS_PAGE_SIZE for
+        POSITIONS_PAGE_SIZE.
+        address (Tuple[str, int]): A tuple containing the client's IP address and port number.
+        start_time (int): The perf_counter_ns() value when the frame was received.
+        phases (Dict[str, int]): The duration in nanoseconds of the phases so far.
+
+    Returns:
+        bytes: The encoded response frame.
+    """
+    if not POSITIONAL_INDEX_ENABLED:
+        return encode_frame(ERROR, b'count and positions queries are disabled')
+    index: Optional[PositionalIndex] = positional_index()
+    if index is None:
+        return encode_frame(ERROR, b'the corpus file can not be read')
+    if NORMALIZER is not None:
+        query = NORMALIZER(query)
+    search_start: int = time.perf_counter_ns()
+    if kind == COUNT:
+        count: int = index.count(query)
+        response: bytes = encode_frame(COUNT | RESPONSE, str(count).encode('utf-8'))
+    else:
+        limit = min(limit, POSITIONS_PAGE_SIZE) if limit > 0 else POSITIONS_PAGE_SIZE
+        count, positions = index.page(query, offset, limit)
+        response = encode_frame(POSITIONS | RESPONSE, encode_positions(count, positions),
+                                MORE if offset + len(positions) < count else 0)
+    phases['search'] = time.perf_counter_ns() - search_start
+    duration: float = (time.perf_counter_ns() - start_time) / 1e9
+    REQUESTS_TOTAL.labels('found' if count else 'not_found', 'positional').inc()
+    REQUEST_LATENCY.labels('positional').observe(duration)
+    record_phases(phases)
+    if REQUEST_LOG.is_enabled(INFO):
+        REQUEST_LOG.info('count' if kind == COUNT else 'positions', query=query, client=address,
+                         count=count, offset=offset, duration_ms=round(duration * 1000, 3))
+    return response
+
+
+def handle_frame(frame: Frame, address: Tuple[str, int], start_time: int,
+                 stream: Dict[str, int]) -> bytes:
+    """
+    Answer a single request frame of a framed connection.
+
+    Args:
+        frame (Frame): The request frame, its payload is a view into the receive buffer.
+        address (Tuple[str, int]): A tuple containing the client's IP address and port number.
+        start_time (int): The perf_counter_ns() value when the frame was received.
+        stream (Dict[str, int]): The running totals ('chunks', 'queries', 'found') of the
+        query stream of the connection, updated by the STREAM frames.
+
+    Returns:
+        bytes: The encoded response frame.
+    """
+    if frame.kind not in (QUERY, BATCH, STREAM, FUZZY, COUNT, POSITIONS):
+        REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+        return encode_frame(ERROR, f'unknown frame type {frame.kind:#x}'.encode('utf-8'))
+    payload: memoryview = frame.payload
+    offset: int = 0
+    limit: int = 0
+    if frame.kind == POSITIONS:
+        if len(payload) < POSITIONS_REQUEST.size:
+            REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+            return encode_frame(ERROR, b'POSITIONS payload without offset and limit')
+        offset, limit = POSITIONS_REQUEST.unpack_from(payload)
+        payload = payload[POSITIONS_REQUEST.size:]
+    # the exact lookups may name the corpus they are looked up in
+    corpus: Optional[str] = None
+    if frame.kind in (QUERY, BATCH, STREAM) and frame.flags & NAMED_CORPUS:
+        try:
+            corpus, payload = decode_corpus_name(payload)
+        except FrameError as fe:
+            REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+            return encode_frame(ERROR, str(fe).encode('utf-8'))
+        if corpus not in CORPORA:
+            REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+            return encode_frame(ERROR, f'unknown corpus {corpus}'.encode('utf-8'))
+    try:
+        if BYTES_MODE and frame.kind in (QUERY, BATCH, STREAM):
+            # the exact lookups use the raw bytes, copied once out of the receive buffer
+            queries: str | bytes = check_utf8(bytes(payload))
+        else:
+            # the payload is decoded straight from the receive buffer without copying it first
+            queries = str(payload, 'utf-8')
+    except UnicodeDecodeError as ud:
+        REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+        REQUEST_LOG.error('request_error', client=address,
+                          message=f'failed to decode the frame payload: {ud}')
+        return encode_frame(ERROR, b'payload is not valid UTF-8')
+    decode_end: int = time.perf_counter_ns()
+    phases: Dict[str, int] = {'decode': decode_end - start_time}
+
+    if frame.kind == FUZZY:
+        return fuzzy_response(queries, frame.flags, address, start_time, phases)
+
+    if frame.kind in (COUNT, POSITIONS):
+        return positional_response(frame.kind, queries, offset, limit, address, start_time,
+                                   phases)
+
+    batch: List[str] | List[bytes] = ([queries] if frame.kind == QUERY
+                                      else queries.split(b'\n' if BYTES_MODE else '\n'))
+    if corpus is not None:
+        try:
+            results: bytes = search_corpus(corpus, batch, phases)
+        except READ_ERRORS as e:
+            REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+            REQUEST_LOG.error('file_error', path=CORPORA.paths[corpus],
+                              message=f'failed to load the corpus {corpus}: {e}')
+            return encode_frame(ERROR, f'corpus {corpus} can not be loaded'.encode('utf-8'))
+
+    try:
+        if frame.kind == QUERY:
+            found: bool = (results == b'1' if corpus is not None
+                           else searching_string(FILE_PATH, queries, REREAD_ON_QUERY,
+                                                 algorithms[SEARCH_ALGORITHM], phases))
+        elif corpus is None:
+            # a query stream rereads the corpus once, before its first chunk
+            reread: bool = REREAD_ON_QUERY and (frame.kind == BATCH or stream['chunks'] == 0)
+            results = search_batch(batch, reread)
+            phases['search'] = time.perf_counter_ns() - decode_end
+    except IndexNotPublished as e:
+        REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+        REQUEST_LOG.error('index_unavailable', client=address, message=str(e))
+        return encode_frame(ERROR, b'the shared index is not published yet')
+
+    if frame.kind == QUERY:
+        record_request(address, queries, found, start_time, phases)
+        return encode_frame(QUERY | RESPONSE, FOUND_RESPONSE if found else NOT_FOUND_RESPONSE)
+
+    found_count: int = results.count(b'1')
+    REQUESTS_TOTAL.labels('found', SEARCH_ALGORITHM).inc(found_count)
+    REQUESTS_TOTAL.labels('not_found', SEARCH_ALGORITHM).inc(len(batch) - found_count)
+    REQUEST_LATENCY.labels(SEARCH_ALGORITHM).observe((time.perf_counter_ns() - start_time) / 1e9)
+    record_phases(phases)
+
+    if frame.kind == STREAM:
+        stream['chunks'] += 1
+        stream['queries'] += len(batch)
+        stream['found'] += found_count
+        # a single record per stream, the chunks of a long stream are only logged at DEBUG
+        if REQUEST_LOG.is_enabled(DEBUG):
+            REQUEST_LOG.debug('stream_chunk', client=address, chunk=stream['chunks'],
+                              queries=len(batch), found=found_count)
+        if frame.flags & LAST_CHUNK:
+            REQUEST_LOG.info('stream', client=address, chunks=stream['chunks'],
+                             queries=stream['queries'], found=stream['found'],
+                             algorithm=SEARCH_ALGORITHM)
+            stream.update(chunks=0, queries=0, found=0)
+        return encode_frame(STREAM | RESPONSE, results, frame.flags & LAST_CHUNK)
+
+    if REQUEST_LOG.is_enabled(INFO):
+        REQUEST_LOG.info('batch', client=address, queries=len(batch), found=found_count,
+                         algorithm=SEARCH_ALGORITHM, bytes=len(frame.payload),
+                         phases_us={phase: duration_ns // 1000
+                                    for phase, duration_ns in phases.items()})
+    return encode_frame(BATCH | RESPONSE, results)
+
+
+def send_frames(connection: socket.socket, address: Tuple[str, int], data: bytes,
+                send_lock: threading.Lock):
+    """
+    Send responses on a framed connection under the write deadline, a client that does
+    not read its responses is shut down once the deadline expires instead of holding the
+    sending thread.
+
+    Args:
+        connection (socket.socket): The socket object representing the client connection.
+        address (Tuple[str, int]): A tuple containing the client's IP address and port number.
+        data (bytes): The encoded response frames.
+        send_lock (threading.Lock): Serialises the responses sent on the connection.
+
+    Returns:
+        None
+
+    Raises:
+        OSError: If the client is gone or the write deadline expired.
+    """
+    send_start: int = time.perf_counter_ns()
+    with send_lock:
+        deadline = DEADLINES.arm(connection, WRITE, WRITE_TIMEOUT)
+        try:
+            connection.sendall(data)
+        finally:
+            DEADLINES.cancel(deadline)
+    if deadline.expired:
+        REQUEST_LOG.warning('timeout', client=address, kind=WRITE)
+        raise TimeoutError('the client did not read its responses')
+    PHASE_LATENCY.labels('send').observe((time.perf_counter_ns() - send_start) / 1e9)
+
+
+def answer_multiplexed(address: Tuple[str, int], frame: Frame, start_time: int,
+                       responses: queue.SimpleQueue):
+    """
+    Answer a multiplexed request frame on a worker of the pool, as soon as its search is done.
+    The worker never touches the socket, the response is queued for the writer of the
+    connection so a client that does not read cannot hold the shared workers.
+
+    Args:
+        address (Tuple[str, int]): A tuple containing the client's IP address and port number.
+        frame (Frame): The request frame, its payload copied out of the receive buffer.
+        start_time (int): The perf_counter_ns() value when the frame was received.
+        responses (queue.SimpleQueue): The responses waiting for the writer of the connection.
+
+    Returns:
+        None
+    """
+    try:
+        # the STREAM frames are answered in order by the reader, the totals are unused
+        response: bytes = handle_frame(frame, address, start_time, {})
+    except Exception as e:  # pylint: disable=broad-except
+        # the client waits for every request ID, it is answered even when the search fails
+        REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+        REQUEST_LOG.error('request_error', client=address, request_id=frame.request_id,
+                          message=f'multiplexed request failed: {e}')
+        response = encode_frame(ERROR, b'the request failed')
+    responses.put(tag_frame(response, frame.request_id))
+
+
+def write_multiplexed(connection: socket.socket, address: Tuple[str, int],
+                      responses: queue.SimpleQueue, send_lock: threading.Lock,
+                      in_flight: threading.BoundedSemaphore):
+    """
+    Send the responses of the multiplexed requests of a connection in the order their
+    searches complete, on a thread of the connection. The slot of a request is released
+    once its response is sent, or dropped when the client is gone. Ends on a None response.
+
+    Args:
+        connection (socket.socket): The socket object representing the client connection.
+        address (Tuple[str, int]): A tuple containing the client's IP address and port number.
+        responses (queue.SimpleQueue): The responses queued by the workers.
+        send_lock (threading.Lock): Serialises the responses sent on the connection.
+        in_flight (threading.BoundedSemaphore): The slots of the requests in flight.
+
+    Returns:
+        None
+    """
+    broken: bool = False
+    while True:
+        response: Optional[bytes] = responses.get()
+        if response is None:
+            return
+        try:
+            # once a send failed the client is gone, the rest of the responses are dropped
+            if not broken:
+                send_frames(connection, address, response, send_lock)
+        except OSError as e:
+            broken = True
+            REQUEST_LOG.debug('send_error', client=address, message=str(e))
+        finally:
+            in_flight.release()
+
+
+def serve_frames(connection: socket.socket, address: Tuple[str, int], reader: FrameReader):
+    """
+    Serve a framed connection, every request frame is answered in order until the
+    client closes the connection. The frames are parsed in place in the buffer of the
+    reader, so many frames received in one recv_into call are handled without copies.
+
+    The next frame is only received once the previous one is answered, so a client
+    streaming more chunks than the server keeps up with is held back by TCP flow control
+    instead of being buffered by the server.
+
+    The multiplexed frames (version 2, see protocol.py) are searched by the workers of
+    MULTIPLEX_POOL instead, at most MULTIPLEX_MAX_IN_FLIGHT of them per connection, and
+    answered by a writer thread of the connection in the order their searches complete.
+    The connection is only left once they are all answered. Every response is sent under
+    the write deadline.
+
+    Args:
+        connection (socket.socket): The socket object representing the client connection.
+        address (Tuple[str, int]): A tuple containing the client's IP address and port number.
+        reader (FrameReader): The reader holding the bytes received so far.
+
+    Returns:
+        None
+    """
+    # running totals of the query stream of the connection
+    stream: Dict[str, int] = {'chunks': 0, 'queries': 0, 'found': 0}
+    # the responses of the reader and of the workers are never interleaved
+    send_lock: threading.Lock = threading.Lock()
+    # one slot per multiplexed request being searched
+    in_flight: threading.BoundedSemaphore = threading.BoundedSemaphore(
+        max(MULTIPLEX_MAX_IN_FLIGHT, 1))
+    # the responses of the multiplexed requests, sent by the writer started with the first one
+    responses: queue.SimpleQueue = queue.SimpleQueue()
+    writer: Optional[threading.Thread] = None
+    # every request frame takes a token of the client, the unix socket clients are not limited
+    rate_limited: bool = ADMISSION.rate_per_second > 0 and connection.family != socket.AF_UNIX
+    try:
+        while True:
+            try:
+                frame: Optional[Frame] = reader.next_frame()
+            except FrameError as fe:
+                # the stream can not be resynchronised after an invalid header,
+                # the connection ends
+                REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+                REQUEST_LOG.error('request_error', client=address, message=f'invalid frame: {fe}')
+                send_frames(connection, address, encode_frame(ERROR, str(fe).encode('utf-8')),
+                            send_lock)
+                return
+            if frame is None:
+                # a partially received frame must complete within the read timeout,
+                # between frames the connection may stay idle up to the idle timeout
+                kind: str = READ if reader.buffered() else IDLE
+                deadline = DEADLINES.arm(connection, kind,
+                                         READ_TIMEOUT if kind == READ else IDLE_TIMEOUT)
+                try:
+                    received: int = reader.fill()
+                finally:
+                    DEADLINES.cancel(deadline)
+                if deadline.expired:
+                    REQUEST_LOG.warning('timeout', client=address, kind=kind)
+                    return
+                if not received:
+                    return
+                continue
+            start_time: int = time.perf_counter_ns()
+            if rate_limited and not ADMISSION.take(address[0]):
+                CLIENT_THROTTLED.labels(RATE_LIMITED).inc()
+                if REQUEST_LOG.is_enabled(INFO):
+                    REQUEST_LOG.info('throttled', client=address, reason=RATE_LIMITED)
+                send_frames(connection, address,
+                            tag_frame(encode_frame(ERROR, b'rate limited'), frame.request_id),
+                            send_lock)
+                continue
+            if frame.request_id is not None and frame.kind != STREAM:
+                if writer is None:
+                    writer = threading.Thread(target=write_multiplexed,
+                                              args=(connection, address, responses, send_lock,
+                                                    in_flight),
+                                              name='multiplex-writer', daemon=True)
+                    writer.start()
+                # waits for a free slot, the client is then held back by TCP flow control
+                in_flight.acquire()
+                # during a profiling window the request is answered under the profiler
+                answer = (PROFILER.profiled(answer_multiplexed) if PROFILER.active
+                          else answer_multiplexed)
+                # the payload is copied, the receive buffer is reused before the search runs
+                MULTIPLEX_POOL.submit(answer, address,
+                                      frame._replace(payload=memoryview(bytes(frame.payload))),
+                                      start_time, responses)
+                continue
+            send_frames(connection, address,
+                        tag_frame(handle_frame(frame, address, start_time, stream),
+                                  frame.request_id), send_lock)
+    finally:
+        # the caller closes the connection, the requests in flight are answered first, the
+        # writer gives their slots back within the write deadline even if the client never reads
+        if writer is not None:
+            for _ in range(max(MULTIPLEX_MAX_IN_FLIGHT, 1)):
+                in_flight.acquire()
+            responses.put(None)
+            writer.join()
+
+
+def client_conn(connection: socket.socket, address: Tuple[str, int], handshake_ns: int = 0):
     """
     Handle a client connection. This function is responsible for receiving
     a search query from a client,searching for the query in the file, 
     and sending a response back to the client. It also logs relevant information about
     the connection, search query, and execution time.
 
+    A connection whose first byte is the frame magic byte is served as a framed
+    connection (see protocol.py), any other connection uses the legacy format of
+    one query per connection.
+
     Args:
         connection (socket.socket): The socket object representing the client connection.
         address (Tuple[str, int]): A tuple containing the client's IP address and port number.
+        handshake_ns (int): Duration of the TLS handshake of the connection in nanoseconds,
+        0 when the connection is not using SSL.
 
     Returns:
         None
@@ -236,52 +1691,362 @@ def client_conn(connection: socket.socket, address: Tuple[str, int]):
     """
 
     # Record the start time before executing the search_string_present function
-    start_time: float = time.time() * 1000  # milliseconds
+    start_time: int = time.perf_counter_ns()
+    # duration in nanoseconds of every phase of the request path
+    phases: Dict[str, int] = {'handshake': handshake_ns} if handshake_ns else {}
+    ACTIVE_CONNECTIONS.inc()
 
     try:
+        # an idle client is shut down by the deadline timer instead of holding the thread, no
+        # request has started before its first bytes, the read deadline of the framed requests
+        # is armed by serve_frames once a frame is partially received
+        idle_deadline = DEADLINES.arm(connection, IDLE, IDLE_TIMEOUT)
+        try:
+            payload: bytes = connection.recv(MAX_PAYLOAD_SIZE)
+        finally:
+            DEADLINES.cancel(idle_deadline)
+        if idle_deadline.expired:
+            REQUEST_LOG.warning('timeout', client=address, kind=IDLE)
+            return
+        recv_end: int = time.perf_counter_ns()
+        phases['recv'] = recv_end - start_time
+
+        # framed connections are handed over to the frame loop with the bytes received so far
+        if payload[:1] == bytes((MAGIC,)):
+            reader = FrameReader(connection, FRAME_BUFFER_SIZE, MAX_FRAME_SIZE)
+            reader.feed(payload)
+            serve_frames(connection, address, reader)
+            return
+
         # The server strips any \x00 characters from the end of the payload it receives
-        search_query = connection.recv(MAX_PAYLOAD_SIZE).strip(b'\x00').decode('utf-8')
+        search_query: str | bytes = (check_utf8(payload.strip(b'\x00')) if BYTES_MODE
+                                     else payload.strip(b'\x00').decode('utf-8'))
+        phases['decode'] = time.perf_counter_ns() - recv_end
 
         # Call the search_string_present method to check if the search query exists in the file
         # Pass the linear search algorithm as the search algorithm
-        if searching_string(FILE_PATH, search_query, REREAD_ON_QUERY, algorithms['linear']):
+        found: bool = searching_string(FILE_PATH, search_query, REREAD_ON_QUERY,
+                                       algorithms[SEARCH_ALGORITHM], phases)
+        if found:
             response = "STRING EXISTS\n"
         else:
             response = "STRING NOT FOUND\n"
 
         # Encode the response and send it to the client
+        send_start: int = time.perf_counter_ns()
         connection.sendall(response.encode('utf-8'))
-
-        # Record the end time after executing the search_string_present function
-        end_time: float = time.time() * 1000  # milliseconds
-
-        # Generate a timestamp in the format (YYYY-MM-DD HH:MM:SS Day)
-        date_stamp: str = datetime.today().strftime("%Y-%m-%d %H:%M:%S %A")
-
-        # Print debug information about the search query, client IP, execution time, timestamp,
-        # SSL status, search algorithm, and REREAD_ON_QUERY setting
-        print(f"\nDEBUG: Search_query: {search_query}\n\nDEBUG IP: {address}")
-        print(f"\nDEBUG Execution Time: {end_time - start_time:.2f} millisecond")
-        print(f"\nDEBUG Timestamp: {date_stamp}\n\nDEBUG SSL: {USE_SSL_CONNECTION}")
-        print(f"\nDEBUG REREAD_ON_QUERY: {REREAD_ON_QUERY}\n")
-        print('----------------------------------------------------------------\n')
+        phases['send'] = time.perf_counter_ns() - send_start
+        record_request(address, search_query, found, start_time, phases)
     # when the client is not running in SSL mode, the query string sent will be not decoded
     # this will lead to OS errors when server tries to decode thus OS Errors will be reported
     except OSError as oe:
-        print(f'\ndecoding the client request failed: {oe} ')
+        REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+        REQUEST_LOG.error('request_error', client=address,
+                          message=f'decoding the client request failed: {oe}')
     except KeyError as e:
-        # Print an error message if an exception occurs while communicating with the client
-        print(f"\n Error: Invalid search algorithm used check and try again: {e}")
+        # Log an error record if an exception occurs while communicating with the client
+        REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+        REQUEST_LOG.error('request_error', client=address,
+                          message=f'Invalid search algorithm used check and try again: {e}')
         response = "STRING NOT FOUND\n"
         # Encode the response and send it to the client
         connection.sendall(response.encode('utf-8'))
+    # the legacy format has no error response, the connection is closed without an answer
+    except IndexNotPublished as e:
+        REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+        REQUEST_LOG.error('index_unavailable', client=address, message=str(e))
     except UnicodeDecodeError as ud:
-        print(f'\nfailed to decode client request, check your SSL authentication status:{ud}')
-        print('\nclient request encoded when SSL is enabled, ensure server is using SSL\n')
+        REQUESTS_TOTAL.labels('error', SEARCH_ALGORITHM).inc()
+        REQUEST_LOG.error('request_error', client=address,
+                          message=f'failed to decode client request, check your SSL '
+                                  f'authentication status, client request encoded when '
+                                  f'SSL is enabled, ensure server is using SSL: {ud}')
 
     finally:
+        # the slot is released first so a client that sees the close can reconnect at once
+        ADMISSION.release(address[0])
         # Close the client connection
         connection.close()
+        ACTIVE_CONNECTIONS.dec()
+
+
+def start_profiling(seconds: float = PROFILE_WINDOW_SECONDS) -> bool:
+    """
+    Start a profiling window, the connections accepted during the window are profiled
+    and the results are written to PROFILE_DIR when the window ends.
+
+    Args:
+        seconds (float): Length of the profiling window.
+
+    Returns:
+        bool: True if the window was started, False if a window is already running or
+        the length of the window is not a positive finite number.
+    """
+    try:
+        started: bool = PROFILER.start(seconds)
+    except ValueError as e:
+        REQUEST_LOG.error('profiling', started=False, message=str(e))
+        return False
+    REQUEST_LOG.warning('profiling', started=started, seconds=seconds, directory=PROFILE_DIR)
+    return started
+
+
+def admin_profile(params: Dict[str, str]) -> Tuple[int, str]:
+    """
+    Admin command of the metrics listener (GET /admin/profile?seconds=N)
+    that starts a profiling window, cut to PROFILE_MAX_WINDOW_SECONDS.
+
+    Args:
+        params (Dict[str, str]): The query parameters of the admin request.
+
+    Returns:
+        Tuple[int, str]: The HTTP status and the text of the response.
+    """
+    try:
+        seconds = float(params.get('seconds', PROFILE_WINDOW_SECONDS))
+    except ValueError:
+        return 400, 'seconds must be a number\n'
+    # inf or nan would keep the window open for the life of the process
+    if not math.isfinite(seconds) or seconds <= 0:
+        return 400, 'seconds must be a positive finite number\n'
+    seconds = min(seconds, PROFILE_MAX_WINDOW_SECONDS)
+    if not start_profiling(seconds):
+        return 409, 'a profiling window is already running\n'
+    return 200, f'profiling for {seconds} seconds into {PROFILE_DIR}\n'
+
+
+def admin_profile_stop(params: Dict[str, str]) -> Tuple[int, str]:  # pylint: disable=W0613
+    """
+    Admin command of the metrics listener (GET /admin/profile/stop) that closes the
+    running profiling window before its end and writes its results.
+
+    Args:
+        params (Dict[str, str]): The query parameters of the request, unused.
+
+    Returns:
+        Tuple[int, str]: The HTTP status and the text of the response.
+    """
+    if not PROFILER.active:
+        return 409, 'no profiling window is running\n'
+    written: List[str] = PROFILER.stop()
+    REQUEST_LOG.warning('profiling_stopped', files=written)
+    return 200, ''.join(f'{path}\n' for path in written)
+
+
+def admin_stats(params: Dict[str, str]) -> Tuple[int, str]:  # pylint: disable=unused-argument
+    """
+    Admin command of the metrics listener (GET /admin/stats) that reports the footprint
+    and the build cost of the loaded indexes, and the most throttled clients, as JSON.
+
+    Args:
+        params (Dict[str, str]): The query parameters of the request, unused.
+
+    Returns:
+        Tuple[int, str]: The HTTP status and the text of the response.
+    """
+    report: dict = INDEX_STATS.report()
+    shared = SHARED_INDEX.current() if SHARED_INDEX is not None else None
+    if shared is not None:
+        # the shared index is built by the publisher, only its segment is reported
+        report['shared_index'] = {'name': shared.name, 'entries': len(shared),
+                                  'segment_bytes': shared.buffer.nbytes}
+    if SORTED_INDEX is not None:
+        # only the offsets are resident, the pages of the file are cached by the system
+        report['sorted_file'] = {'path': SORTED_INDEX.path, 'entries': len(SORTED_INDEX),
+                                 'file_bytes': len(SORTED_INDEX.data),
+                                 'resident_bytes': estimate_bytes(SORTED_INDEX.offsets)}
+    if PERFECT_HASH_INDEX is not None:
+        # the displacements and the offsets are read in place from the mapped file
+        report['perfect_hash'] = {'path': PERFECT_HASH_INDEX.path,
+                                  'entries': len(PERFECT_HASH_INDEX),
+                                  'file_bytes': len(PERFECT_HASH_INDEX.data),
+                                  'array_bytes': PERFECT_HASH_INDEX.resident_bytes}
+    if CORPORA.paths:
+        report['named_corpora'] = CORPORA.report()
+    if ADMISSION.enabled:
+        # the metric is counted per reason only, the clients are listed here
+        report['throttled_clients'] = dict(ADMISSION.throttled_clients())
+    return 200, json.dumps(report, indent=2) + '\n'
+
+
+def readiness_probe(params: Dict[str, str]) -> Tuple[int, str]:  # pylint: disable=unused-argument
+    """
+    Readiness probe of the metrics listener (GET /ready), answers 200 once the corpus
+    is loaded and warmed up and 503 before, so traffic is only routed to warm servers.
+
+    Args:
+        params (Dict[str, str]): The query parameters of the request, unused.
+
+    Returns:
+        Tuple[int, str]: The HTTP status and the text of the response.
+    """
+    if SERVER_READY.is_set():
+        return 200, 'ready\n'
+    return 503, 'warming up\n'
+
+
+# the readiness probe, the only route of the listener when the metrics are disabled
+PROBE_ROUTES = {
+    '/ready': readiness_probe,
+}
+
+# the admin commands served by the metrics listener next to /metrics
+ADMIN_ROUTES = {
+    '/admin/profile': admin_profile,
+    '/admin/profile/stop': admin_profile_stop,
+    '/admin/stats': admin_stats,
+    **PROBE_ROUTES,
+}
+
+# the admin commands answered only to the clients on the same host when ADMIN_LOCAL_ONLY is set
+ADMIN_LOCAL_ROUTES = frozenset(path for path in ADMIN_ROUTES if path.startswith('/admin/'))
+
+
+def install_profiler_signal():
+    """
+    Start a profiling window of PROFILE_WINDOW_SECONDS when the process receives SIGUSR1
+    i.e. kill -USR1 <pid>. Signals can only be handled on the main thread.
+
+    Returns:
+        None
+    """
+    if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: start_profiling())
+
+
+def handle_connection(client_sock: socket.socket, client_addr: Tuple[str, int],
+                      use_ssl: bool = USE_SSL_CONNECTION):
+    """
+    Entry point of the client threads. Performs the TLS handshake (when SSL is enabled)
+    under the handshake deadline, then hands the connection over to client_conn.
+    Doing the handshake on the client thread keeps a slow peer from stalling the accept loop.
+
+    Args:
+        client_sock (socket.socket): The accepted socket.
+        client_addr (Tuple[str, int]): A tuple containing the client's IP address and port number.
+        use_ssl (bool): Whether the connection is wrapped in TLS, the unix domain socket
+        connections are not.
+
+    Returns:
+        None
+    """
+    # duration of the TLS handshake, handed to client_conn for the phase timings
+    handshake_ns: int = 0
+    # whether the TLS handshake completed, a handshake may take less than a clock tick
+    handshake_done: bool = False
+    # If SSL is enabled, wrap the client socket with an SSL connection
+    if use_ssl:
+        deadline = NO_DEADLINE
+        try:
+            # Wrap the client socket with an SSL connection, the wrapped socket owns the
+            # connection from now on so the handshake deadline is armed on it
+            handshake_start: int = time.perf_counter_ns()
+            client_sock = SSL_CONTEXT.wrap_socket(client_sock, server_side=True,
+                                                  do_handshake_on_connect=False)
+            deadline = DEADLINES.arm(client_sock, HANDSHAKE, HANDSHAKE_TIMEOUT)
+            client_sock.do_handshake()
+            handshake_ns = time.perf_counter_ns() - handshake_start
+            handshake_done = True
+        # ssl context  totally not created
+        except NotImplementedError as e:
+            TLS_HANDSHAKE_FAILURES.inc()
+            REQUEST_LOG.error('tls_error', client=client_addr,
+                              message=f'SSL context not created; '
+                                      f'client sent invalid SSL files: {e}')
+        # client is not using SSL connections while the server is, or the handshake timed out
+        except OSError as err:
+            if deadline.expired:
+                REQUEST_LOG.warning('timeout', client=client_addr, kind=HANDSHAKE)
+            else:
+                TLS_HANDSHAKE_FAILURES.inc()
+                REQUEST_LOG.error('tls_error', client=client_addr,
+                                  message=f'client is not running in SSL mode '
+                                          f'flag the server to no SSL: {err}')
+        finally:
+            DEADLINES.cancel(deadline)
+        if not handshake_done:
+            client_sock.close()
+            ADMISSION.release(client_addr[0])
+            return
+    client_conn(client_sock, client_addr, handshake_ns)
+
+
+def accept_connections(listener: socket.socket, use_ssl: bool, admission: bool):
+    """
+    Accept the connections of a listening socket forever, every admitted connection
+    is handled on a new thread.
+
+    Args:
+        listener (socket.socket): The listening socket, TCP or unix domain.
+        use_ssl (bool): Whether the connections are wrapped in TLS.
+        admission (bool): Whether the connections go through the per-client admission control.
+        The unix domain socket connections are gated by the file mode of the socket instead.
+
+    Returns:
+        None
+    """
+    while True:
+        # Accept a client connection
+        # This function will block until a client connects to the server
+        # It returns a new socket object representing the client connection and
+        # the client's IP address and port number
+        client_sock, client_addr = listener.accept()
+        if listener.family == socket.AF_UNIX:
+            # unix domain socket peers have no address, they are logged under the socket path
+            client_addr = (UNIX_SOCKET_PATH, 0)
+
+        # Clients over their rate or connection limit are rejected before any other work
+        rejection: Optional[str] = ADMISSION.admit(client_addr[0]) if admission else None
+        if rejection is not None:
+            CLIENT_THROTTLED.labels(rejection).inc()
+            if REQUEST_LOG.is_enabled(INFO):
+                REQUEST_LOG.info('throttled', client=client_addr, reason=rejection)
+            client_sock.close()
+            continue
+
+        # Create a new thread to handle the client connection
+        # The target function for the thread performs the TLS handshake if SSL is enabled
+        # and then the client_connection_handling
+        # The arguments for the target function are the client socket
+        # and the client's IP address and port number
+        # during a profiling window the connection is handled under the profiler
+        handler = PROFILER.profiled(handle_connection) if PROFILER.active else handle_connection
+        client_thread = threading.Thread(target=handler, args=(client_sock, client_addr, use_ssl))
+
+        # Start the thread to handle the client connection
+        client_thread.start()
+
+
+def create_unix_listener(path: str, mode: int = UNIX_SOCKET_MODE) -> socket.socket:
+    """
+    Create the unix domain socket listener of the local clients. A stale socket file
+    left by a previous run is removed first, the file mode of the socket decides which
+    local users can connect.
+
+    Args:
+        path (str): Path of the socket file.
+        mode (int): File mode of the socket file i.e. 0o660.
+
+    Returns:
+        socket.socket: The listening socket.
+
+    Raises:
+        FileExistsError: If the path exists and is not a socket.
+    """
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise FileExistsError(f'{path} exists and is not a socket')
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # the socket is created without any permission and opened up once it is bound
+    previous_umask: int = os.umask(0o777)
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(previous_umask)
+    os.chmod(path, mode)
+    listener.listen(128)
+    return listener
 
 
 def server_configuration(port_number: int):
@@ -297,8 +2062,26 @@ def server_configuration(port_number: int):
     The function initializes a TCP/IP socket for the server, binds it to the specified port number,
     and starts listening for incoming connections. It also handles SSL connections if enabled.
     For each client connection, it creates a new thread to handle the client's requests.
+    When UNIX_SOCKET_PATH is set, the same protocol is also served without TLS on a unix
+    domain socket for the clients running on the same host.
     """
 
+    # Start the metrics listener on its own port before accepting any search request
+    if METRICS_ENABLED:
+        start_metrics_server(METRICS_PORT, METRICS, routes=ADMIN_ROUTES,
+                             local_routes=ADMIN_LOCAL_ROUTES if ADMIN_LOCAL_ONLY else ())
+        print(f"Metrics are served on Port: {METRICS_PORT}")
+    elif READY_PROBE_ENABLED:
+        # without the metrics the listener only answers the readiness probe
+        start_metrics_server(METRICS_PORT, None, routes=PROBE_ROUTES)
+        print(f"Readiness probe is served on Port: {METRICS_PORT}")
+
+    # The corpus is loaded and warmed up before listening, connections are refused until then
+    if PRELOAD_ON_START:
+        print(f"Server warmed up in {warm_up(FILE_PATH):.3f} seconds")
+    else:
+        SERVER_READY.set()
+
     # Initialize a TCP/IP socket for the server
     socket_of_the_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
@@ -315,35 +2098,19 @@ def server_configuration(port_number: int):
 
     print(f"Server is Running and Listening on Port: {port_number}")
 
-    while True:
-        # Accept a client connection
-        # This function will block until a client connects to the server
-        # It returns a new socket object representing the client connection and
-        # the client's IP address and port number
-        client_sock, client_addr = socket_of_the_server.accept()
-
-        # If SSL is enabled, wrap the client socket with an SSL connection
-        if USE_SSL_CONNECTION:
-            try:
-                # Wrap the client socket with an SSL connection
-                client_sock = SSL_CONTEXT.wrap_socket(client_sock, server_side=True)
-            # ssl context  totally not created
-            except NotImplementedError as e:
-                print(f'\nError:SSL context not created; client sent invalid SSL files: {e}\n')
-            # client is not using SSL connections while the server is
-            except ssl.SSLError as err:
-                print(f'\nclient is not running in SSL mode flag the server to no SSL:{err}')
-        # Create a new thread to handle the client connection
-        # The target function for the thread is client_connection_handling
-        # The arguments for the target function are the client socket
-        # and the client's IP address and port number
-        client_thread = threading.Thread(target=client_conn, args=(client_sock, client_addr))
+    # the local clients skip TCP and TLS, the unix socket is served on its own thread
+    if UNIX_SOCKET_PATH:
+        unix_listener = create_unix_listener(UNIX_SOCKET_PATH)
+        threading.Thread(target=accept_connections, args=(unix_listener, False, False),
+                         name='unix-listener', daemon=True).start()
+        print(f"Server is Listening on Unix Socket: {UNIX_SOCKET_PATH}")
 
-        # Start the thread to handle the client connection
-        client_thread.start()
+    accept_connections(socket_of_the_server, USE_SSL_CONNECTION, True)
 
 
 # Here  the program will be started for execution it's the entry point
 if __name__ == "__main__":
+    # SIGUSR1 starts a profiling window of the running server
+    install_profiler_signal()
     # run the server_configuration function as entry point to start the server
     server_configuration(PORT_NUMBER)
@@ -0,0 +1,346 @@
+"""
+This module implements a corpus index shared by several server processes on the same host.
+
+A loader builds the index once into a multiprocessing.shared_memory segment, the worker
+processes attach the segment instead of each holding their own set of lines. The segment
+holds an open addressing hash table followed by the UTF-8 bytes of the unique lines:
+
+    header | table of slot_count (hash, offset, length) entries | line bytes
+
+The hashes are 64 bit BLAKE2b digests since the built-in hash() differs between processes.
+The loader publishes the name of the current segment in a small pointer file replaced
+atomically with os.replace, then unlinks the previous segment. Workers notice the new
+pointer, attach the new segment and drop the old one; the pages of an unlinked segment
+stay valid for the workers still mapping it, so a reload never breaks a running lookup.
+A worker started before the first index is published waits for it, it never falls back
+to a private copy of the corpus.
+
+Build and publish an index with:
+
+    python -m server.shared_index data/200k.txt /dev/shm/search-index.json
+"""
+
+# command line of the loader
+import argparse
+
+# the hash shared by all the processes
+import hashlib
+
+# the pointer file
+import json
+
+# atomic replacement of the pointer file
+import os
+
+# layout of the header and of the table entries
+import struct
+
+# clock of the pointer file checks
+import time
+
+# the shared memory segments and their tracking
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+# the normalization of the lines, the same as the one of the servers
+from server.normalization import build_normalizer
+
+# the corpus file may be compressed
+from server.compressed import open_corpus
+
+# static typing
+from typing import Callable, Iterable, Optional
+
+# identifies a segment holding an index
+MAGIC: bytes = b'SIDX'
+
+# version of the layout
+VERSION: int = 1
+
+# magic, version, slot count, line count, offset of the line bytes
+HEADER = struct.Struct('<4sIQQQ')
+
+# hash, offset and length of a line, a hash of 0 marks an empty slot
+ENTRY = struct.Struct('<QQI')
+
+# seconds between two checks of the pointer file while waiting for the first index
+WAIT_POLL_SECONDS: float = 0.05
+
+
+class IndexNotPublished(LookupError):
+    """Raised when no shared index was published before the wait for it ended."""
+
+
+def line_hash(key: bytes) -> int:
+    """
+    Hash of a line that is the same in every process, never 0.
+
+    Args:
+        key (bytes): The UTF-8 bytes of the line.
+
+    Returns:
+        int: The 64 bit hash.
+    """
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+
+
+def untrack(segment: SharedMemory):
+    """
+    Stop the resource tracker of this process from unlinking the segment when the
+    process exits, the segment belongs to the loader publishing it and not to one process.
+    """
+    # pylint: disable=protected-access
+    resource_tracker.unregister(segment._name, 'shared_memory')
+
+
+class SharedIndex:
+    """
+    Read-only view of an index held in a shared memory segment.
+
+    Args:
+        segment (SharedMemory): The attached segment.
+        generation (int): The generation of the index, incremented by every reload.
+    """
+
+    def __init__(self, segment: SharedMemory, generation: int = 0):
+        magic, version, slot_count, line_count, data_offset = HEADER.unpack_from(segment.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{segment.name} does not hold a version {VERSION} index')
+        self.segment: SharedMemory = segment
+        self.generation: int = generation
+        self.slot_count: int = slot_count
+        self.line_count: int = line_count
+        self.data_offset: int = data_offset
+        # only read, a read-only view would keep the segment from being closed
+        self.buffer: memoryview = segment.buf
+
+    @classmethod
+    def build(cls, lines: Iterable[str], name: Optional[str] = None, generation: int = 0,
+              normalize: Callable[[str], str] = str.strip) -> 'SharedIndex':
+        """
+        Build the index of the lines into a new shared memory segment.
+
+        Args:
+            lines (Iterable[str]): The lines of the corpus.
+            name (Optional[str]): Name of the segment, a random name if None.
+            generation (int): The generation of the index.
+            normalize (Callable[[str], str]): Turns a line into its key in the index,
+            the servers must normalize their queries the same way.
+
+        Returns:
+            SharedIndex: The index, the segment outlives the process until it is unlinked.
+        """
+        keys = {normalize(line).encode('utf-8') for line in lines}
+        # a load factor of at most one half keeps the probe sequences short
+        slot_count: int = 1 << max(3, (2 * len(keys) - 1).bit_length())
+        data_offset: int = HEADER.size + slot_count * ENTRY.size
+        segment = SharedMemory(name=name, create=True,
+                               size=data_offset + sum(map(len, keys)) + 1)
+        untrack(segment)
+        buffer = segment.buf
+        mask: int = slot_count - 1
+        offset: int = data_offset
+        for key in keys:
+            key_hash: int = line_hash(key)
+            slot: int = key_hash & mask
+            while ENTRY.unpack_from(buffer, HEADER.size + slot * ENTRY.size)[0]:
+                slot = (slot + 1) & mask
+            ENTRY.pack_into(buffer, HEADER.size + slot * ENTRY.size, key_hash, offset, len(key))
+            buffer[offset:offset + len(key)] = key
+            offset += len(key)
+        # the header is written last, a half built segment is never mistaken for an index
+        HEADER.pack_into(buffer, 0, MAGIC, VERSION, slot_count, len(keys), data_offset)
+        return cls(segment, generation)
+
+    @classmethod
+    def attach(cls, name: str, generation: int = 0) -> 'SharedIndex':
+        """
+        Attach an index built by another process.
+
+        Args:
+            name (str): Name of the segment.
+            generation (int): The generation of the index.
+
+        Returns:
+            SharedIndex: The index.
+
+        Raises:
+            FileNotFoundError: If the segment does not exist (anymore).
+        """
+        segment = SharedMemory(name=name)
+        untrack(segment)
+        return cls(segment, generation)
+
+    def __contains__(self, query: str | bytes) -> bool:
+        # the raw bytes of a query are looked up as they are, in the bytes mode of the server
+        key: bytes = query.encode('utf-8') if isinstance(query, str) else query
+        key_hash: int = line_hash(key)
+        mask: int = self.slot_count - 1
+        slot: int = key_hash & mask
+        buffer = self.buffer
+        while True:
+            entry_hash, offset, length = ENTRY.unpack_from(buffer, HEADER.size + slot * ENTRY.size)
+            if not entry_hash:
+                return False
+            if (entry_hash == key_hash and length == len(key)
+                    and buffer[offset:offset + length] == key):
+                return True
+            slot = (slot + 1) & mask
+
+    def __len__(self) -> int:
+        return self.line_count
+
+    def close(self):
+        """Unmap the segment from this process."""
+        self.segment.close()
+
+    def unlink(self):
+        """Remove the segment, the processes still mapping it keep their mapping."""
+        # unlink() unregisters the segment from the resource tracker, it was untracked
+        # pylint: disable=protected-access
+        resource_tracker.register(self.segment._name, 'shared_memory')
+        self.segment.unlink()
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory segment."""
+        return self.segment.name
+
+
+def read_pointer(pointer_path: str) -> Optional[dict]:
+    """
+    Read the pointer file naming the current segment.
+
+    Args:
+        pointer_path (str): Path of the pointer file.
+
+    Returns:
+        Optional[dict]: The 'name', 'generation' and 'lines' of the current index,
+        None if no index is published.
+    """
+    try:
+        with open(pointer_path, mode='r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def publish(lines: Iterable[str], pointer_path: str,
+            normalize: Callable[[str], str] = str.strip) -> SharedIndex:
+    """
+    Build a new generation of the index, point the workers to it and retire the
+    previous generation.
+
+    Args:
+        lines (Iterable[str]): The lines of the corpus.
+        pointer_path (str): Path of the pointer file read by the workers.
+        normalize (Callable[[str], str]): Turns a line into its key in the index.
+
+    Returns:
+        SharedIndex: The published index.
+    """
+    previous: Optional[dict] = read_pointer(pointer_path)
+    generation: int = previous['generation'] + 1 if previous else 1
+    index = SharedIndex.build(lines, generation=generation, normalize=normalize)
+    temporary_path: str = f'{pointer_path}.{os.getpid()}.tmp'
+    with open(temporary_path, mode='w', encoding='utf-8') as f:
+        json.dump({'name': index.name, 'generation': generation, 'lines': len(index)}, f)
+    os.replace(temporary_path, pointer_path)
+    if previous:
+        # the workers still mapping the old segment keep its pages until they drop it
+        try:
+            retired = SharedMemory(name=previous['name'])
+            retired.close()
+            retired.unlink()
+        except FileNotFoundError:
+            pass
+    return index
+
+
+class SharedIndexReader:
+    """
+    The worker side, follows the pointer file and keeps the current index attached.
+
+    Args:
+        pointer_path (str): Path of the pointer file written by the loader.
+        check_interval (float): Seconds between two checks of the pointer file.
+    """
+
+    def __init__(self, pointer_path: str, check_interval: float = 1.0):
+        self.pointer_path: str = pointer_path
+        self.check_interval: float = check_interval
+        self.index: Optional[SharedIndex] = None
+        self._checked_at: float = float('-inf')
+        self._pointer_stat: Optional[tuple] = None
+
+    def current(self) -> Optional[SharedIndex]:
+        """
+        Return the current index, attaching a newly published generation first.
+        The previous index is only dropped, lookups still using it finish normally.
+
+        Returns:
+            Optional[SharedIndex]: The index, None if no index is published.
+        """
+        now: float = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._refresh()
+        return self.index
+
+    def wait(self, timeout: float) -> Optional[SharedIndex]:
+        """
+        Return the current index, waiting for the first one to be published.
+
+        Args:
+            timeout (float): Seconds to wait at most for a published index.
+
+        Returns:
+            Optional[SharedIndex]: The index, None if none was published before the timeout.
+        """
+        deadline: float = time.monotonic() + timeout
+        while self.current() is None:
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(WAIT_POLL_SECONDS, remaining))
+            self._refresh()
+        return self.index
+
+    def _refresh(self):
+        """Attach the published index if the pointer file changed."""
+        try:
+            info = os.stat(self.pointer_path)
+        except OSError:
+            return
+        pointer_stat = (info.st_ino, info.st_mtime_ns, info.st_size)
+        if pointer_stat == self._pointer_stat:
+            return
+        pointer: Optional[dict] = read_pointer(self.pointer_path)
+        if pointer is None:
+            return
+        try:
+            self.index = SharedIndex.attach(pointer['name'], pointer['generation'])
+        except (FileNotFoundError, ValueError):
+            # replaced again in the meantime, the next check attaches the newer generation
+            return
+        self._pointer_stat = pointer_stat
+
+
+def main():
+    """Build the index of a corpus file and publish it, the entry point of the loader."""
+    parser = argparse.ArgumentParser(description='Build and publish a shared memory index.')
+    parser.add_argument('corpus', help='path of the corpus file, may be .gz, .bz2 or .xz')
+    parser.add_argument('pointer', help='path of the pointer file read by the servers')
+    parser.add_argument('--normalize', default='',
+                        help='normalization steps, the same as NORMALIZE of the servers')
+    arguments = parser.parse_args()
+    start: float = time.perf_counter()
+    with open_corpus(arguments.corpus) as f:
+        index = publish(f, arguments.pointer,
+                        build_normalizer(arguments.normalize) or str.strip)
+    print(f'published generation {index.generation} ({len(index)} lines) as {index.name} '
+          f'in {time.perf_counter() - start:.3f} seconds')
+
+
+if __name__ == '__main__':
+    main()
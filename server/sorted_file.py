@@ -0,0 +1,242 @@
+"""
+This module implements the out-of-core index of the corpora larger than the memory.
+
+The corpus is preprocessed once into a sorted file of its unique normalized lines, in
+UTF-8 byte order, and a sparse index holding the byte offset of every stride-th line:
+
+    sorted file: line 0 \\n line 1 \\n ... (unique, sorted)
+    index file:  header | offset of line 0 | offset of line stride | ...
+
+The offsets are 64 bit integers in the byte order of the machine that built them.
+The server maps the sorted file with mmap and only keeps the offsets in memory (8 bytes
+every stride lines). A lookup binary searches the sampled lines through the mapping, then
+looks the query up in the block of at most stride lines that may hold it, so it touches
+O(log n) pages and the operating system keeps the hot pages cached.
+
+The preprocessing is an external sort: runs of lines are sorted in memory and written to
+temporary files, then merged, so it also works for corpora larger than the memory.
+
+Build the sorted file and its index with:
+
+    python -m server.sorted_file data/200k.txt data/200k.sorted
+"""
+
+# command line of the preprocessing
+import argparse
+
+# merging the sorted runs
+import heapq
+
+# mapping of the sorted file
+import mmap
+
+# atomic replacement of the sorted file and of its index
+import os
+
+# layout of the header of the index file
+import struct
+
+# the sorted runs of the external sort
+import tempfile
+
+# duration of the preprocessing
+import time
+
+# the offsets held in memory
+from array import array
+
+# for reading the lines of a run
+from itertools import islice
+
+# the normalization of the lines, the same as the one of the servers
+from server.normalization import build_normalizer
+
+# the corpus file may be compressed
+from server.compressed import open_corpus
+
+# static typing
+from typing import Callable, Iterator, List, Optional
+
+# identifies an index file
+MAGIC: bytes = b'SRTX'
+
+# version of the layout
+VERSION: int = 1
+
+# magic, version, stride, line count, number of offsets, size of the sorted file
+HEADER = struct.Struct('<4sIIQQQ')
+
+# default number of lines between two offsets of the index
+DEFAULT_STRIDE: int = 64
+
+# default number of lines sorted in memory per run of the external sort
+DEFAULT_RUN_LINES: int = 1000000
+
+
+def index_path(sorted_path: str) -> str:
+    """The path of the index file of a sorted file."""
+    return f'{sorted_path}.idx'
+
+
+def write_run(lines: List[bytes], directory: str) -> str:
+    """
+    Sort a run of lines and write it to a temporary file.
+
+    Args:
+        lines (List[bytes]): The lines of the run.
+        directory (str): Directory of the temporary file.
+
+    Returns:
+        str: Path of the temporary file.
+    """
+    lines.sort()
+    descriptor, path = tempfile.mkstemp(prefix='sorted-run-', dir=directory)
+    with os.fdopen(descriptor, 'wb') as f:
+        f.writelines(line + b'\n' for line in lines)
+    return path
+
+
+def read_run(path: str) -> Iterator[bytes]:
+    """Read back the lines of a sorted run, without their new line characters."""
+    with open(path, mode='rb') as f:
+        for line in f:
+            yield line[:-1]
+
+
+def build(source: str, destination: str, stride: int = DEFAULT_STRIDE,
+          run_lines: int = DEFAULT_RUN_LINES,
+          normalize: Callable[[str], str] = str.strip) -> int:
+    """
+    Preprocess a corpus into a sorted file of its unique lines and its sparse index.
+    Both files are written aside and replaced atomically, the sorted file first.
+
+    Args:
+        source (str): Path of the corpus file, may be compressed.
+        destination (str): Path of the sorted file, the index is written next to it.
+        stride (int): Number of lines between two offsets of the index.
+        run_lines (int): Number of lines sorted in memory at once.
+        normalize (Callable[[str], str]): Turns a line into its key in the index,
+        the servers must normalize their queries the same way.
+
+    Returns:
+        int: The number of unique lines.
+    """
+    directory: str = os.path.dirname(os.path.abspath(destination))
+    runs: List[str] = []
+    try:
+        with open_corpus(source) as f:
+            while lines := [normalize(line).encode('utf-8') for line in islice(f, run_lines)]:
+                runs.append(write_run(lines, directory))
+        offsets = array('Q')
+        count: int = 0
+        offset: int = 0
+        previous: Optional[bytes] = None
+        temporary: str = f'{destination}.{os.getpid()}.tmp'
+        with open(temporary, mode='wb') as f:
+            for line in heapq.merge(*map(read_run, runs)):
+                if line == previous:
+                    continue
+                previous = line
+                if count % stride == 0:
+                    offsets.append(offset)
+                f.write(line + b'\n')
+                offset += len(line) + 1
+                count += 1
+        os.replace(temporary, destination)
+        temporary = f'{index_path(destination)}.{os.getpid()}.tmp'
+        with open(temporary, mode='wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, stride, count, len(offsets), offset))
+            f.write(offsets.tobytes())
+        os.replace(temporary, index_path(destination))
+    finally:
+        for run in runs:
+            os.remove(run)
+    return count
+
+
+class SortedFile:
+    """
+    Lookups of the lines of a sorted file through mmap and its sparse index.
+
+    Args:
+        path (str): Path of the sorted file, its index is read from path.idx.
+
+    Raises:
+        OSError: If a file can not be read.
+        ValueError: If the index file is not valid.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        with open(index_path(path), mode='rb') as f:
+            header: bytes = f.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise ValueError(f'{index_path(path)} is not a sorted file index')
+            magic, version, self.stride, self.line_count, count, size = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'{index_path(path)} is not a sorted file index')
+            self.offsets = array('Q')
+            self.offsets.frombytes(f.read(count * self.offsets.itemsize))
+        if len(self.offsets) != count:
+            raise ValueError(f'{index_path(path)} is truncated')
+        with open(path, mode='rb') as f:
+            # a sorted file rebuilt after its index was read does not match its offsets
+            if os.fstat(f.fileno()).st_size != size:
+                raise ValueError(f'{path} does not match its index {index_path(path)}')
+            # an empty file can not be mapped
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def line_at(self, offset: int) -> bytes:
+        """The line starting at an offset of the sorted file."""
+        return self.data[offset:self.data.find(b'\n', offset)]
+
+    def __contains__(self, query: str | bytes) -> bool:
+        key: bytes = query.encode('utf-8') if isinstance(query, str) else query
+        if b'\n' in key:
+            return False
+        offsets = self.offsets
+        # the last sampled line that is not greater than the query
+        low, high = 0, len(offsets)
+        while low < high:
+            middle: int = (low + high) // 2
+            if self.line_at(offsets[middle]) <= key:
+                low = middle + 1
+            else:
+                high = middle
+        if not low:
+            return False
+        start: int = offsets[low - 1]
+        end: int = offsets[low] if low < len(offsets) else len(self.data)
+        # the block of at most stride lines starts at a line and ends with a new line character
+        return (b'\n' + key + b'\n') in (b'\n' + self.data[start:end])
+
+    def __len__(self) -> int:
+        return self.line_count
+
+    def close(self):
+        """Unmap the sorted file."""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+def main():
+    """Preprocess a corpus file into a sorted file and its index, the preprocessing entry point."""
+    parser = argparse.ArgumentParser(description='Build the sorted file of a corpus.')
+    parser.add_argument('corpus', help='path of the corpus file, may be .gz, .bz2 or .xz')
+    parser.add_argument('sorted', help='path of the sorted file, the index is written to .idx')
+    parser.add_argument('--stride', type=int, default=DEFAULT_STRIDE,
+                        help='lines between two offsets of the index')
+    parser.add_argument('--run-lines', type=int, default=DEFAULT_RUN_LINES,
+                        help='lines sorted in memory at once')
+    parser.add_argument('--normalize', default='',
+                        help='normalization steps, the same as NORMALIZE of the servers')
+    arguments = parser.parse_args()
+    start: float = time.perf_counter()
+    count: int = build(arguments.corpus, arguments.sorted, arguments.stride, arguments.run_lines,
+                       build_normalizer(arguments.normalize) or str.strip)
+    print(f'sorted {count} unique lines into {arguments.sorted} '
+          f'in {time.perf_counter() - start:.3f} seconds')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+This module implements tests for the per-client admission control of the server
+"""
+
+# for reading the admin report
+import json
+
+# for the connections of the integration tests
+import socket
+
+# for the accept loop of the integration tests
+import threading
+
+# for waiting on the release of a connection slot
+import time
+
+# for controlling the clock of the token buckets
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from server.admission import AdmissionController, RATE_LIMITED, TOO_MANY_CONNECTIONS
+from server.server import accept_connections, admin_stats
+from protocol import QUERY, ERROR, RESPONSE, encode_frame, read_frame
+
+
+def test_admission_disabled_admits_everything():
+    """
+    Test that the admission control admits every connection when both limits are 0.
+    """
+    admission = AdmissionController(0, 1, 0)
+
+    assert admission.enabled is False
+    assert all(admission.admit('10.0.0.1') is None for _ in range(1000))
+
+
+def test_rate_limit_per_client():
+    """
+    Test that a client is rate limited once its burst is used, that other clients
+    are not affected and that the bucket refills with time.
+    """
+    admission = AdmissionController(2, 3, 0)
+    with patch('time.monotonic', return_value=100.0):
+        results = [admission.admit('10.0.0.1') for _ in range(4)]
+        assert admission.admit('10.0.0.2') is None
+    assert results == [None, None, None, RATE_LIMITED]
+
+    # one second later two more tokens are available
+    with patch('time.monotonic', return_value=101.0):
+        results = [admission.admit('10.0.0.1') for _ in range(3)]
+    assert results == [None, None, RATE_LIMITED]
+
+
+def test_concurrent_connection_cap():
+    """
+    Test that a client cannot open more than the allowed concurrent connections
+    and that releasing a connection admits a new one.
+    """
+    admission = AdmissionController(0, 1, 2)
+
+    assert admission.admit('10.0.0.1') is None
+    assert admission.admit('10.0.0.1') is None
+    assert admission.admit('10.0.0.1') == TOO_MANY_CONNECTIONS
+    assert admission.open_connections('10.0.0.1') == 2
+
+    admission.release('10.0.0.1')
+    assert admission.admit('10.0.0.1') is None
+    admission.release('10.0.0.1')
+    admission.release('10.0.0.1')
+    # releasing a client that has no connection left is harmless
+    admission.release('10.0.0.1')
+    assert admission.open_connections('10.0.0.1') == 0
+
+
+def test_take_charges_requests_of_a_client():
+    """
+    Test that every request takes a token of the bucket of its client and that a
+    disabled rate limit lets every request through.
+    """
+    admission = AdmissionController(1, 2, 0)
+    with patch('time.monotonic', return_value=100.0):
+        assert admission.admit('10.0.0.1') is None
+        assert [admission.take('10.0.0.1') for _ in range(2)] == [True, False]
+        assert admission.take('10.0.0.2') is True
+
+    assert all(AdmissionController(0, 1, 0).take('10.0.0.1') for _ in range(1000))
+
+
+def test_rejections_are_tallied_per_client():
+    """
+    Test that the rejections are counted per client IP and reason, most throttled client
+    first, and that the tally keeps a bounded number of clients.
+    """
+    admission = AdmissionController(1, 1, 1, max_throttled_clients=2)
+    with patch('time.monotonic', return_value=100.0):
+        assert admission.admit('10.0.0.1') is None
+        assert admission.admit('10.0.0.1') == TOO_MANY_CONNECTIONS
+        assert admission.take('10.0.0.1') is False
+        assert admission.take('10.0.0.1') is False
+        assert admission.admit('10.0.0.2') is None
+        assert admission.take('10.0.0.2') is False
+    assert admission.throttled_clients() == [
+        ('10.0.0.1', {TOO_MANY_CONNECTIONS: 1, RATE_LIMITED: 2}),
+        ('10.0.0.2', {RATE_LIMITED: 1})]
+
+    # a new client replaces the least throttled one
+    with patch('time.monotonic', return_value=100.0):
+        assert admission.admit('10.0.0.3') is None
+        assert admission.take('10.0.0.3') is False
+    assert [client_ip for client_ip, _ in admission.throttled_clients()] == \
+        ['10.0.0.1', '10.0.0.3']
+
+
+def test_admin_stats_reports_throttled_clients():
+    """
+    Test that the admin report lists the throttled clients of the admission control.
+    """
+    admission = AdmissionController(0, 1, 1)
+    with patch('server.server.ADMISSION', admission):
+        admission.admit('10.0.0.1')
+        admission.admit('10.0.0.1')
+        report = json.loads(admin_stats({})[1])
+    assert report['throttled_clients'] == {'10.0.0.1': {TOO_MANY_CONNECTIONS: 1}}
+
+
+def serve_in_background(listener: socket.socket):
+    """Run the accept loop of a listener on a daemon thread until the listener is closed."""
+    def accept():
+        try:
+            accept_connections(listener, False, True)
+        except OSError:
+            pass
+    threading.Thread(target=accept, daemon=True).start()
+
+
+def receive_all(connection: socket.socket) -> bytes:
+    """Receive until the server closes the connection."""
+    received = b''
+    while True:
+        data = connection.recv(1024)
+        if not data:
+            return received
+        received += data
+
+
+@patch('server.server.IDLE_TIMEOUT', 0.3)
+@patch('server.server.ALL_LINES', {'alpha;1;'})
+@patch('server.server.REREAD_ON_QUERY', False)
+def test_rejected_connections_are_closed_and_slots_released():
+    """
+    Test that a connection over the concurrent connection cap is closed by the server
+    without an answer, and that the slot of a connection closed by its idle deadline
+    is released so the next connection is admitted and answered.
+    """
+    listener = socket.create_server(('127.0.0.1', 0))
+    admission = AdmissionController(0, 1, 1)
+    with listener, patch('server.server.ADMISSION', admission):
+        serve_in_background(listener)
+        address = listener.getsockname()
+        with socket.create_connection(address) as holder:
+            holder.settimeout(5)
+            with socket.create_connection(address) as rejected:
+                rejected.settimeout(5)
+                assert receive_all(rejected) == b''
+            # the idle deadline shuts the holder down, its handler then releases the slot
+            assert receive_all(holder) == b''
+        released_by = time.monotonic() + 5
+        while admission.open_connections('127.0.0.1') and time.monotonic() < released_by:
+            time.sleep(0.01)
+        assert admission.open_connections('127.0.0.1') == 0
+
+        with socket.create_connection(address) as admitted:
+            admitted.settimeout(5)
+            admitted.sendall(encode_frame(QUERY, b'alpha;1;'))
+            assert bytes(read_frame(admitted).payload) == b'STRING EXISTS\n'
+
+
+@patch('server.server.ALL_LINES', {'alpha;1;'})
+@patch('server.server.REREAD_ON_QUERY', False)
+def test_framed_requests_over_the_rate_are_rejected():
+    """
+    Test that every request frame of a connection takes a token, the frames over the
+    rate are answered with an ERROR frame and the connection stays open.
+    """
+    listener = socket.create_server(('127.0.0.1', 0))
+    with listener, patch('server.server.ADMISSION', AdmissionController(0.001, 3, 0)):
+        serve_in_background(listener)
+        with socket.create_connection(listener.getsockname()) as client:
+            client.settimeout(5)
+            kinds = []
+            for _ in range(4):
+                client.sendall(encode_frame(QUERY, b'alpha;1;'))
+                kinds.append(read_frame(client).kind)
+
+    # the connection took the first token, the next two frames are answered
+    assert kinds == [QUERY | RESPONSE, QUERY | RESPONSE, ERROR, ERROR]
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,78 @@
+"""
+This module implements tests for the bytes mode of the server, where the corpus index holds
+the raw bytes of the lines and the queries are looked up without decoding them
+"""
+
+# socket pairs stand in for the client and server connections
+import socket
+
+# the server side of the socket pair runs on its own thread
+import threading
+
+# for enabling the bytes mode of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from protocol import QUERY, ERROR, encode_frame, read_frame
+from client.client import framed_query, framed_batch
+from search_algorithms import linear_search
+from server.server import client_conn
+import server.server
+
+# a corpus with non-ASCII lines, one of them not valid UTF-8
+CORPUS: bytes = 'plain;1;\n café;2; \r\nlast;3;'.encode('utf-8') + b'\nlatin;\xe9;\n'
+
+
+@pytest.fixture(name='corpus')
+def fixture_corpus(tmp_path):
+    """
+    Write the corpus file and switch the server to the bytes mode with an unloaded index.
+    """
+    path = tmp_path / 'corpus.txt'
+    path.write_bytes(CORPUS)
+    with patch('server.server.BYTES_MODE', True), \
+            patch('server.server.FILE_PATH', str(path)), \
+            patch('server.server.REREAD_ON_QUERY', False), \
+            patch('server.server.ALL_LINES', None):
+        yield str(path)
+
+
+def test_bytes_index(corpus):
+    """
+    Test that the index holds the stripped raw lines and answers the raw queries, when it
+    is preloaded and when the file is reread on every query.
+    """
+    assert server.server.searching_string(corpus, 'café;2;'.encode('utf-8'), False,
+                                          linear_search) is True
+    assert server.server.ALL_LINES == {b'plain;1;', 'café;2;'.encode('utf-8'), b'last;3;',
+                                       b'latin;\xe9;'}
+    assert server.server.search_batch([b'last;3;', b'plain;1', b'latin;\xe9;'], False) == b'101'
+    assert server.server.searching_string(corpus, b'plain;1;', True, linear_search) is True
+    assert server.server.searching_string(corpus, b'plain;9;', True, linear_search) is False
+
+
+def test_bytes_mode_connections(corpus):  # pylint: disable=unused-argument
+    """
+    Test the framed and legacy connections in bytes mode, and that the queries that are not
+    valid UTF-8 are rejected unless VALIDATE_UTF8 is off.
+    """
+    client, server_sock = socket.socketpair()
+    thread = threading.Thread(target=client_conn, args=(server_sock, ('127.0.0.1', 0)))
+    thread.start()
+    with client:
+        assert framed_query(client, 'café;2;') is True
+        assert framed_batch(client, ['plain;1;', 'missing;', 'last;3;']) == [True, False, True]
+        client.sendall(encode_frame(QUERY, b'latin;\xe9;'))
+        assert read_frame(client).kind == ERROR
+    thread.join(5)
+
+    with patch('server.server.VALIDATE_UTF8', False):
+        client, server_sock = socket.socketpair()
+        thread = threading.Thread(target=client_conn, args=(server_sock, ('127.0.0.1', 0)))
+        thread.start()
+        with client:
+            client.sendall(b'latin;\xe9;\x00')
+            assert client.recv(1024) == b'STRING EXISTS\n'
+        thread.join(5)
@@ -0,0 +1,116 @@
+"""
+This module implements tests for the corpus files compressed with gzip, bz2 or xz
+"""
+
+# the compressed corpora
+import bz2
+import gzip
+import lzma
+
+# the reader thread must stop when the lines are not consumed
+import threading
+
+# for patching the corpus of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from server.compressed import is_compressed, iter_line_blocks, open_corpus
+from server.corpus_reload import DiffReader
+from server.index_stats import ReadCounter
+from search_algorithms import linear_search
+import server.server
+
+# lines with multibyte characters, so the blocks cut through some of them
+LINES = [f'line;{number};{"é" * (number % 7)}' for number in range(2000)]
+
+
+@pytest.fixture(name='corpora')
+def fixture_corpora(tmp_path):
+    """
+    Write the same corpus as a .gz, a .bz2 and a .xz file.
+    """
+    data = ('\n'.join(LINES) + '\n').encode('utf-8')
+    paths = []
+    for suffix, module in (('gz', gzip), ('bz2', bz2), ('xz', lzma)):
+        path = tmp_path / f'corpus.txt.{suffix}'
+        with module.open(path, 'wb') as f:
+            f.write(data)
+        paths.append(str(path))
+    return paths
+
+
+def test_open_corpus(corpora, tmp_path):
+    """
+    Test that the compressed files are recognized and read decompressed, and the other
+    files as they are.
+    """
+    plain = tmp_path / 'corpus.txt'
+    plain.write_text('a;\n', encoding='utf-8')
+    assert not is_compressed(str(plain))
+    with open_corpus(str(plain)) as f:
+        assert f.read() == 'a;\n'
+    for path in corpora:
+        assert is_compressed(path)
+        with open_corpus(path) as f:
+            assert f.read().split('\n')[:-1] == LINES
+
+
+def test_iter_line_blocks(corpora):
+    """
+    Test that the lines are split right when the blocks cut through lines and multibyte
+    characters, as str and as bytes, and with or without a last new line, and that the
+    blocks read are counted.
+    """
+    for path in corpora:
+        blocks = list(iter_line_blocks(path, block_size=100))
+        assert len(blocks) > 1
+        assert [line for block in blocks for line in block] == LINES
+        assert [line for block in iter_line_blocks(path, binary=True, block_size=333)
+                for line in block] == [line.encode('utf-8') for line in LINES]
+        # the decompressed bytes and the lines are counted while the blocks are read
+        counter = ReadCounter()
+        assert sum(map(len, iter_line_blocks(path, block_size=100, counter=counter))) == \
+            len(LINES)
+        assert (counter.raw_bytes, counter.lines) == \
+            (len(('\n'.join(LINES) + '\n').encode('utf-8')), len(LINES))
+
+
+def test_iter_line_blocks_errors(tmp_path):
+    """
+    Test that a truncated file raises once its first lines are consumed, and that the
+    reader thread stops when the caller stops consuming the blocks.
+    """
+    truncated = tmp_path / 'truncated.txt.gz'
+    data = gzip.compress(b'a;\n' * 100000)
+    truncated.write_bytes(data[:len(data) // 2])
+    with pytest.raises(EOFError):
+        list(iter_line_blocks(str(truncated), block_size=64))
+
+    large = tmp_path / 'large.txt.gz'
+    large.write_bytes(gzip.compress(b'a;\n' * 100000))
+    blocks = iter_line_blocks(str(large), block_size=16)
+    assert next(blocks) == ['a;'] * 5
+    blocks.close()
+    for thread in threading.enumerate():
+        if thread.name == 'corpus-reader':
+            thread.join(5)
+            assert not thread.is_alive()
+
+
+def test_server_compressed_corpus(corpora):
+    """
+    Test that the server indexes a compressed corpus, rereads it, follows it in diff mode
+    and reads it for the positional index.
+    """
+    for path in corpora:
+        with patch('server.server.ALL_LINES', None):
+            assert server.server.searching_string(path, 'line;5;ééééé', False,
+                                                  linear_search) is True
+            assert server.server.ALL_LINES == set(LINES)
+            assert server.server.searching_string(path, 'line;6;', True, linear_search) is False
+        assert DiffReader(path).load() == set(LINES)
+        with patch('server.server.FILE_PATH', path), \
+                patch('server.server.POSITIONAL', None):
+            assert server.server.positional_index().page('line;9;éé', 0, 10) == (1, [10])
@@ -0,0 +1,131 @@
+"""
+This module implements tests for the named corpora and their memory-bounded eviction
+"""
+
+# reading the [corpus:name] sections
+import configparser
+
+# socket pairs stand in for the client and server connections
+import socket
+
+# the server side of the socket pair runs on its own thread
+import threading
+
+# for patching the named corpora of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from protocol import QUERY, ERROR, NAMED_CORPUS, encode_frame, read_frame
+from client.client import framed_query, framed_batch, stream_queries
+from server.corpora import CorpusRegistry, corpus_sections
+from server.server import client_conn
+import server.server
+
+
+def test_corpus_sections(tmp_path):
+    """
+    Test that the [corpus:name] sections are read with their paths resolved from the data
+    directory, and that a section without a path is rejected.
+    """
+    config = configparser.ConfigParser()
+    config.read_string('[DEFAULT]\nlinuxpath=data\n[corpus:words]\npath=words.txt\n'
+                       '[corpus:logs]\npath=/var/logs.txt.gz\n[other]\npath=x\n')
+    assert corpus_sections(config, str(tmp_path)) == {'words': str(tmp_path / 'words.txt'),
+                                                      'logs': '/var/logs.txt.gz'}
+    config.read_string('[corpus:broken]\nmode=1\n')
+    with pytest.raises(ValueError):
+        corpus_sections(config, str(tmp_path))
+
+
+def test_lru_eviction():
+    """
+    Test that the corpora are loaded once on first use, that the least recently used ones
+    are evicted over the budget, and that the corpus just loaded is kept even when it is
+    larger than the budget.
+    """
+    events = []
+    loads = []
+
+    def load(name, path):
+        loads.append(name)
+        return {f'{path};{number};' for number in range(1000 if name == 'large' else 100)}
+
+    paths = {'a': 'a', 'b': 'b', 'c': 'c', 'large': 'large'}
+    registry = CorpusRegistry(paths, load,
+                              on_event=lambda event, name: events.append((event, name)))
+    registry.get('a')
+    # room for two of the small corpora
+    registry.budget_bytes = int(registry.resident_bytes * 2.5)
+
+    assert 'a;1;' in registry.get('a') and 'b;1;' in registry.get('b')
+    assert registry.get('a') is registry.get('a')
+    registry.get('c')
+    # b was used less recently than a
+    assert registry.report()['corpora']['b']['resident'] is False
+    assert list(registry.report()['corpora'])[:2] == ['a', 'c']
+    assert loads == ['a', 'b', 'c']
+    assert events.count(('eviction', 'b')) == 1 and events.count(('hit', 'a')) == 3
+
+    assert len(registry.get('large')) == 1000
+    assert [name for name, entry in registry.report()['corpora'].items()
+            if entry['resident']] == ['large']
+    assert registry.resident_bytes > registry.budget_bytes
+    registry.get('b')
+    assert loads == ['a', 'b', 'c', 'large', 'b']
+    assert 'missing' not in registry
+    with pytest.raises(KeyError):
+        registry.get('missing')
+
+
+def test_concurrent_first_use():
+    """
+    Test that a corpus requested by several threads at once is loaded only once.
+    """
+    loads = []
+    started = threading.Event()
+
+    def load(name, path):  # pylint: disable=unused-argument
+        loads.append(name)
+        started.wait(1)
+        return {'line;'}
+
+    registry = CorpusRegistry({'a': 'a'}, load)
+    threads = [threading.Thread(target=registry.get, args=('a',)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.set()
+    for thread in threads:
+        thread.join(5)
+    assert loads == ['a']
+
+
+def test_named_corpus_requests(tmp_path):
+    """
+    Test that the framed requests naming a corpus are looked up in it, that the requests
+    without a name still use the main corpus, and that the unknown or unreadable corpora
+    are answered with an error.
+    """
+    (tmp_path / 'words.txt').write_text('apple;\nbanana;\n', encoding='utf-8')
+    paths = {'words': str(tmp_path / 'words.txt'), 'gone': str(tmp_path / 'gone.txt')}
+    registry = CorpusRegistry(paths, server.server.load_named_corpus)
+    with patch('server.server.CORPORA', registry):
+        client, server_sock = socket.socketpair()
+        thread = threading.Thread(target=client_conn, args=(server_sock, ('127.0.0.1', 0)))
+        thread.start()
+        with client:
+            assert framed_query(client, 'banana;', 'words') is True
+            assert framed_query(client, 'banana;') is False
+            assert framed_batch(client, ['apple;', 'cherry;'], 'words') == [True, False]
+            assert list(stream_queries(client, ['cherry;', 'apple;', 'banana;'], 2,
+                                       corpus='words')) == [False, True, True]
+            client.sendall(encode_frame(QUERY, b'\x07unknownapple;', NAMED_CORPUS))
+            assert bytes(read_frame(client).payload) == b'unknown corpus unknown'
+            client.sendall(encode_frame(QUERY, b'\x04gon', NAMED_CORPUS))
+            assert read_frame(client).kind == ERROR
+            client.sendall(encode_frame(QUERY, b'\x04goneapple;', NAMED_CORPUS))
+            assert read_frame(client).kind == ERROR
+        thread.join(5)
+        assert registry.report()['corpora']['gone']['resident'] is False
+        assert '"named_corpora"' in server.server.admin_stats({})[1]
@@ -0,0 +1,227 @@
+"""
+This module implements tests for the incremental reloads of the corpus file
+"""
+
+# for replacing the corpus file
+import os
+
+# the first queries arrive on several threads at once
+import threading
+import time
+
+# for patching the reload state of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from server.corpus_reload import (
+    TailReader,
+    DiffReader,
+    split_chunks,
+    parse_reload_mode,
+    APPEND,
+    DIFF
+)
+from search_algorithms import linear_search
+import server.server
+
+
+def test_parse_reload_mode():
+    """
+    Test the parsing of the reload modes of the configuration file.
+    """
+    assert parse_reload_mode(' Append ') == APPEND
+    with pytest.raises(ValueError):
+        parse_reload_mode('sometimes')
+
+
+def test_tail_reader_reads_only_the_appended_lines(tmp_path):
+    """
+    Test that an update inserts the appended lines only, starting from the remembered
+    offset, and that an unterminated last line is replaced once it is complete.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_bytes(b'a;1;\nb;2;\nc;')
+    reader = TailReader(str(corpus))
+    lines = reader.load()
+    assert lines == {'a;1;', 'b;2;', 'c;'}
+    assert reader.offset == 10
+    assert reader.changed() is False
+
+    with open(corpus, 'ab') as f:
+        f.write(b'3;\nd;4;\n')
+    assert reader.changed() is True
+    assert reader.update(lines) == 2
+    assert lines == {'a;1;', 'b;2;', 'c;3;', 'd;4;'}
+    assert reader.update(lines) == 0
+
+
+def test_tail_reader_detects_truncation_and_replacement(tmp_path):
+    """
+    Test that an update asks for a full load when the file shrank or was replaced.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_bytes(b'a;1;\nb;2;\n')
+    reader = TailReader(str(corpus))
+    lines = reader.load()
+
+    corpus.write_bytes(b'a;1;\n')
+    assert reader.update(lines) is None
+
+    lines = reader.load()
+    replacement = tmp_path / 'replacement.txt'
+    replacement.write_bytes(b'a;1;\nz;9;\n')
+    os.replace(replacement, corpus)
+    assert reader.update(lines) is None
+    assert reader.load() == {'a;1;', 'z;9;'}
+
+
+def test_server_append_reload(tmp_path):
+    """
+    Test that the server in append mode picks up the appended lines without rereading
+    the whole file, and rebuilds the index when the file is replaced.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('first;\n', encoding='utf-8')
+    path = str(corpus)
+    with patch('server.server.RELOAD_MODE', APPEND), \
+            patch('server.server.RELOAD_CHECK_INTERVAL', 0), \
+            patch('server.server.ALL_LINES', None), \
+            patch('server.server.CORPUS_READER', None), \
+            patch('server.server.retrieve_all_file_lines') as full_reread:
+        assert server.server.searching_string(path, 'first;', True, linear_search) is True
+        assert server.server.searching_string(path, 'second;', True, linear_search) is False
+
+        with open(corpus, 'a', encoding='utf-8') as f:
+            f.write('second;\n')
+        assert server.server.searching_string(path, 'second;', True, linear_search) is True
+        assert server.server.CORPUS_READER.offset == len('first;\nsecond;\n')
+
+        corpus.write_text('third;\n', encoding='utf-8')
+        assert server.server.searching_string(path, 'first;', True, linear_search) is False
+        assert server.server.searching_string(path, 'third;', True, linear_search) is True
+        full_reread.assert_not_called()
+
+
+def test_concurrent_first_load_loads_once(tmp_path):
+    """
+    Test that the queries waiting for the first load of the corpus use the index loaded by
+    the first of them instead of loading it again.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('first;\n', encoding='utf-8')
+    loads = []
+    load = TailReader.load
+
+    def slow_load(reader):
+        loads.append(reader.path)
+        started.set()
+        release.wait(5)
+        return load(reader)
+
+    started, release = threading.Event(), threading.Event()
+    with patch('server.server.RELOAD_MODE', APPEND), \
+            patch('server.server.RELOAD_CHECK_INTERVAL', 60), \
+            patch('server.server.ALL_LINES', None), \
+            patch('server.server.CORPUS_READER', None), \
+            patch('server.server.CORPUS_GENERATION', 0), \
+            patch.object(TailReader, 'load', slow_load):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(server.server.searching_string(
+            str(corpus), 'first;', True, linear_search))) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # the other queries queue behind the first load
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        assert results == [True] * 4
+        assert loads == [str(corpus)]
+        assert server.server.CORPUS_GENERATION == 1
+
+
+def test_split_chunks_is_content_defined():
+    """
+    Test that the chunks hold whole lines and that an edit only changes the chunks
+    around it, the following chunks are the same.
+    """
+    lines = [f'line;{number};'.encode('utf-8') for number in range(5000)]
+    chunks = split_chunks(b'\n'.join(lines) + b'\n')
+    assert b'\n'.join(chunks).split(b'\n') == lines
+    assert 1 < len(chunks) < 5000
+
+    edited = split_chunks(b'\n'.join(lines[:10] + [b'inserted;'] + lines[10:]) + b'\n')
+    assert len(set(edited) - set(chunks)) <= 2
+    assert edited[-10:] == chunks[-10:]
+
+
+def test_diff_reader_applies_only_the_changes(tmp_path):
+    """
+    Test that a diff update inserts and deletes the changed lines only, and keeps the
+    lines that are still present in another place of the file.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    lines = [f'line;{number};' for number in range(3000)] + ['line;7;']
+    corpus.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    reader = DiffReader(str(corpus))
+    live = reader.load()
+    assert live == set(lines)
+
+    # delete one unique line, one copy of a duplicated line and insert a new line
+    lines.remove('line;100;')
+    lines.remove('line;7;')
+    lines.insert(2000, 'new;1;')
+    corpus.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    assert reader.changed() is True
+    reader.update(live)
+
+    assert live == set(lines)
+    assert (reader.inserted, reader.deleted) == (1, 1)
+    assert 'line;7;' in live
+    assert len(reader.chunks) == len(reader.chunk_counts)
+
+
+def test_diff_reader_keeps_only_the_keys(tmp_path):
+    """
+    Test that the diff reader keeps the keys of the lines shared with the live set instead
+    of a copy of the file, reads the file in blocks, and skips an unchanged file.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    lines = [f'line;{number};' for number in range(3000)]
+    corpus.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    reader = DiffReader(str(corpus))
+    with patch('server.corpus_reload.READ_BLOCK_SIZE', 1000):
+        live = reader.load()
+    assert live == set(lines)
+    keys = [key for chunk in reader.chunks.values() for key in chunk]
+    assert sorted(keys) == sorted(lines)
+    # the keys are the strings of the live set, not copies
+    assert all(any(key is line for line in live if line == key) for key in keys[:20])
+
+    with patch('server.corpus_reload.open_corpus') as read:
+        assert reader.update(live) == 0
+        read.assert_not_called()
+
+
+def test_server_diff_reload(tmp_path):
+    """
+    Test that the server in diff mode applies a rewrite of the corpus to the live set.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('first;\nsecond;\n', encoding='utf-8')
+    path = str(corpus)
+    with patch('server.server.RELOAD_MODE', DIFF), \
+            patch('server.server.RELOAD_CHECK_INTERVAL', 0), \
+            patch('server.server.ALL_LINES', None), \
+            patch('server.server.CORPUS_READER', None):
+        assert server.server.searching_string(path, 'first;', True, linear_search) is True
+        live = server.server.ALL_LINES
+
+        corpus.write_text('second;\nthird;\n', encoding='utf-8')
+        assert server.server.searching_string(path, 'first;', True, linear_search) is False
+        assert server.server.searching_string(path, 'third;', True, linear_search) is True
+        assert server.server.ALL_LINES is live
@@ -0,0 +1,122 @@
+"""
+This module implements tests for the connection deadlines of the server
+"""
+
+# real connected sockets for the deadlines
+import socket
+
+# for measuring how long a blocked recv waited
+import time
+
+# the connections are handled on their own thread
+import threading
+
+# for shortening the deadlines of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from server.deadlines import DeadlineScheduler, NO_DEADLINE, READ, IDLE
+from protocol import QUERY, encode_frame
+from server.server import client_conn, handle_connection
+
+
+def test_expired_deadline_shuts_the_socket_down():
+    """
+    Test that a blocked recv is woken up when its deadline expires and that the
+    timeout is reported with its kind.
+    """
+    timeouts = []
+    scheduler = DeadlineScheduler(timeouts.append)
+    server_side, client_side = socket.socketpair()
+    try:
+        start = time.monotonic()
+        deadline = scheduler.arm(server_side, READ, 0.05)
+        assert server_side.recv(1024) == b''
+        scheduler.cancel(deadline)
+
+        assert time.monotonic() - start < 2
+        assert deadline.expired is True
+        assert timeouts == [READ]
+        assert scheduler.pending() == 0
+    finally:
+        server_side.close()
+        client_side.close()
+
+
+def test_cancelled_deadline_never_fires():
+    """
+    Test that cancelled deadlines do not fire, that many cancelled deadlines are
+    compacted and that a timeout of 0 disables the deadline.
+    """
+    timeouts = []
+    scheduler = DeadlineScheduler(timeouts.append)
+    server_side, client_side = socket.socketpair()
+    try:
+        deadlines = [scheduler.arm(server_side, IDLE, 0.05) for _ in range(200)]
+        for deadline in deadlines:
+            scheduler.cancel(deadline)
+        assert scheduler.pending() == 0
+        assert scheduler.arm(server_side, IDLE, 0) is NO_DEADLINE
+
+        time.sleep(0.2)
+        client_side.sendall(b'query')
+        assert server_side.recv(1024) == b'query'
+        assert timeouts == []
+        assert not any(deadline.expired for deadline in deadlines)
+    finally:
+        server_side.close()
+        client_side.close()
+
+
+
+def serve_until_closed(target, *args) -> float:
+    """Run a connection handler on a thread and return how long it took to close the socket."""
+    start = time.monotonic()
+    thread = threading.Thread(target=target, args=args)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    return time.monotonic() - start
+
+
+@patch('server.server.IDLE_TIMEOUT', 0.3)
+@patch('server.server.READ_TIMEOUT', 0.05)
+def test_server_closes_idle_and_stalled_connections():
+    """
+    Test that a connection that never sends a request is closed by the idle deadline and
+    not by the shorter read deadline, and that a request stalled after its first bytes is
+    closed by the read deadline.
+    """
+    client, server_side = socket.socketpair()
+    with client:
+        waited = serve_until_closed(client_conn, server_side, ('127.0.0.1', 0))
+        assert waited >= 0.3
+        assert client.recv(1024) == b''
+
+    client, server_side = socket.socketpair()
+    with client:
+        client.sendall(encode_frame(QUERY, b'line;1;')[:5])
+        waited = serve_until_closed(client_conn, server_side, ('127.0.0.1', 0))
+        assert waited < 0.3
+        assert client.recv(1024) == b''
+
+
+@patch('server.server.HANDSHAKE_TIMEOUT', 0.1)
+def test_server_closes_stalled_tls_handshakes():
+    """
+    Test that a client that never completes the TLS handshake is closed by the handshake
+    deadline and that its admission slot is released.
+    """
+    listener = socket.create_server(('127.0.0.1', 0))
+    with listener, socket.create_connection(listener.getsockname()) as client, \
+            patch('server.server.ADMISSION') as admission:
+        server_side, address = listener.accept()
+        serve_until_closed(handle_connection, server_side, address, True)
+        assert client.recv(1024) == b''
+        admission.release.assert_called_once_with(address[0])
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,130 @@
+"""
+This module implements tests for the approximate matching of the queries
+"""
+
+# endless duplicate candidates
+import itertools
+
+# random corpora and edits
+import random
+
+# socket pairs stand in for the client and server connections
+import socket
+
+# the server side of the socket pair runs on its own thread
+import threading
+
+# deadlines of the lookups
+import time
+
+# for enabling the fuzzy queries of the server
+from unittest.mock import patch
+
+from server.fuzzy import FuzzyIndex, bounded_distance, pieces
+from client.client import framed_fuzzy
+from protocol import FrameError
+from server.server import client_conn
+
+
+def test_bounded_distance():
+    """
+    Test the Levenshtein distance and its bound.
+    """
+    assert bounded_distance('kitten', 'sitting', 3) == 3
+    assert bounded_distance('kitten', 'sitting', 2) == 3
+    assert bounded_distance('same', 'same', 0) == 0
+    assert bounded_distance('', 'abc', 5) == 3
+    assert bounded_distance('abc', 'abcdef', 2) == 3
+
+
+def test_pieces_cover_the_line():
+    """
+    Test that the pieces of a line are contiguous and cover it.
+    """
+    assert pieces(10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert pieces(2, 3) == [(0, 0), (0, 1), (1, 2)]
+
+
+def test_fuzzy_index_matches_a_full_scan():
+    """
+    Test that the index finds exactly the lines a full scan finds, for random edits
+    of random corpus lines and every distance up to the maximum.
+    """
+    generator = random.Random(7)
+    lines = sorted({';'.join(str(generator.randrange(100)) for _ in range(4)) + ';'
+                    for _ in range(2000)})
+    index = FuzzyIndex(lines, max_distance=2)
+    for _ in range(200):
+        query = list(generator.choice(lines))
+        for _ in range(generator.randrange(4)):
+            position = generator.randrange(len(query) + 1)
+            operation = generator.randrange(3)
+            if operation == 0:
+                query.insert(position, generator.choice('0123456789;'))
+            elif position < len(query):
+                if operation == 1:
+                    del query[position]
+                else:
+                    query[position] = generator.choice('0123456789;')
+        query = ''.join(query)
+        for distance in (0, 1, 2):
+            expected = sorted((line_distance, line) for line in lines
+                              if (line_distance := bounded_distance(query, line, distance))
+                              <= distance)
+            result = index.search(query, distance, len(lines), time.monotonic() + 60)
+            assert result.matches == expected
+            assert result.truncated is False
+
+
+def test_fuzzy_search_limit_and_time_budget():
+    """
+    Test that the matches are capped to the limit, closest first, and that a lookup
+    past its deadline stops and reports it.
+    """
+    lines = [f'aaaaaaaa{number:03d}' for number in range(1000)]
+    index = FuzzyIndex(lines, max_distance=2)
+
+    result = index.search('aaaaaaaa000', 1, 3, time.monotonic() + 60)
+    assert result.matches == [(0, 'aaaaaaaa000'), (1, 'aaaaaaaa001'), (1, 'aaaaaaaa002')]
+
+    result = index.search('aaaaaaaa000', 2, 1000, time.monotonic() - 1)
+    assert result.truncated is True
+    assert len(result.matches) < 1000
+
+
+
+def test_fuzzy_search_deadline_with_duplicate_candidates():
+    """
+    Test that a lookup whose candidates are all duplicates of lines already checked
+    still stops at its deadline.
+    """
+    index = FuzzyIndex(['aaaaaaaa000'], max_distance=2)
+    with patch.object(index, 'candidates', return_value=itertools.repeat(0)):
+        result = index.search('aaaaaaaa000', 2, 10, time.monotonic() - 1)
+    assert result == ([(0, 'aaaaaaaa000')], True)
+
+
+@patch('server.server.FUZZY_ENABLED', True)
+@patch('server.server.ALL_LINES', {'alpha;1;', 'alpha;22;', 'beta;2;'})
+@patch('server.server.FUZZY_INDEX', None)
+def test_server_fuzzy_queries():
+    """
+    Test the FUZZY frames of a framed connection, and that they are rejected instead
+    of queued when too many are running.
+    """
+    client, server = socket.socketpair()
+    thread = threading.Thread(target=client_conn, args=(server, ('127.0.0.1', 0)))
+    thread.start()
+    with client:
+        assert framed_fuzzy(client, 'alpha;2;') == ([(1, 'alpha;1;'), (1, 'alpha;22;')], False)
+        assert framed_fuzzy(client, 'alpha;2;', 0) == framed_fuzzy(client, 'alpha;2;', 2)
+        assert framed_fuzzy(client, 'gamma;3;') == ([], False)
+
+        with patch('server.server.FUZZY_SLOTS', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            try:
+                framed_fuzzy(client, 'alpha;2;')
+                assert False, 'the fuzzy query should be rejected'
+            except FrameError as error:
+                assert 'retry later' in str(error)
+    thread.join(5)
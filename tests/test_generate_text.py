@@ -10,7 +10,13 @@ from unittest.mock import patch, mock_open
 import pytest
 
 # Import the generate_text_files function from the module where it's defined
-from generate_text import generate_text_files
+from generate_text import (
+    CorpusSpec,
+    generate_query_workload,
+    generate_text_files,
+    write_corpus,
+    zipf_rank
+)
 
 
 def test_generate_text_files_success():
@@ -150,6 +156,80 @@ def test_generate_text_files_file_exists_error():
         assert result is True, "The function should handle FileExistsError and continue."
 
 
+def test_generate_text_files_is_reproducible_with_a_seed(tmp_path, monkeypatch):
+    """
+    Test case for the generate_text_files function when a seed is given.
+
+    Effects:
+    Generates the same size twice with the same seed and different chunk sizes
+    and asserts that both files are identical, then checks the duplicate ratio
+    and the line lengths.
+    """
+    monkeypatch.chdir(tmp_path)
+    options = {'seed': 11, 'workers': 1, 'duplicate_ratio': 0.25, 'min_length': 30,
+               'max_length': 40}
+
+    assert generate_text_files([5000], chunk_size=700, **options) is True
+    first = (tmp_path / 'data' / '5k.txt').read_text(encoding='utf-8')
+    assert generate_text_files([5000], chunk_size=5000, **options) is True
+    second = (tmp_path / 'data' / '5k.txt').read_text(encoding='utf-8')
+
+    lines = first.splitlines()
+    assert first == second
+    assert len(lines) == 5000
+    assert 0.15 < 1 - len(set(lines)) / len(lines) < 0.35
+    assert all(30 <= len(line) <= 40 for line in lines)
+
+
+def test_write_corpus_sorted(tmp_path):
+    """
+    Test case for the write_corpus function with a sortedness of 1.0.
+
+    Effects:
+    Asserts that the written file is sorted even when it contains duplicates.
+    """
+    path = tmp_path / 'sorted.txt'
+    write_corpus(str(path), CorpusSpec(3000, 5, 0.1, sortedness=1.0), chunk_size=500)
+
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 3000
+    assert lines == sorted(lines)
+
+
+def test_generate_query_workload_hit_ratio(tmp_path):
+    """
+    Test case for the generate_query_workload function.
+
+    Effects:
+    Asserts that every query reported as a hit is a line of the corpus
+    and that the misses never are.
+    """
+    spec = CorpusSpec(2000, 3, 0.1)
+    corpus_path = tmp_path / 'corpus.txt'
+    queries_path = tmp_path / 'queries.txt'
+    write_corpus(str(corpus_path), spec)
+    hits = generate_query_workload(str(queries_path), spec, 1000, hit_ratio=0.7, zipf_skew=1.2)
+
+    corpus = set(corpus_path.read_text(encoding='utf-8').splitlines())
+    queries = queries_path.read_text(encoding='utf-8').splitlines()
+    assert len(queries) == 1000
+    assert sum(query in corpus for query in queries) == hits
+    assert 600 < hits < 800
+
+
+def test_zipf_rank_bounds_and_skew():
+    """
+    Test case for the zipf_rank function.
+
+    Effects:
+    Asserts that the ranks stay in range and that the first rank is the most popular.
+    """
+    ranks = [zipf_rank(number / 1000, 100, 1.0) for number in range(1000)]
+    assert min(ranks) == 0 and max(ranks) == 99
+    assert ranks.count(0) > ranks.count(50)
+    assert zipf_rank(0.5, 100, 0.0) == 50
+
+
 # Run the tests
 if __name__ == "__main__":
     pytest.main()
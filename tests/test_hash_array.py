@@ -0,0 +1,140 @@
+"""
+This module implements tests for the vectorized hash array engine of the batch lookups
+"""
+
+# for holding a background build of the engine
+import threading
+
+# for waiting on a background build of the engine
+import time
+
+# for patching the corpus and the algorithm of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+# the engine is only tested where its optional dependency is installed
+np = pytest.importorskip('numpy')
+
+# pylint: disable=wrong-import-position
+from server.hash_array import HashArrayIndex, benchmark
+import server.server
+
+
+class Colliding(str):
+    """A line whose hash collides with the hash of every other Colliding line."""
+
+    def __hash__(self):
+        return 42
+
+
+def test_hash_array_lookups():
+    """
+    Test that the batches and the single queries give the same answers as a set, for str
+    and bytes lines, including the empty line and an empty batch.
+    """
+    lines = {f'line;{number};' for number in range(5000)} | {'', 'Café;1;'}
+    engine = HashArrayIndex(lines)
+    assert len(engine) == len(lines)
+    queries = [f'line;{number};' for number in range(0, 10000, 7)] + ['', 'Café;1;', 'café;1;']
+    assert engine.contains_batch(queries) == bytes(0x31 if query in lines else 0x30
+                                                   for query in queries)
+    assert all(line in engine for line in lines)
+    assert 'line;5000;' not in engine
+    assert engine.contains_batch([]) == b''
+    assert HashArrayIndex([]).contains_batch(['a', 'b']) == b'00'
+    assert 'a' not in HashArrayIndex([])
+
+    raw = HashArrayIndex({b'a;1;', b'b;2;'})
+    assert raw.contains_batch([b'b;2;', b'c;3;', b'a;1;']) == b'101'
+
+
+def test_hash_array_collisions():
+    """
+    Test that the lines sharing a hash are all confirmed against the query, and that a
+    query with the hash of a line but another text is not found.
+    """
+    lines = [Colliding('first'), Colliding('second'), Colliding('third'), 'other']
+    engine = HashArrayIndex(lines)
+    queries = [Colliding('third'), Colliding('missing'), Colliding('first'), 'other', 'second']
+    assert engine.contains_batch(queries) == b'10110'
+    assert Colliding('second') in engine
+    assert Colliding('fourth') not in engine
+
+
+def test_benchmark():
+    """
+    Test that the benchmark runs both engines on the same batch.
+    """
+    timings = benchmark([f'line;{number};' for number in range(1000)],
+                        ['line;1;', 'missing;'], repeat=2)
+    assert set(timings) == {'set_build', 'hash_array_build', 'set_batch', 'hash_array_batch'}
+
+
+def published_engine() -> HashArrayIndex:
+    """Wait for the background build of the engine of the current corpus generation."""
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        built = server.server.HASH_ARRAY
+        if built is not None and built[0] == server.server.CORPUS_GENERATION:
+            return built[1]
+        time.sleep(0.01)
+    raise AssertionError('the hash array engine was not published')
+
+
+def test_server_hash_array(tmp_path):
+    """
+    Test that the server answers the batches and the single queries with the engine, and
+    rebuilds it when the corpus generation changes.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('alpha;1;\nbeta;2;\n', encoding='utf-8')
+    with patch('server.server.SEARCH_ALGORITHM', 'hash_array'), \
+            patch('server.server.FILE_PATH', str(corpus)), \
+            patch('server.server.ALL_LINES', None), \
+            patch('server.server.HASH_ARRAY', None):
+        assert server.server.search_batch(['alpha;1;', 'gamma;3;', 'beta;2;'], False) == b'101'
+        engine = published_engine()
+        assert isinstance(engine, HashArrayIndex) and len(engine) == 2
+        assert server.server.searching_string(str(corpus), 'beta;2;', False,
+                                              server.server.hash_array_search) is True
+
+        server.server.ALL_LINES.add('gamma;3;')
+        server.server.CORPUS_GENERATION += 1
+        assert server.server.search_batch(['gamma;3;', 'delta;4;'], False) == b'10'
+        assert published_engine() is not engine
+
+
+def test_server_rebuilds_hash_array_in_background():
+    """
+    Test that a request never waits for the engine: while a rebuild is running the previous
+    engine stays published, the queries are answered from the set of lines, and the new
+    engine replaces the previous one once it is built.
+    """
+    release = threading.Event()
+
+    class SlowIndex(HashArrayIndex):
+        """An engine whose build waits for the test."""
+        def __init__(self, lines):
+            release.wait(5)
+            super().__init__(lines)
+
+    lines = {'alpha;1;', 'beta;2;'}
+    previous = HashArrayIndex(lines)
+    generation = server.server.CORPUS_GENERATION
+    with patch('server.server.SEARCH_ALGORITHM', 'hash_array'), \
+            patch('server.server.HashArrayIndex', SlowIndex), \
+            patch('server.server.ALL_LINES', lines), \
+            patch('server.server.CORPUS_GENERATION', generation + 1), \
+            patch('server.server.HASH_ARRAY', (generation, previous)):
+        lines.add('gamma;3;')
+        started = time.monotonic()
+        assert server.server.search_batch(['gamma;3;', 'delta;4;'], False) == b'10'
+        assert time.monotonic() - started < 1
+        assert server.server.hash_array_index() is None
+        assert server.server.HASH_ARRAY == (generation, previous)
+
+        release.set()
+        engine = published_engine()
+        assert isinstance(engine, SlowIndex) and len(engine) == 3
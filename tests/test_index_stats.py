@@ -0,0 +1,166 @@
+"""
+This module implements tests for the memory and build cost accounting of the indexes
+"""
+
+# the report is JSON
+import json
+
+# for the expected sizes
+import sys
+
+# the compressed corpus of the server
+import gzip
+
+# the allocation measured by the build meter is held for a few samples
+import time
+
+# for patching the index stats of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from server.index_stats import BuildMeter, IndexStats, ReadCounter, estimate_bytes
+from server.index_stats import rss_bytes
+import server.compressed
+from search_algorithms import linear_search
+import server.server
+
+
+@pytest.mark.parametrize('content, expected', [(b'a;\nbb;\n', (7, 2)),
+                                               (b'a;\nbb;', (6, 2)),
+                                               (b'', (0, 0))])
+def test_server_counts_the_plain_corpus(tmp_path, content, expected):
+    """
+    Test the size and the line count the server records for a plain corpus file when it
+    builds the index, with and without a last new line.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_bytes(content)
+    with patch('server.server.ALL_LINES', None), \
+            patch('server.server.INDEX_STATS', IndexStats()), \
+            patch('server.server.INDEX_STATS_FILE', ''):
+        server.server.searching_string(str(corpus), 'a;', False, linear_search)
+        entry = server.server.INDEX_STATS.report()['indexes']['corpus']
+    assert (entry['raw_bytes'], entry['lines']) == expected
+
+
+def test_read_counter():
+    """
+    Test that the counter of the blocks read by a build counts the bytes and the lines,
+    a last line without a new line character included.
+    """
+    counter = ReadCounter()
+    for block in (b'a;\nb', b'b;\n', b'', b'c;'):
+        assert counter.count(block) == block
+    assert (counter.raw_bytes, counter.lines) == (9, 3)
+    assert ReadCounter().lines == 0
+
+
+def test_estimate_bytes_counts_the_objects_of_numpy_arrays():
+    """
+    Test that a NumPy array of objects counts for the objects it references, and that a
+    numeric array only counts for its buffer.
+    """
+    np = pytest.importorskip('numpy')
+    lines = [f'line;{number};' * 10 for number in range(100)]
+    objects = np.empty(len(lines), dtype=object)
+    objects[:] = lines
+    assert estimate_bytes(objects) == sys.getsizeof(objects) + sum(map(sys.getsizeof, lines))
+    numbers = np.arange(100, dtype=np.int64)
+    assert estimate_bytes(numbers) == sys.getsizeof(numbers)
+
+
+def test_build_meter_samples_the_peak_of_the_build():
+    """
+    Test that the peak of a build is sampled while it runs, not the peak of the process,
+    so memory freed before the end of the build still counts.
+    """
+    if rss_bytes() is None:
+        pytest.skip('the resident set size is not available')
+    size = 64 * 1024 * 1024
+    with BuildMeter(sample_seconds=0.001) as meter:
+        block = bytearray(size)
+        time.sleep(0.05)
+        del block
+    assert meter.peak_rss >= meter.rss_before + size // 2
+    with BuildMeter() as small:
+        pass
+    assert small.peak_rss < meter.peak_rss
+
+
+def test_estimate_bytes():
+    """
+    Test that the small structures are measured exactly, every object once, and that the
+    sampled estimate of a large structure stays close to its exact size.
+    """
+    lines = {'a;1;', 'b;22;', 'c;333;'}
+    assert estimate_bytes(lines) == sys.getsizeof(lines) + sum(map(sys.getsizeof, lines))
+    shared = 'shared;'
+    assert estimate_bytes([shared, shared]) == sys.getsizeof([shared, shared]) + \
+        sys.getsizeof(shared)
+    assert estimate_bytes(memoryview(bytearray(4096))) == 4096
+
+    large = {f'line;{number * 7919};{"x" * (number % 50)}' for number in range(50000)}
+    exact = estimate_bytes(large, sample_size=len(large))
+    assert abs(estimate_bytes(large) - exact) < exact * 0.05
+
+
+def test_index_stats_report(tmp_path):
+    """
+    Test the entries of the recorded builds and the report file.
+    """
+    stats = IndexStats()
+    with BuildMeter() as meter:
+        lines = {'a;', 'b;'}
+    entry = stats.record('corpus', lines, meter, lines=3, raw_bytes=9)
+    assert entry['structure'] == 'set'
+    assert (entry['entries'], entry['lines'], entry['raw_bytes']) == (2, 3, 9)
+    assert entry['estimated_bytes'] == estimate_bytes(lines)
+    assert entry['build_seconds'] >= 0
+
+    path = tmp_path / 'stats' / 'index_stats.json'
+    stats.write(str(path))
+    report = json.loads(path.read_text(encoding='utf-8'))
+    assert report['indexes']['corpus']['entries'] == 2
+    assert report['estimated_bytes'] == entry['estimated_bytes']
+
+
+def test_server_index_stats(tmp_path):
+    """
+    Test that the server records the corpus index when it is loaded, writes the stats
+    file, and serves the report on /admin/stats.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('first;\nsecond;\nfirst;\n', encoding='utf-8')
+    stats_file = tmp_path / 'index_stats.json'
+    with patch('server.server.ALL_LINES', None), \
+            patch('server.server.INDEX_STATS', IndexStats()), \
+            patch('server.server.INDEX_STATS_FILE', str(stats_file)):
+        assert server.server.searching_string(str(corpus), 'first;', False, linear_search)
+        status, text = server.server.admin_stats({})
+        assert status == 200
+        corpus_entry = json.loads(text)['indexes']['corpus']
+        assert (corpus_entry['lines'], corpus_entry['entries']) == (3, 2)
+        assert corpus_entry['raw_bytes'] == len('first;\nsecond;\nfirst;\n')
+        assert json.loads(stats_file.read_text(encoding='utf-8'))['indexes']['corpus'] == \
+            corpus_entry
+
+
+def test_server_counts_the_corpus_while_building(tmp_path):
+    """
+    Test that the lines and the bytes of a compressed corpus are counted while the index is
+    built, without reading the file a second time for the stats.
+    """
+    content = b'first;\nsecond;\nfirst;'
+    corpus = tmp_path / 'corpus.txt.gz'
+    corpus.write_bytes(gzip.compress(content))
+    with patch('server.server.ALL_LINES', None), \
+            patch('server.server.INDEX_STATS', IndexStats()), \
+            patch('server.server.INDEX_STATS_FILE', ''), \
+            patch('server.compressed.open_corpus', wraps=server.compressed.open_corpus) as read:
+        assert server.server.searching_string(str(corpus), 'second;', False, linear_search)
+        entry = server.server.INDEX_STATS.report()['indexes']['corpus']
+        assert (entry['lines'], entry['raw_bytes']) == (3, len(content))
+        assert entry['compressed_bytes'] == corpus.stat().st_size
+        assert read.call_count == 1
@@ -0,0 +1,149 @@
+"""
+This module implements tests for the server metrics and the metrics listener
+"""
+
+# for multithreading updates of the metrics
+import threading
+
+# for fetching the metrics from the listener
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+# main testing module used
+import pytest
+
+from server.metrics import MetricsRegistry, start_metrics_server, MIN_FOLD_SHARDS
+
+
+def test_counter_sums_the_shards_of_all_threads():
+    """
+    Test that a counter updated from many short-lived threads reports the
+    total of all the threads, including the threads that have finished.
+    """
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', 'Requests', ('result',))
+
+    def work():
+        for _ in range(100):
+            counter.labels('found').inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.labels('found').value() == 800
+    assert 'requests_total{result="found"} 800' in registry.render()
+    # the shards of the finished threads are folded and not counted twice
+    assert counter.labels('found').value() == 800
+
+
+def test_gauge_inc_dec_and_function():
+    """
+    Test that a gauge goes up and down and that a gauge computed by a function
+    is evaluated when rendered.
+    """
+    registry = MetricsRegistry()
+    active = registry.gauge('active', 'Active connections')
+    size = registry.gauge('size', 'Index size')
+    size.set_function(lambda: 42)
+
+    active.inc()
+    active.inc()
+    active.dec()
+
+    text = registry.render()
+    assert '# TYPE active gauge' in text
+    assert 'active 1' in text
+    assert 'size 42' in text
+
+
+def test_histogram_renders_cumulative_buckets():
+    """
+    Test that the histogram buckets are cumulative and that the sum and count are rendered.
+    """
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum 5.55' in lines
+    assert 'latency_seconds_count 3' in lines
+
+
+def test_labels_and_duplicate_registration_are_validated():
+    """
+    Test that a wrong number of label values and a duplicate metric name are rejected.
+    """
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', 'Requests', ('result', 'algorithm'))
+
+    with pytest.raises(ValueError):
+        counter.labels('found')
+    with pytest.raises(ValueError):
+        registry.counter('requests_total', 'Requests')
+
+
+def test_metrics_listener_serves_the_registry():
+    """
+    Test that the metrics listener serves the metrics on /metrics and 404 on other paths.
+    """
+    registry = MetricsRegistry()
+    registry.counter('requests_total', 'Requests').inc(3)
+    http_server = start_metrics_server(0, registry, host='127.0.0.1')
+    port = http_server.server_address[1]
+    try:
+        with urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+            body = response.read().decode('utf-8')
+        assert 'requests_total 3' in body
+        with pytest.raises(HTTPError):
+            urlopen(f'http://127.0.0.1:{port}/other')
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+
+
+def test_shards_of_finished_threads_are_folded_without_scrape():
+    """
+    Test that the shards of many short-lived threads are folded when new threads create
+    their shards, so they stay bounded even when the metrics are never scraped.
+    """
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', 'Requests', ('result',))
+    child = counter.labels('found')
+    for _ in range(2000):
+        thread = threading.Thread(target=child.inc)
+        thread.start()
+        thread.join()
+    # pylint: disable=protected-access
+    assert child._values.shard_count <= 2 * MIN_FOLD_SHARDS
+    assert child.value() == 2000
+
+
+def test_disabled_registry_records_nothing():
+    """
+    Test that the metrics of a disabled registry do not shard or record their updates,
+    and still check their labels.
+    """
+    registry = MetricsRegistry(enabled=False)
+    counter = registry.counter('requests_total', 'Requests', ('result',))
+    latency = registry.histogram('latency_seconds', 'Latency')
+    counter.labels('found').inc()
+    latency.observe(0.5)
+    registry.gauge('active', 'Active connections').dec()
+    with pytest.raises(ValueError):
+        counter.labels('found', 'linear')
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text and 'requests_total{' not in text
+    assert 'latency_seconds_count' not in text
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,72 @@
+"""
+This module implements tests for the normalization of the corpus lines and of the queries
+"""
+
+# for patching the normalization of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from server.normalization import build_normalizer, parse_steps
+from server.corpus_reload import TailReader
+from search_algorithms import linear_search
+import server.server
+
+
+def test_parse_steps():
+    """
+    Test the parsing of the normalization steps of the configuration file.
+    """
+    assert parse_steps('') == ()
+    assert parse_steps(' NFKC, casefold ,whitespace') == ('nfkc', 'casefold', 'whitespace')
+    with pytest.raises(ValueError):
+        parse_steps('nfkc,lowercase')
+    with pytest.raises(ValueError):
+        parse_steps('nfc,nfkc')
+
+
+def test_normalization_pipeline():
+    """
+    Test every normalization step, and that no step means exact matching.
+    """
+    assert build_normalizer('') is None
+    assert build_normalizer('casefold')('  Straße\n') == 'strasse'
+    assert build_normalizer('whitespace')(' a \t b  c\n') == 'a b c'
+    # composed and decomposed forms of the same text
+    assert build_normalizer('nfc')('Cafe\u0301') == 'Caf\u00e9'
+    assert build_normalizer('nfkc')('Ａ①') == 'A1'
+    assert build_normalizer('nfc')('Ａ') == 'Ａ'
+    normalize = build_normalizer('nfkc,casefold,whitespace')
+    assert normalize(' ＡBC   Cafe\u0301 ') == normalize('abc caf\u00e9')
+
+
+def test_reader_normalizes_the_lines(tmp_path):
+    """
+    Test that the incremental reloads insert the normalized lines.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('Hello  World\n', encoding='utf-8')
+    assert TailReader(str(corpus), build_normalizer('casefold,whitespace')).load() == {
+        'hello world'}
+
+
+def test_server_normalized_matching(tmp_path):
+    """
+    Test that the server normalizes the index once and every query, so the queries
+    differing in case, whitespace or Unicode form are found.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('Caf\u00e9  Latte;1;\nplain;2;\n', encoding='utf-8')
+    normalize = build_normalizer('nfc,casefold,whitespace')
+    with patch('server.server.NORMALIZER', normalize), \
+            patch('server.server.LINE_NORMALIZER', normalize), \
+            patch('server.server.FILE_PATH', str(corpus)), \
+            patch('server.server.ALL_LINES', None):
+        path = str(corpus)
+        assert server.server.searching_string(path, ' cafe\u0301 latte;1; ', False,
+                                              linear_search) is True
+        assert server.server.searching_string(path, 'PLAIN;2;', False, linear_search) is True
+        assert server.server.searching_string(path, 'plain;3;', False, linear_search) is False
+        assert server.server.ALL_LINES == {'caf\u00e9 latte;1;', 'plain;2;'}
+        assert server.server.search_batch(['x', 'Plain;2;', 'CAFÉ LATTE;1;'], False) == b'011'
@@ -0,0 +1,116 @@
+"""
+This module implements tests for the static perfect hash index of the read-only corpora
+"""
+
+# for patching the index of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from server.perfect_hash import PerfectHash, benchmark, build, verify, HEADER
+from server.normalization import build_normalizer
+from search_algorithms import linear_search
+import server.server
+
+
+def test_build_minimal_table(tmp_path):
+    """
+    Test that every unique line gets its own slot, with as many slots as lines, for
+    several bucket sizes.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    lines = [f'line;{number % 3000};' for number in range(5000)] + [' Café;1; ', '']
+    corpus.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    expected = {line.strip().encode('utf-8') for line in lines}
+    for bucket_size in (1, 2, 4):
+        table_path = str(tmp_path / f'corpus.{bucket_size}.phf')
+        assert build(str(corpus), table_path, bucket_size) == len(expected)
+        table = PerfectHash(table_path)
+        assert len(table) == len(expected) and set(table) == expected
+        assert [table.slot(key) for key in table] == list(range(len(table)))
+        table.close()
+        assert verify(str(corpus), table_path) == len(expected)
+
+
+def test_perfect_hash_lookups(tmp_path):
+    """
+    Test that every line is found as str and as bytes, and that the missing lines are not,
+    including the lines sharing a slot with a line of the table.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    lines = [f'{number * 7919 % 10007};{number % 13};' for number in range(2000)]
+    corpus.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    table_path = str(tmp_path / 'corpus.phf')
+    build(str(corpus), table_path)
+
+    table = PerfectHash(table_path)
+    assert all(line in table for line in lines)
+    assert all(line.encode('utf-8') in table for line in lines[:100])
+    for missing in ('', 'x', f'{lines[0]}x', lines[1][:-1], f'{lines[2]}\n{lines[3]}'):
+        assert missing not in table
+    table.close()
+
+
+def test_perfect_hash_edge_cases(tmp_path):
+    """
+    Test an empty corpus, a normalized corpus, a table that does not match its corpus and
+    files that are not tables.
+    """
+    empty = tmp_path / 'empty.txt'
+    empty.write_text('', encoding='utf-8')
+    build(str(empty), str(tmp_path / 'empty.phf'))
+    table = PerfectHash(str(tmp_path / 'empty.phf'))
+    assert len(table) == 0 and 'a' not in table and '' not in table
+
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('Hello  World\nother\n', encoding='utf-8')
+    table_path = str(tmp_path / 'corpus.phf')
+    normalize = build_normalizer('casefold,whitespace')
+    build(str(corpus), table_path, normalize=normalize)
+    assert 'hello world' in PerfectHash(table_path)
+    assert verify(str(corpus), table_path, normalize) == 2
+
+    corpus.write_text('hello world\nother\nnew\n', encoding='utf-8')
+    with pytest.raises(ValueError):
+        verify(str(corpus), table_path, normalize)
+
+    data = (tmp_path / 'corpus.phf').read_bytes()
+    (tmp_path / 'corpus.phf').write_bytes(data[:-1])
+    with pytest.raises(ValueError):
+        PerfectHash(table_path)
+    (tmp_path / 'corpus.phf').write_bytes(b'nothing' * HEADER.size)
+    with pytest.raises(ValueError):
+        PerfectHash(table_path)
+
+
+def test_benchmark(tmp_path):
+    """
+    Test that the benchmark compares the table with the set searched by hash_search.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text(''.join(f'line;{number};\n' for number in range(1000)), encoding='utf-8')
+    build(str(corpus), str(tmp_path / 'corpus.phf'))
+    report = benchmark(str(corpus), str(tmp_path / 'corpus.phf'), query_count=200)
+    assert set(report) == {'set', 'perfect_hash'}
+    assert report['perfect_hash']['bytes'] < report['set']['bytes']
+
+
+def test_server_perfect_hash(tmp_path):
+    """
+    Test that the server answers the queries and the batches from the table without
+    loading the corpus.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('alpha;1;\nbeta;2;\n', encoding='utf-8')
+    table_path = str(tmp_path / 'corpus.phf')
+    build(str(corpus), table_path)
+    with patch('server.server.PERFECT_HASH_INDEX', PerfectHash(table_path)), \
+            patch('server.server.ALL_LINES', None), \
+            patch('server.server.retrieve_all_file_lines') as load:
+        assert server.server.searching_string(str(corpus), 'beta;2;', False,
+                                              linear_search) is True
+        assert server.server.search_batch(['alpha;1;', 'gamma;3;', 'beta;2;'], False) == b'101'
+        assert server.server.ALL_LINES is None
+        load.assert_not_called()
+        assert 'perfect_hash' in server.server.admin_stats({})[1]
@@ -0,0 +1,89 @@
+"""
+This module implements tests for the line numbers and occurrence counts of the corpus lines
+"""
+
+# socket pairs stand in for the client and server connections
+import socket
+
+# the server side of the socket pair runs on its own thread
+import threading
+
+# for enabling the positional queries of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from server.positional_index import PositionalIndex, encode_deltas, decode_deltas
+from client.client import framed_count, framed_positions, iter_positions
+from protocol import FrameError
+from server.server import client_conn
+
+
+def test_delta_encoding():
+    """
+    Test that the gaps are encoded as varints and decoded back, in full or in part.
+    """
+    numbers = [1, 2, 130, 20000, 20001, 3000000]
+    data = encode_deltas(numbers)
+    # one byte for the gaps 1, two for 128, three for 19870 and four for 2980000
+    assert len(data) == 1 + 1 + 2 + 3 + 1 + 4
+    assert decode_deltas(data, len(numbers)) == numbers
+    assert decode_deltas(data, 3) == numbers[:3]
+    assert decode_deltas(data, 100) == numbers
+
+
+def test_positional_index_counts_and_pages():
+    """
+    Test the counts and the pages of line numbers of unique, repeated and missing lines.
+    """
+    index = PositionalIndex(['a;\n', 'b;\n', ' a; \n', 'c;\n', 'a;\n', 'b;'])
+    assert (index.lines, len(index), index.repeated) == (6, 3, 2)
+    assert (index.count('a;'), index.count('b;'), index.count('c;')) == (3, 2, 1)
+    assert index.count('d;') == 0
+    assert index.page('a;', 0, 10) == (3, [1, 3, 5])
+    assert index.page('a;', 1, 1) == (3, [3])
+    assert index.page('a;', 3, 10) == (3, [])
+    assert index.page('c;', 0, 10) == (1, [4])
+    assert index.page('c;', 1, 10) == (1, [])
+    assert index.page('d;', 0, 10) == (0, [])
+
+
+def test_server_count_and_positions(tmp_path):
+    """
+    Test the COUNT and POSITIONS frames of a framed connection, and that the line numbers
+    of a common line are paginated.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('x;\ny;\nx;\nx;\nz;\nx;\nx;\n', encoding='utf-8')
+    client, server = socket.socketpair()
+    with patch('server.server.POSITIONAL_INDEX_ENABLED', True), \
+            patch('server.server.FILE_PATH', str(corpus)), \
+            patch('server.server.POSITIONAL', None), \
+            patch('server.server.POSITIONS_PAGE_SIZE', 2):
+        thread = threading.Thread(target=client_conn, args=(server, ('127.0.0.1', 0)))
+        thread.start()
+        with client:
+            assert framed_count(client, 'x;') == 5
+            assert framed_count(client, 'missing;') == 0
+            assert framed_positions(client, 'x;') == (5, [1, 3], True)
+            assert framed_positions(client, 'x;', 3, 10) == (5, [6, 7], False)
+            assert framed_positions(client, 'y;') == (1, [2], False)
+            assert framed_positions(client, 'missing;') == (0, [], False)
+            assert list(iter_positions(client, 'x;')) == [1, 3, 4, 6, 7]
+        thread.join(5)
+
+
+def test_server_positional_queries_disabled():
+    """
+    Test that the COUNT frames are answered with an error frame when the positional index
+    is disabled.
+    """
+    client, server = socket.socketpair()
+    with patch('server.server.POSITIONAL_INDEX_ENABLED', False):
+        thread = threading.Thread(target=client_conn, args=(server, ('127.0.0.1', 0)))
+        thread.start()
+        with client:
+            with pytest.raises(FrameError, match='disabled'):
+                framed_count(client, 'x;')
+        thread.join(5)
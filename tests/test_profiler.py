@@ -0,0 +1,103 @@
+"""
+This module implements tests for the on-demand profiler of the live server
+"""
+
+# for IO operations
+import os
+
+# the profiled handlers run concurrently
+import threading
+
+# the profiler failing to enable
+import cProfile
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from server.profiler import LiveProfiler
+
+
+def test_profiler_is_idle_by_default(tmp_path):
+    """
+    Test that the profiler does nothing until a window is started and that
+    the allocation tracking is a shared no-op context manager.
+    """
+    profiler = LiveProfiler(str(tmp_path))
+
+    assert profiler.active is False
+    assert profiler.track_allocations('index_build') is profiler.track_allocations('reread')
+    assert profiler.stop() == []
+    assert not os.listdir(tmp_path)
+
+
+def test_profiler_window_writes_profile_and_allocations(tmp_path):
+    """
+    Test that the calls handled during a window and the index builds are written
+    as a .prof file, a text summary and an allocation summary.
+    """
+    profiler = LiveProfiler(str(tmp_path))
+    assert profiler.start(60) is True
+    assert profiler.start(60) is False
+
+    handler = profiler.profiled(lambda values: sorted(values))
+    assert handler([3, 1, 2]) == [1, 2, 3]
+    with profiler.track_allocations('index_build'):
+        lines = {f'line{number}' for number in range(1000)}
+    assert len(lines) == 1000
+
+    written = profiler.stop()
+    assert profiler.active is False
+    names = sorted(os.path.basename(path) for path in written)
+    assert any(name.startswith('profile-') and name.endswith('.prof') for name in names)
+    assert any(name.startswith('profile-') and name.endswith('.txt') for name in names)
+    assert any(name.startswith('alloc-index_build-') for name in names)
+
+
+def test_profiled_handlers_run_when_the_profiler_can_not_be_enabled(tmp_path):
+    """
+    Test that concurrent handlers wrapped during a window all run to completion and are
+    merged, and that a handler still runs when its profiler can not be enabled.
+    """
+    profiler = LiveProfiler(str(tmp_path))
+    assert profiler.start(60) is True
+    results = []
+    handler = profiler.profiled(lambda number: results.append(sorted(range(number, 0, -1))))
+    threads = [threading.Thread(target=handler, args=(number,)) for number in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(results) == 4
+
+    class Busy(cProfile.Profile):
+        """A profiler that fails to enable, as when another profiler is active."""
+
+        def enable(self, *args, **kwargs):
+            raise ValueError('Another profiling tool is already active')
+
+    with patch('server.profiler.cProfile.Profile', Busy):
+        assert profiler.profiled(lambda: 'answered')() == 'answered'
+    assert any(path.endswith('.prof') for path in profiler.stop())
+
+
+
+def test_profiler_window_length_is_finite_and_capped(tmp_path):
+    """
+    Test that a window that is not a positive finite number of seconds is refused, and
+    that a longer window than the maximum is cut to it.
+    """
+    profiler = LiveProfiler(str(tmp_path), max_seconds=5)
+    for seconds in (float('inf'), float('nan'), 0, -1):
+        with pytest.raises(ValueError):
+            profiler.start(seconds)
+        assert profiler.active is False
+
+    assert profiler.start(1e12) is True
+    assert profiler._timer.interval == 5  # pylint: disable=protected-access
+    profiler.stop()
+    assert profiler.active is False
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,379 @@
+"""
+This module implements tests for the length-prefixed framing shared by the server and the client
+"""
+
+# socket pairs stand in for the client and server connections
+import socket
+
+# the server side of the socket pair runs on its own thread
+import threading
+
+# the slow search of the multiplexed requests
+import time
+
+# for replacing the corpus of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from protocol import (
+    HEADER,
+    MULTIPLEX_HEADER,
+    MAGIC,
+    QUERY,
+    BATCH,
+    RESPONSE,
+    ERROR,
+    NOT_FOUND_RESPONSE,
+    FrameError,
+    FrameReader,
+    encode_frame,
+    encode_batch,
+    decode_batch_results,
+    read_frame,
+    tag_frame
+)
+from client.client import framed_query, framed_batch, stream_queries, MultiplexedClient
+from server.server import client_conn
+import server.server
+
+
+def test_encode_frame_header():
+    """
+    Test that a frame is the header with the magic byte, version, type, flags and
+    payload length followed by the payload.
+    """
+    frame = encode_frame(QUERY, b'abc', flags=2)
+
+    assert frame[0] == MAGIC
+    assert HEADER.unpack(frame[:HEADER.size]) == (MAGIC, 1, QUERY, 2, 3)
+    assert frame[HEADER.size:] == b'abc'
+
+
+def test_reader_parses_many_frames_from_one_receive():
+    """
+    Test that several frames received at once are all parsed from the buffer
+    and that their payloads are views into it.
+    """
+    client, server = socket.socketpair()
+    with client, server:
+        client.sendall(encode_frame(QUERY, b'one') + encode_frame(BATCH, b'two\nthree'))
+        reader = FrameReader(server, buffer_size=1024)
+        reader.fill()
+
+        first = reader.next_frame()
+        second = reader.next_frame()
+
+        assert (first.kind, bytes(first.payload)) == (QUERY, b'one')
+        assert (second.kind, bytes(second.payload)) == (BATCH, b'two\nthree')
+        assert first.payload.obj is reader.buffer
+        assert reader.next_frame() is None
+        assert reader.buffered() == 0
+
+
+def test_reader_handles_segmented_frames():
+    """
+    Test that a frame split in arbitrary segments, including a split header,
+    is only returned once it is complete.
+    """
+    client, server = socket.socketpair()
+    with client, server:
+        data = encode_frame(QUERY, b'segmented query')
+        reader = FrameReader(server, buffer_size=64)
+        frames = []
+        for offset in range(0, len(data), 3):
+            client.sendall(data[offset:offset + 3])
+            reader.fill(3)
+            frame = reader.next_frame()
+            if frame is not None:
+                frames.append(bytes(frame.payload))
+
+        assert frames == [b'segmented query']
+
+
+def test_reader_grows_for_large_frames():
+    """
+    Test that a frame larger than the receive buffer is received by growing the buffer,
+    and that frames over the maximum frame size are rejected.
+    """
+    client, server = socket.socketpair()
+    with client, server:
+        payload = bytes(range(256)) * 1024
+        sender = threading.Thread(target=client.sendall, args=(encode_frame(BATCH, payload),))
+        sender.start()
+        reader = FrameReader(server, buffer_size=1024)
+        frame = None
+        while frame is None:
+            assert reader.fill() > 0
+            frame = reader.next_frame()
+        sender.join()
+
+        assert bytes(frame.payload) == payload
+
+        client.sendall(HEADER.pack(MAGIC, 1, QUERY, 0, 1 << 30))
+        reader.fill()
+        with pytest.raises(FrameError):
+            reader.next_frame()
+
+
+def test_reader_grows_with_the_received_bytes():
+    """
+    Test that a header announcing a large frame does not allocate the frame up front,
+    the buffer grows with the bytes received and at most doubles each time.
+    """
+    client, server = socket.socketpair()
+    with client, server:
+        payload = bytes(range(256)) * 4096
+        data = encode_frame(BATCH, payload)
+        reader = FrameReader(server, buffer_size=1024)
+        client.sendall(data[:HEADER.size + 10])
+        reader.fill()
+        assert reader.next_frame() is None
+        assert len(reader.buffer) == 1024
+
+        sender = threading.Thread(target=client.sendall, args=(data[HEADER.size + 10:],))
+        sender.start()
+        frame = None
+        while frame is None:
+            received = reader.buffered()
+            assert reader.fill() > 0
+            assert len(reader.buffer) <= max(1024, 2 * received)
+            frame = reader.next_frame()
+        sender.join()
+
+        assert bytes(frame.payload) == payload
+        assert len(reader.buffer) == len(data)
+
+
+def test_reader_rejects_invalid_magic():
+    """
+    Test that bytes which do not start with the magic byte are not parsed as a frame.
+    """
+    client, server = socket.socketpair()
+    with client, server:
+        client.sendall(b'not a frame at all')
+        reader = FrameReader(server)
+        reader.fill()
+        with pytest.raises(FrameError):
+            reader.next_frame()
+
+
+def test_batch_encoding_round_trip():
+    """
+    Test the encoding of the batch queries and the decoding of the batch results.
+    """
+    assert encode_batch(['a', 'b;c']) == b'a\nb;c'
+    assert decode_batch_results(memoryview(b'101')) == [True, False, True]
+
+
+def serve(connection: socket.socket):
+    """
+    Serve a single connection of a socket pair with the server over a fixed corpus.
+    """
+    thread = threading.Thread(target=client_conn, args=(connection, ('127.0.0.1', 0)))
+    thread.start()
+    return thread
+
+
+@patch('server.server.REREAD_ON_QUERY', False)
+@patch('server.server.ALL_LINES', {'alpha;1;', 'beta;2;'})
+def test_server_answers_framed_and_legacy_connections():
+    """
+    Test that the server keeps a framed connection open for several query and batch frames,
+    answers unknown frame types with an error frame, and still serves the legacy format.
+    """
+    client, server = socket.socketpair()
+    thread = serve(server)
+    with client:
+        assert framed_query(client, 'alpha;1;') is True
+        assert framed_query(client, 'missing') is False
+        assert framed_batch(client, ['beta;2;', 'gamma', 'alpha;1;']) == [True, False, True]
+
+        client.sendall(encode_frame(0x33, b''))
+        assert read_frame(client).kind == ERROR
+    thread.join(5)
+    assert not thread.is_alive()
+
+    client, server = socket.socketpair()
+    thread = serve(server)
+    with client:
+        client.sendall(b'beta;2;\x00\x00')
+        assert client.recv(1024) == b'STRING EXISTS\n'
+    thread.join(5)
+
+    client, server = socket.socketpair()
+    thread = serve(server)
+    with client:
+        # a query larger than MAX_PAYLOAD_SIZE of the legacy format
+        client.sendall(encode_frame(QUERY, b'x' * 5000))
+        response = read_frame(client)
+        assert response.kind == QUERY | RESPONSE
+        assert bytes(response.payload) == NOT_FOUND_RESPONSE
+    thread.join(5)
+
+
+@patch('server.server.REREAD_ON_QUERY', False)
+@patch('server.server.ALL_LINES', {f'line;{number};' for number in range(0, 10000, 2)})
+def test_server_streams_query_chunks():
+    """
+    Test that a query stream larger than the window is answered chunk by chunk, in order,
+    and that the connection can be reused for a second stream.
+    """
+    client, server = socket.socketpair()
+    thread = serve(server)
+    with client:
+        queries = [f'line;{number};' for number in range(10000)]
+        results = list(stream_queries(client, queries, chunk_queries=100, window=4))
+        assert results == [number % 2 == 0 for number in range(10000)]
+
+        assert list(stream_queries(client, ['line;2;', 'line;3;'])) == [True, False]
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+@patch('server.server.REREAD_ON_QUERY', False)
+@patch('server.server.ALL_LINES', {f'{number};' for number in range(0, 400000, 3)})
+def test_stream_of_large_chunks_does_not_deadlock():
+    """
+    Test that a stream whose chunks have more results than the socket buffers hold is
+    answered in full, the client reading the results before both sides block sending.
+    """
+    client, server = socket.socketpair()
+    for sock in (client, server):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16 * 1024)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024)
+    thread = serve(server)
+    results = []
+    with client:
+        queries = [f'{number};' for number in range(400000)]
+        streaming = threading.Thread(target=lambda: results.extend(
+            stream_queries(client, queries, chunk_queries=50000, window=8)))
+        streaming.start()
+        streaming.join(60)
+        if streaming.is_alive():
+            client.shutdown(socket.SHUT_RDWR)
+            streaming.join(5)
+        assert results == [number % 3 == 0 for number in range(400000)]
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_multiplexed_frames():
+    """
+    Test that the multiplexed frames carry their request ID, are parsed next to version 1
+    frames, and that a response is tagged with the ID of its request.
+    """
+    frame = encode_frame(QUERY, b'abc', 1, request_id=7)
+    assert MULTIPLEX_HEADER.unpack(frame[:MULTIPLEX_HEADER.size]) == (MAGIC, 2, QUERY, 1, 7, 3)
+    assert tag_frame(encode_frame(QUERY | RESPONSE, b'abc', 1), 7) == \
+        encode_frame(QUERY | RESPONSE, b'abc', 1, 7)
+    assert tag_frame(encode_frame(ERROR, b'x'), None) == encode_frame(ERROR, b'x')
+
+    client, server = socket.socketpair()
+    with client, server:
+        data = encode_frame(BATCH, b'one', request_id=0xFFFFFFFF) + encode_frame(QUERY, b'two')
+        reader = FrameReader(server, buffer_size=64)
+        frames = []
+        for offset in range(0, len(data), 5):
+            client.sendall(data[offset:offset + 5])
+            reader.fill(5)
+            while (frame := reader.next_frame()) is not None:
+                frames.append((frame.kind, bytes(frame.payload), frame.request_id))
+        assert frames == [(BATCH, b'one', 0xFFFFFFFF), (QUERY, b'two', None)]
+
+        client.sendall(encode_frame(QUERY | RESPONSE, b'found', request_id=3))
+        response = read_frame(server)
+        assert (response.kind, bytes(response.payload), response.request_id) == \
+            (QUERY | RESPONSE, b'found', 3)
+
+
+@patch('server.server.REREAD_ON_QUERY', False)
+@patch('server.server.ALL_LINES', {'alpha;1;', 'beta;2;'})
+def test_server_answers_multiplexed_requests_out_of_order():
+    """
+    Test that a slow multiplexed request does not hold back the requests sent after it,
+    that every response carries the ID of its request, and that the requests in flight
+    are answered before the connection ends.
+    """
+    search = server.server.searching_string
+
+    def slow_search(path, query, *args, **kwargs):
+        if query == 'slow;':
+            time.sleep(0.3)
+        return search(path, query, *args, **kwargs)
+
+    with patch('server.server.searching_string', slow_search):
+        client, server_sock = socket.socketpair()
+        thread = serve(server_sock)
+        with client:
+            client.sendall(encode_frame(QUERY, b'slow;', request_id=1)
+                           + encode_frame(QUERY, b'alpha;1;', request_id=2)
+                           + encode_frame(BATCH, b'beta;2;\nslow', request_id=3))
+            responses = [read_frame(client) for _ in range(3)]
+            assert [response.request_id for response in responses][-1] == 1
+            assert {response.request_id: bytes(response.payload) for response in responses} == \
+                {1: NOT_FOUND_RESPONSE, 2: b'STRING EXISTS\n', 3: b'10'}
+
+            client.sendall(encode_frame(QUERY, b'slow;', request_id=4))
+            client.shutdown(socket.SHUT_WR)
+            assert read_frame(client).request_id == 4
+        thread.join(5)
+        assert not thread.is_alive()
+
+
+@patch('server.server.REREAD_ON_QUERY', False)
+@patch('server.server.ALL_LINES', {'alpha;1;', 'beta;2;'})
+@patch('server.server.WRITE_TIMEOUT', 1.0)
+def test_client_not_reading_does_not_hold_the_workers():
+    """
+    Test that a multiplexed client that never reads its responses does not hold the shared
+    workers: another multiplexed connection is still answered, and the connection that does
+    not read is shut down by the write deadline and its thread ends.
+    """
+    stalled, stalled_server = socket.socketpair()
+    stalled_server.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    stalled_thread = serve(stalled_server)
+    batch = encode_batch(['alpha;1;'] * 20000)
+    requests = b''.join(encode_frame(BATCH, batch, request_id=number) for number in range(32))
+    threading.Thread(target=stalled.sendall, args=(requests,), daemon=True).start()
+    with stalled:
+        # the responses of the stalled connection fill its send buffer
+        time.sleep(0.3)
+        client, server_sock = socket.socketpair()
+        thread = serve(server_sock)
+        with client:
+            client.settimeout(0.5)
+            client.sendall(encode_frame(QUERY, b'alpha;1;', request_id=7))
+            response = read_frame(client)
+            assert (response.request_id, bytes(response.payload)) == (7, b'STRING EXISTS\n')
+        thread.join(5)
+        assert not thread.is_alive()
+
+        stalled_thread.join(5)
+        assert not stalled_thread.is_alive()
+
+
+@patch('server.server.REREAD_ON_QUERY', False)
+@patch('server.server.ALL_LINES', {f'line;{number};' for number in range(100)})
+def test_multiplexed_client():
+    """
+    Test that the futures of the multiplexed client resolve to the results of their
+    requests, that the errors fail only their request, and that closing the client fails
+    the requests in flight.
+    """
+    client, server_sock = socket.socketpair()
+    thread = serve(server_sock)
+    with client, MultiplexedClient(client) as multiplexed:
+        queries = [multiplexed.query(f'line;{number};') for number in range(0, 200, 10)]
+        batch = multiplexed.batch(['line;1;', 'line;100;'])
+        unknown = multiplexed.submit(0x33, b'')
+        assert [future.result(5) for future in queries] == [number < 100
+                                                            for number in range(0, 200, 10)]
+        assert batch.result(5) == [True, False]
+        with pytest.raises(FrameError):
+            unknown.result(5)
+        assert multiplexed.query('line;5;').result(5) is True
+    thread.join(5)
+    with pytest.raises(ConnectionError):
+        multiplexed.query('line;5;')
@@ -0,0 +1,94 @@
+"""
+This module implements tests for the structured request logger used by the server
+"""
+
+# in memory stream standing in for standard output
+import io
+
+# json module for reading back the written records
+import json
+
+# event used to hold the writer thread
+import threading
+
+# main testing module used
+import pytest
+
+from server.request_log import RequestLogger, parse_level, DEBUG, INFO, ERROR, OFF
+
+
+def test_parse_level():
+    """
+    Test that the level names from config.ini are converted to numeric levels
+    and that unknown or empty names fall back to INFO.
+    """
+    assert parse_level('debug') == DEBUG
+    assert parse_level(' ERROR ') == ERROR
+    assert parse_level('OFF') == OFF
+    assert parse_level('verbose') == INFO
+    assert parse_level(None) == INFO
+
+
+def test_request_log_writes_json_lines():
+    """
+    Test that a queued record is written by the writer thread as a single JSON line
+    containing the formatted timestamp, the level, the event and the fields.
+    """
+    stream = io.StringIO()
+    logger = RequestLogger(INFO, 1.0, 100, stream)
+
+    assert logger.info('request', query='line1', found=True) is True
+    assert logger.flush() is True
+
+    record = json.loads(stream.getvalue().splitlines()[0])
+    assert record['level'] == 'INFO'
+    assert record['event'] == 'request'
+    assert record['query'] == 'line1'
+    assert record['found'] is True
+    assert record['timestamp']
+
+
+def test_request_log_level_and_sampling():
+    """
+    Test that records below the configured level are skipped, that sampling never
+    drops errors and that a zero sample rate drops all the INFO records.
+    """
+    stream = io.StringIO()
+    logger = RequestLogger(INFO, 0.0, 100, stream)
+
+    assert logger.is_enabled(DEBUG) is False
+    assert logger.debug('search') is False
+    assert logger.info('request') is False
+    assert logger.error('request_error') is True
+    assert logger.flush() is True
+    assert len(stream.getvalue().splitlines()) == 1
+
+
+def test_request_log_drops_when_queue_is_full():
+    """
+    Test that the logger never blocks when the queue is full and counts the dropped records.
+    """
+
+    class BlockedStream(io.StringIO):
+        """Stream whose writes block until released, keeping the queue full."""
+
+        def __init__(self):
+            super().__init__()
+            self.release = threading.Event()
+
+        def write(self, text):
+            self.release.wait(5)
+            return super().write(text)
+
+    stream = BlockedStream()
+    logger = RequestLogger(INFO, 1.0, 1, stream)
+    results = [logger.info('request', number=number) for number in range(10)]
+    stream.release.set()
+
+    assert logger.dropped > 0
+    assert results.count(False) == logger.dropped
+    assert logger.flush() is True
+
+
+if __name__ == "__main__":
+    pytest.main()
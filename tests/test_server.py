@@ -9,10 +9,16 @@ import threading
 from unittest.mock import patch, MagicMock, mock_open
 # for ssl support and testing
 import ssl
+# for the file mode of the unix domain socket
+import os
 
 # Allow some time for the server to start
 import time
 
+# for requesting the readiness probe over HTTP
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
 # main testing module used
 import pytest
 
@@ -24,6 +30,20 @@ from server.server import client_conn
 from server.server import retrieve_all_file_lines
 from server.server import searching_string
 from server.server import create_ssl_connection_context
+from server.server import warm_up
+from server.server import readiness_probe
+from server.server import SERVER_READY
+from server.server import accept_connections
+from server.server import create_unix_listener
+from server.server import PROBE_ROUTES
+from server.server import ADMIN_ROUTES
+from server.server import ADMIN_LOCAL_ROUTES
+from server.server import admin_profile
+from server.server import admin_profile_stop
+from server.profiler import LiveProfiler
+from server.metrics import start_metrics_server
+import server.server
+from client.client import open_connection, framed_query
 
 
 def test_create_ssl_connection_context_success():
@@ -180,6 +200,134 @@ def test_search_string_present():
         assert result is False
 
 
+def test_search_string_phase_timings():
+    """
+    Test function to verify that searching_string reports the duration of the
+    corpus load and of the search algorithm when a phases dictionary is given.
+
+    Parameters:
+    None
+
+    Returns:
+    None
+    """
+    mock_file_content = ["line1\n", "line2\n"]
+    phases = {}
+    with patch('server.server.retrieve_all_file_lines', return_value=mock_file_content):
+        result = searching_string('dummy_filepath', 'line2', True, algorithms['linear'], phases)
+    assert result is True
+    assert set(phases) == {'load', 'search'}
+    assert all(duration >= 0 for duration in phases.values())
+
+
+def test_warm_up_loads_the_corpus_and_marks_the_server_ready(monkeypatch):
+    """
+    Test function to verify that warm_up loads the corpus, runs the warmup
+    queries against it and marks the server as ready for the readiness probe.
+
+    Parameters:
+    monkeypatch: pytest fixture used to reset the global state of the server.
+
+    Returns:
+    None
+    """
+    monkeypatch.setattr(server.server, 'ALL_LINES', None)
+    monkeypatch.setattr(server.server, 'REREAD_ON_QUERY', False)
+    SERVER_READY.clear()
+    assert readiness_probe({})[0] == 503
+
+    mock_file_content = ["line1\n", "line2\n", "line3\n"]
+    with patch('server.server.retrieve_all_file_lines',
+               return_value=mock_file_content) as mock_retrieve:
+        warm_up('dummy_filepath', 10)
+        # the corpus is read once, the warmup queries use the loaded index
+        mock_retrieve.assert_called_once_with('dummy_filepath')
+
+    assert server.server.ALL_LINES == {"line1", "line2", "line3"}
+    assert SERVER_READY.is_set()
+    assert readiness_probe({}) == (200, 'ready\n')
+
+
+def test_readiness_probe_is_served_without_metrics():
+    """
+    Test function to verify that the listener started without a registry, as it is when
+    METRICS_ENABLED=False, answers the readiness probe and nothing else.
+
+    Returns:
+    None
+    """
+    http_server = start_metrics_server(0, None, host='127.0.0.1', routes=PROBE_ROUTES)
+    port = http_server.server_address[1]
+    try:
+        SERVER_READY.clear()
+        with pytest.raises(HTTPError) as not_ready:
+            urlopen(f'http://127.0.0.1:{port}/ready')
+        assert not_ready.value.code == 503
+
+        SERVER_READY.set()
+        with urlopen(f'http://127.0.0.1:{port}/ready') as response:
+            assert response.status == 200 and response.read() == b'ready\n'
+        for path in ('/metrics', '/admin/stats'):
+            with pytest.raises(HTTPError) as missing:
+                urlopen(f'http://127.0.0.1:{port}{path}')
+            assert missing.value.code == 404
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+
+
+def test_admin_profile_window_is_bounded_and_stoppable(tmp_path):
+    """
+    Test function to verify that the admin command refuses a window that would never end,
+    cuts a long window to the maximum and that a running window can be stopped.
+
+    Parameters:
+    tmp_path: pytest fixture giving the directory the profiles are written to.
+
+    Returns:
+    None
+    """
+    with patch('server.server.PROFILER', LiveProfiler(str(tmp_path), 5)) as profiler, \
+            patch('server.server.PROFILE_MAX_WINDOW_SECONDS', 5):
+        for seconds in ('inf', 'nan', '0', 'soon'):
+            assert admin_profile({'seconds': seconds})[0] == 400
+        assert admin_profile_stop({})[0] == 409
+
+        status, text = admin_profile({'seconds': '1e12'})
+        assert status == 200 and 'for 5 seconds' in text
+        assert profiler.active is True
+
+        assert admin_profile_stop({})[0] == 200
+        assert profiler.active is False
+
+
+def test_admin_commands_are_only_answered_locally():
+    """
+    Test function to verify that the admin commands are answered to the clients on the same
+    host and refused with 403 to the other clients, while the readiness probe is not.
+
+    Returns:
+    None
+    """
+    assert ADMIN_LOCAL_ROUTES == {'/admin/profile', '/admin/profile/stop', '/admin/stats'}
+    http_server = start_metrics_server(0, None, host='127.0.0.1', routes=ADMIN_ROUTES,
+                                       local_routes=ADMIN_LOCAL_ROUTES)
+    port = http_server.server_address[1]
+    try:
+        SERVER_READY.set()
+        with urlopen(f'http://127.0.0.1:{port}/admin/stats') as response:
+            assert response.status == 200
+        with patch('server.metrics.is_local_client', return_value=False):
+            with pytest.raises(HTTPError) as refused:
+                urlopen(f'http://127.0.0.1:{port}/admin/profile?seconds=1')
+            assert refused.value.code == 403
+            with urlopen(f'http://127.0.0.1:{port}/ready') as response:
+                assert response.status == 200
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+
+
 def test_client_connection_handling():
     """
     Test function for client_connection_handling function.
@@ -241,7 +389,9 @@ def test_server_configuration():
     mock_client_socket = MagicMock()
     mock_address = ('127.0.0.1', 12345)
 
-    with patch('socket.socket', return_value=mock_socket):
+    # the readiness probe listener binds its own socket, only the search listener is checked
+    with patch('socket.socket', return_value=mock_socket), \
+            patch('server.server.READY_PROBE_ENABLED', False):
         # Set up the socket method mocks
         mock_socket.accept.return_value = (mock_client_socket, mock_address)
 
@@ -258,5 +408,31 @@ def test_server_configuration():
         mock_socket.accept.assert_called()
 
 
+@patch('server.server.REREAD_ON_QUERY', False)
+@patch('server.server.ALL_LINES', {'13;0;23;11;0;16;5;000;'})
+def test_unix_socket_listener(tmp_path):
+    """
+    Test that the unix domain socket listener is created with the configured file mode,
+    replaces a stale socket file and serves the same protocol as the TCP listener.
+    """
+    path = str(tmp_path / 'search.sock')
+    create_unix_listener(path).close()
+    listener = create_unix_listener(path, 0o600)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    threading.Thread(target=accept_connections, args=(listener, False, False),
+                     daemon=True).start()
+    with open_connection('', 0, unix_path=path) as sock:
+        assert framed_query(sock, '13;0;23;11;0;16;5;000;') is True
+        assert framed_query(sock, 'missing') is False
+    with open_connection('', 0, unix_path=path) as sock:
+        sock.sendall(b'13;0;23;11;0;16;5;000;')
+        assert sock.recv(1024) == b'STRING EXISTS\n'
+
+    (tmp_path / 'regular').write_text('data')
+    with pytest.raises(FileExistsError):
+        create_unix_listener(str(tmp_path / 'regular'))
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,130 @@
+"""
+This module implements tests for the shared memory corpus index
+"""
+
+# for following the published index from the server
+from unittest.mock import patch
+
+# the index is published while a worker waits for it
+import threading
+
+# main testing module used
+import pytest
+
+from server.shared_index import (
+    SharedIndex,
+    SharedIndexReader,
+    IndexNotPublished,
+    publish,
+    read_pointer
+)
+from protocol import QUERY, ERROR, Frame, encode_frame
+from server.server import searching_string, search_batch
+from search_algorithms import linear_search
+import server.server
+
+
+def test_build_and_attach_index():
+    """
+    Test that an index built into a shared memory segment can be attached by name,
+    holds the unique stripped lines and answers exact matches only.
+    """
+    lines = [f'{number};0;1;\n' for number in range(5000)] + ['0;0;1;\n', '\n']
+    index = SharedIndex.build(lines)
+    try:
+        attached = SharedIndex.attach(index.name)
+
+        assert len(attached) == 5001
+        assert '42;0;1;' in attached
+        assert '' in attached
+        assert '42;0;1' not in attached
+        assert '5000;0;1;' not in attached
+        assert 'ünïcode' not in attached
+        attached.close()
+    finally:
+        index.close()
+        index.unlink()
+
+
+def test_publish_retires_the_previous_generation(tmp_path):
+    """
+    Test that publishing a new generation updates the pointer file, that the readers
+    follow it and that the previous segment is unlinked while the readers still mapping
+    it keep answering from it.
+    """
+    pointer = str(tmp_path / 'index.json')
+    reader = SharedIndexReader(pointer, check_interval=0)
+    assert reader.current() is None
+
+    first = publish(['a;\n', 'b;\n'], pointer)
+    old = reader.current()
+    assert old.generation == 1 and 'a;' in old
+
+    second = publish(['c;\n'], pointer)
+    try:
+        assert read_pointer(pointer)['generation'] == 2
+        new = reader.current()
+        assert new.generation == 2
+        assert 'c;' in new and 'a;' not in new
+        # the retired segment is gone but the existing mapping still works
+        assert 'a;' in old
+        with pytest.raises(FileNotFoundError):
+            SharedIndex.attach(first.name)
+    finally:
+        for index in (first, old, new):
+            index.close()
+        second.close()
+        second.unlink()
+
+
+def test_server_answers_from_the_shared_index(tmp_path):
+    """
+    Test that a server following a published index answers the queries and batches
+    from it without loading the corpus itself.
+    """
+    pointer = str(tmp_path / 'index.json')
+    index = publish(['shared;1;\n', 'shared;2;\n'], pointer)
+    try:
+        with patch('server.server.SHARED_INDEX', SharedIndexReader(pointer, 0)), \
+                patch('server.server.ALL_LINES', None):
+            assert searching_string('missing.txt', 'shared;1;', False, linear_search) is True
+            assert searching_string('missing.txt', 'shared;3;', False, linear_search) is False
+            assert search_batch(['shared;2;', 'x', 'shared;1;'], False) == b'101'
+            assert server.server.ALL_LINES is None
+    finally:
+        index.close()
+        index.unlink()
+
+
+def test_worker_started_before_the_index_is_published(tmp_path):
+    """
+    Test that a worker started before the loader publishes the index never loads its own
+    copy of the corpus: a query fails once the wait ends, and a query waiting while the
+    index is published is answered from it.
+    """
+    pointer = str(tmp_path / 'index.json')
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('shared;1;\n', encoding='utf-8')
+    with patch('server.server.SHARED_INDEX', SharedIndexReader(pointer, 60)), \
+            patch('server.server.SHARED_INDEX_WAIT', 0.1), \
+            patch('server.server.ALL_LINES', None):
+        with pytest.raises(IndexNotPublished):
+            searching_string(str(corpus), 'shared;1;', False, linear_search)
+        response = server.server.handle_frame(
+            Frame(QUERY, 0, memoryview(b'shared;1;')), ('127.0.0.1', 0), 0, {})
+        assert response == encode_frame(ERROR, b'the shared index is not published yet')
+        assert server.server.ALL_LINES is None
+
+        timer = threading.Timer(0.2, lambda: published.append(
+            publish(['shared;1;\n'], pointer)))
+        published = []
+        timer.start()
+        try:
+            with patch('server.server.SHARED_INDEX_WAIT', 5):
+                assert searching_string(str(corpus), 'shared;1;', False, linear_search) is True
+            assert server.server.ALL_LINES is None
+        finally:
+            timer.join()
+            for index in published:
+                index.close()
+                index.unlink()
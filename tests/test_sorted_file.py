@@ -0,0 +1,97 @@
+"""
+This module implements tests for the out-of-core sorted file index
+"""
+
+# for patching the index of the server
+from unittest.mock import patch
+
+# main testing module used
+import pytest
+
+from server.sorted_file import SortedFile, build, index_path
+from server.normalization import build_normalizer
+from search_algorithms import linear_search
+import server.server
+
+
+def test_build_sorts_and_deduplicates(tmp_path):
+    """
+    Test that the external sort merges several runs into the sorted unique lines, and that
+    the index holds the offset of every stride-th line.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    lines = [f'line;{number % 300};' for number in range(1000)] + [' Café;1; ', 'b', '']
+    corpus.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    sorted_path = str(tmp_path / 'corpus.sorted')
+
+    assert build(str(corpus), sorted_path, stride=16, run_lines=64) == 303
+    data = (tmp_path / 'corpus.sorted').read_bytes()
+    expected = sorted({line.strip().encode('utf-8') for line in lines})
+    assert data == b''.join(line + b'\n' for line in expected)
+
+    index = SortedFile(sorted_path)
+    assert (len(index), index.stride, len(index.offsets)) == (303, 16, 19)
+    assert [index.line_at(offset) for offset in index.offsets] == expected[::16]
+    index.close()
+
+
+def test_sorted_file_lookups(tmp_path):
+    """
+    Test that every line is found, including the first and the last one and the lines at
+    the offsets of the index, and that the missing lines are not.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    lines = [f'{number * 7919 % 10007};{number % 13};' for number in range(5000)]
+    corpus.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    sorted_path = str(tmp_path / 'corpus.sorted')
+    build(str(corpus), sorted_path, stride=32, run_lines=1000)
+
+    index = SortedFile(sorted_path)
+    assert all(line in index for line in lines)
+    assert all(line.encode('utf-8') in index for line in lines[:100])
+    for missing in ('', '0', '!', '~', f'{lines[0]}x', lines[1][:-1], f'{lines[2]}\n{lines[3]}'):
+        assert missing not in index
+    index.close()
+
+
+def test_sorted_file_edge_cases(tmp_path):
+    """
+    Test an empty corpus, a normalized corpus and a sorted file that does not match its index.
+    """
+    empty = tmp_path / 'empty.txt'
+    empty.write_text('', encoding='utf-8')
+    build(str(empty), str(tmp_path / 'empty.sorted'))
+    index = SortedFile(str(tmp_path / 'empty.sorted'))
+    assert len(index) == 0 and 'a' not in index
+
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('Hello  World\n', encoding='utf-8')
+    sorted_path = str(tmp_path / 'corpus.sorted')
+    build(str(corpus), sorted_path, normalize=build_normalizer('casefold,whitespace'))
+    assert 'hello world' in SortedFile(sorted_path)
+
+    (tmp_path / 'corpus.sorted').write_bytes(b'changed\n')
+    with pytest.raises(ValueError):
+        SortedFile(sorted_path)
+    (tmp_path / index_path('corpus.sorted')).write_bytes(b'nothing')
+    with pytest.raises(ValueError):
+        SortedFile(sorted_path)
+
+
+def test_server_sorted_file(tmp_path):
+    """
+    Test that the server answers the queries and the batches from the sorted file without
+    loading the corpus.
+    """
+    corpus = tmp_path / 'corpus.txt'
+    corpus.write_text('alpha;1;\nbeta;2;\n', encoding='utf-8')
+    sorted_path = str(tmp_path / 'corpus.sorted')
+    build(str(corpus), sorted_path)
+    with patch('server.server.SORTED_INDEX', SortedFile(sorted_path)), \
+            patch('server.server.ALL_LINES', None), \
+            patch('server.server.retrieve_all_file_lines') as load:
+        assert server.server.searching_string(str(corpus), 'beta;2;', False,
+                                              linear_search) is True
+        assert server.server.search_batch(['alpha;1;', 'gamma;3;', 'beta;2;'], False) == b'101'
+        assert server.server.ALL_LINES is None
+        load.assert_not_called()